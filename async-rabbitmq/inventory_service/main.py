@@ -1,5 +1,6 @@
 import asyncio
-import json
+import os
+import signal
 from datetime import datetime, timezone
 
 import aio_pika
@@ -11,9 +12,22 @@ from common.rabbit import (
     INV_RESERVED_RK,
     INV_FAILED_RK,
 )
+from common.idempotency import store_from_env
+from common.serialization import decode_event, serializer_from_env
+from common.stock_ledger import StockLedger, parse_initial_stock
 
-# In-memory idempotency for lab (prevents double reserve on duplicate delivery)
-processed_orders: set[str] = set()
+# Bounded idempotency store (prevents double reserve on duplicate delivery);
+# survives restarts when IDEMPOTENCY_LOG_PATH points at a persistent volume
+processed_orders = store_from_env()
+
+# EVENT_FORMAT=json|struct for published events; incoming events are auto-detected
+serializer = serializer_from_env()
+
+# Shared stock ledger; unknown SKUs start with INVENTORY_DEFAULT_STOCK units
+ledger = StockLedger(
+    initial_stock=parse_initial_stock(os.getenv("INVENTORY_INITIAL_STOCK", "")),
+    default_available=int(os.getenv("INVENTORY_DEFAULT_STOCK", "1000")),
+)
 
 def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
@@ -42,11 +56,11 @@ async def main():
 
     async def handle_message(message: aio_pika.IncomingMessage):
         async with message.process(requeue=False):
-            # Parse JSON
+            # Parse event (JSON or struct, detected from content_type / magic byte)
             try:
-                payload = json.loads(message.body.decode())
-            except Exception as e:
-                print(f"[inventory] malformed JSON -> reject: {e}")
+                payload = decode_event(message.body, message.content_type)
+            except ValueError as e:
+                print(f"[inventory] malformed event -> reject: {e}")
                 await message.reject(requeue=False)
                 return
 
@@ -64,19 +78,26 @@ async def main():
                 return
             processed_orders.add(order_id)
 
-            # ---- Fake reservation logic (replace later if needed) ----
+            # ---- Reserve all items atomically in the stock ledger ----
             items = payload.get("items", [])
-            fail = any((item.get("qty", 0) > 5) for item in items)  # example fail rule
+            try:
+                result = ledger.reserve(order_id, items)
+            except (TypeError, ValueError) as e:
+                print(f"[inventory] invalid items -> reject: {e}")
+                processed_orders.discard(order_id)
+                await message.reject(requeue=False)
+                return
 
-            if fail:
+            if not result.ok:
                 event = {
                     "event_type": "InventoryFailed",
                     "order_id": order_id,
-                    "reason": "qty_too_high",
+                    "reason": "insufficient_stock",
+                    "shortages": result.shortages,
                     "ts": now_iso(),
                 }
                 rk = INV_FAILED_RK
-                print(f"[inventory] reservation FAILED for {order_id}")
+                print(f"[inventory] reservation FAILED for {order_id}: short {result.shortages}")
             else:
                 event = {
                     "event_type": "InventoryReserved",
@@ -88,8 +109,8 @@ async def main():
 
             # Publish Inventory event
             out_msg = aio_pika.Message(
-                body=json.dumps(event).encode(),
-                content_type="application/json",
+                body=serializer.encode(event),
+                content_type=serializer.content_type,
                 delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
             )
             await inventory_exchange.publish(out_msg, routing_key=rk)
@@ -99,8 +120,17 @@ async def main():
     await order_queue.consume(handle_message)
     print("[inventory] consuming OrderPlaced...")
 
-    # Keep alive
-    await asyncio.Future()
+    # Keep alive until SIGTERM/SIGINT, then close the idempotency store so its
+    # log is flushed and the pre-filter snapshotted for the next start
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    print("[inventory] shutting down")
+    await conn.close()
+    processed_orders.close()
+    print(f"[inventory] idempotency store stats: {processed_orders.stats()}")
 
 if __name__ == "__main__":
     asyncio.run(main())
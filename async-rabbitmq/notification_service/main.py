@@ -1,7 +1,7 @@
 import asyncio
-import json
 import aio_pika
 from common.rabbit import AMQP_URL, setup_inventory_topology
+from common.serialization import decode_event
 
 async def connect_with_retry(amqp_url: str, retries: int = 60, delay: float = 1.0):
     last_exc = None
@@ -16,7 +16,7 @@ async def connect_with_retry(amqp_url: str, retries: int = 60, delay: float = 1.
 
 async def handle(msg: aio_pika.IncomingMessage):
     async with msg.process(requeue=False):
-        body = json.loads(msg.body.decode())
+        body = decode_event(msg.body, msg.content_type)
         if body.get("event_type") == "InventoryReserved":
             print(f"[notify] Order confirmed: {body.get('order_id')}")
         else:
@@ -0,0 +1,135 @@
+# async-rabbitmq/order_service/channel_pool.py
+"""
+Pool of publishing channels for the order service, kept apart from the
+channel that consumes inventory events.
+
+RabbitMQ handles each channel in a single broker process, so a channel's
+publishes (and their confirms) are serialised on the broker side. The pool
+opens `size` confirm-mode channels on the shared connection. Each publish
+goes to the open channel with the fewest unconfirmed messages.
+
+Health: a channel that is closed (for example by a channel-level error from
+the broker) is taken out of rotation and re-opened in the background. A
+check every `check_interval` seconds also re-opens channels that closed
+between publishes. When no channel is open, publish raises
+ChannelInvalidStateError.
+
+The pool has the exchange's publish() signature, so ConfirmPublisher uses it
+like a single exchange:
+
+    pool = ChannelPool(conn, 4, setup=lambda ch: ch.declare_exchange(ORDERS_EX, ...))
+    await pool.open()
+    publisher = ConfirmPublisher(pool)
+"""
+import asyncio
+
+from aio_pika.exceptions import AMQPError, ChannelInvalidStateError
+
+
+class _Slot:
+    def __init__(self, index: int):
+        self.index = index
+        self.channel = None
+        self.exchange = None
+        self.in_flight = 0
+        self.published = 0
+        self.reopened = 0
+        self.reopening = None   # asyncio.Task while a re-open is running
+
+    @property
+    def healthy(self) -> bool:
+        return self.channel is not None and not self.channel.is_closed and self.reopening is None
+
+
+class ChannelPool:
+    def __init__(self, connection, size: int = 4, setup=None, check_interval: float = 5.0):
+        if size < 1:
+            raise ValueError("channel pool size must be at least 1")
+        self.connection = connection
+        self.size = size
+        self.setup = setup              # async (channel) -> exchange to publish to
+        self.check_interval = check_interval
+        self.slots = [_Slot(i) for i in range(size)]
+        self.channel_errors = 0
+        self._checker = None
+
+    async def open(self):
+        for slot in self.slots:
+            await self._open(slot)
+        self._checker = asyncio.get_running_loop().create_task(self._check_loop())
+
+    async def _open(self, slot: _Slot):
+        channel = await self.connection.channel(publisher_confirms=True)
+        slot.exchange = await self.setup(channel)
+        slot.channel = channel
+
+    def _reopen(self, slot: _Slot):
+        if slot.reopening is not None:
+            return
+
+        async def reopen():
+            delay = 0.1
+            try:
+                while True:
+                    try:
+                        if slot.channel is not None and not slot.channel.is_closed:
+                            await slot.channel.close()
+                        await self._open(slot)
+                        slot.reopened += 1
+                        print(f"[order] publish channel {slot.index} re-opened")
+                        return
+                    except Exception as e:
+                        print(f"[order] re-opening publish channel {slot.index} failed: {e}")
+                        await asyncio.sleep(delay)
+                        delay = min(delay * 2, 5.0)
+            finally:
+                slot.reopening = None
+
+        slot.reopening = asyncio.get_running_loop().create_task(reopen())
+
+    async def _check_loop(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for slot in self.slots:
+                if slot.reopening is None and (slot.channel is None or slot.channel.is_closed):
+                    print(f"[order] publish channel {slot.index} is closed, re-opening")
+                    self._reopen(slot)
+
+    async def publish(self, message, routing_key: str, **kwargs):
+        healthy = [slot for slot in self.slots if slot.healthy]
+        if not healthy:
+            raise ChannelInvalidStateError("no open publishing channel")
+        slot = min(healthy, key=lambda s: s.in_flight)
+        slot.in_flight += 1
+        try:
+            confirmation = await slot.exchange.publish(message, routing_key=routing_key, **kwargs)
+        except (AMQPError, ChannelInvalidStateError):
+            if slot.channel.is_closed:
+                self.channel_errors += 1
+                self._reopen(slot)
+            raise
+        finally:
+            slot.in_flight -= 1
+        slot.published += 1
+        return confirmation
+
+    async def close(self):
+        if self._checker is not None:
+            self._checker.cancel()
+        for slot in self.slots:
+            if slot.reopening is not None:
+                slot.reopening.cancel()
+            if slot.channel is not None and not slot.channel.is_closed:
+                await slot.channel.close()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "open": sum(slot.healthy for slot in self.slots),
+            "channel_errors": self.channel_errors,
+            "channels": [
+                {"index": slot.index, "open": slot.healthy, "in_flight": slot.in_flight,
+                 "published": slot.published, "reopened": slot.reopened}
+                for slot in self.slots
+            ],
+        }
@@ -1,6 +1,5 @@
 # async-rabbitmq/order_service/main.py
 import os
-import json
 import uuid
 import asyncio
 from datetime import datetime, timezone
@@ -19,6 +18,9 @@ from common.rabbit import (
     INV_RESERVED_RK,
     INV_FAILED_RK,
 )
+from common.serialization import decode_event, serializer_from_env
+from channel_pool import ChannelPool
+from publisher import BatchingPublisher, ConfirmPublisher, PublishError, PublishTimeout
 
 app = FastAPI()
 app.state.conn = None
@@ -28,6 +30,23 @@ app.state.order_statuses: Dict[str, str] = {}
 # Local in-memory order store
 orders: dict = {}
 
+# EVENT_FORMAT=json|struct for published events; incoming events are auto-detected
+serializer = serializer_from_env()
+
+# Confirm-mode publishing: /order returns 202 only after the broker acks. PUBLISH_MODE=pipelined
+# keeps up to PUBLISH_MAX_OUTSTANDING unconfirmed publishes in flight; PUBLISH_MODE=batch also
+# groups publishes for up to PUBLISH_BATCH_MS / PUBLISH_BATCH_SIZE messages
+PUBLISH_MODE = os.getenv("PUBLISH_MODE", "pipelined")
+PUBLISH_MAX_OUTSTANDING = int(os.getenv("PUBLISH_MAX_OUTSTANDING", "256"))
+PUBLISH_CONFIRM_TIMEOUT_MS = int(os.getenv("PUBLISH_CONFIRM_TIMEOUT_MS", "5000"))
+PUBLISH_BATCH_SIZE = int(os.getenv("PUBLISH_BATCH_SIZE", "64"))
+PUBLISH_BATCH_MS = float(os.getenv("PUBLISH_BATCH_MS", "2"))
+# OrderPlaced is published on a pool of PUBLISH_CHANNELS confirm-mode channels, separate from the
+# channel that consumes inventory events; closed channels are re-opened (checked every
+# PUBLISH_CHANNEL_CHECK_SECONDS)
+PUBLISH_CHANNELS = int(os.getenv("PUBLISH_CHANNELS", "4"))
+PUBLISH_CHANNEL_CHECK_SECONDS = float(os.getenv("PUBLISH_CHANNEL_CHECK_SECONDS", "5"))
+
 class Item(BaseModel):
     sku: str
     qty: int
@@ -53,13 +72,17 @@ async def handle_inventory_event(message: aio_pika.IncomingMessage):
     """Handle InventoryReserved and InventoryFailed events to update order status."""
     async with message.process(requeue=False):
         try:
-            payload = json.loads(message.body.decode())
+            payload = decode_event(message.body, message.content_type)
             event_type = payload.get("event_type")
             order_id = payload.get("order_id")
             
             if not order_id:
                 return
-            
+            # only orders this service accepted (or whose publish is unconfirmed) get a status
+            if order_id not in app.state.order_statuses:
+                print(f"[order] ignoring {event_type} for unknown order {order_id}")
+                return
+
             if event_type == "InventoryReserved":
                 app.state.order_statuses[order_id] = "CONFIRMED"
                 print(f"[order] order {order_id} status updated to CONFIRMED")
@@ -73,24 +96,47 @@ async def handle_inventory_event(message: aio_pika.IncomingMessage):
 async def startup():
     # connect to rabbit with retries so service doesn't crash on early start
     app.state.conn = await connect_with_retry(AMQP_URL, retries=60, delay=1.0)
-    app.state.channel = await app.state.conn.channel()
-    await app.state.channel.set_qos(prefetch_count=10)
+    # consuming only: publishes never queue behind inventory-event deliveries
+    app.state.consume_channel = await app.state.conn.channel()
+    await app.state.consume_channel.set_qos(prefetch_count=10)
 
     # Ensure exchange/queue exist (idempotent)
-    app.state.exchange, _ = await setup_orders_topology(app.state.channel)
+    await setup_orders_topology(app.state.consume_channel)
+    if PUBLISH_MODE not in ("pipelined", "batch"):
+        raise ValueError(f"Unknown PUBLISH_MODE {PUBLISH_MODE!r}, expected 'pipelined' or 'batch'")
+    app.state.publish_pool = ChannelPool(
+        app.state.conn, PUBLISH_CHANNELS,
+        setup=lambda channel: channel.declare_exchange(ORDERS_EX, aio_pika.ExchangeType.DIRECT, durable=True),
+        check_interval=PUBLISH_CHANNEL_CHECK_SECONDS,
+    )
+    await app.state.publish_pool.open()
+    if PUBLISH_MODE == "batch":
+        app.state.publisher = BatchingPublisher(
+            app.state.publish_pool, PUBLISH_MAX_OUTSTANDING, PUBLISH_CONFIRM_TIMEOUT_MS / 1000.0,
+            PUBLISH_BATCH_SIZE, PUBLISH_BATCH_MS,
+        )
+    else:
+        app.state.publisher = ConfirmPublisher(
+            app.state.publish_pool, PUBLISH_MAX_OUTSTANDING, PUBLISH_CONFIRM_TIMEOUT_MS / 1000.0,
+        )
     
     # Setup inventory topology and consume inventory events
-    inventory_ex, reserved_q, failed_q = await setup_inventory_topology(app.state.channel)
+    inventory_ex, reserved_q, failed_q = await setup_inventory_topology(app.state.consume_channel)
     
     # Consume inventory events to track order status
     await reserved_q.consume(handle_inventory_event)
     await failed_q.consume(handle_inventory_event)
     
-    print("[order] connected to RabbitMQ and topology declared")
+    print(f"[order] connected to RabbitMQ and topology declared "
+          f"(publish mode: {PUBLISH_MODE}, {PUBLISH_CHANNELS} publish channels)")
     print("[order] consuming inventory events for order status tracking")
 
 @app.on_event("shutdown")
 async def shutdown():
+    if getattr(app.state, "publisher", None):
+        await app.state.publisher.close()
+    if getattr(app.state, "publish_pool", None):
+        await app.state.publish_pool.close()
     if app.state.conn:
         await app.state.conn.close()
         print("[order] RabbitMQ connection closed")
@@ -115,42 +161,51 @@ async def create_order(order: OrderIn):
     orders[order_id] = {"order_id": order_id, "status": "PLACED", "data": event}
 
     msg = aio_pika.Message(
-        body=json.dumps(event).encode(),
-        content_type="application/json",
+        body=serializer.encode(event),
+        content_type=serializer.content_type,
         delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
     )
 
-    await app.state.exchange.publish(msg, routing_key=ORDER_PLACED_RK)
-    # Initialize order status
+    # Initialize order status first: the inventory reply can race the publisher confirm
     app.state.order_statuses[order_id] = "PLACED"
-    print(f"[order] published OrderPlaced {order_id}")
-    return {"order_id": order_id, "status": "PLACED"}
-
-<<<<<<< HEAD
-@app.get("/order/{order_id}")
-def get_order(order_id: str):
-    if order_id not in orders:
-        return {"error": "not found"}, 404
-    return orders[order_id]
+    try:
+        confirm_ms = await app.state.publisher.publish(msg, ORDER_PLACED_RK)
+    except PublishTimeout as e:
+        # the broker may still have the message: keep the order so a later inventory event can settle it
+        app.state.order_statuses[order_id] = "PUBLISH_UNKNOWN"
+        orders[order_id]["status"] = "PUBLISH_UNKNOWN"
+        print(f"[order] OrderPlaced {order_id} not confirmed in time, status PUBLISH_UNKNOWN: {e}")
+        raise HTTPException(status_code=504, detail={"order_id": order_id, "status": "PUBLISH_UNKNOWN",
+                                                     "error": str(e)})
+    except PublishError as e:
+        orders.pop(order_id, None)
+        app.state.order_statuses.pop(order_id, None)
+        print(f"[order] publish of OrderPlaced {order_id} failed: {e}")
+        raise HTTPException(status_code=503, detail=f"order not accepted: {e}")
+    print(f"[order] published OrderPlaced {order_id} (confirmed in {confirm_ms:.2f} ms)")
+    return {"order_id": order_id, "status": "PLACED", "confirm_ms": round(confirm_ms, 3)}
+
+@app.get("/metrics")
+async def metrics():
+    """Publisher confirm counts and confirm latency, and the state of each publish channel."""
+    return {"publisher": app.state.publisher.stats(), "publish_channels": app.state.publish_pool.stats()}
 
-@app.get("/orders")
-def list_orders():
-    return {"count": len(orders), "orders": list(orders.values())}
-=======
 @app.get("/orders")
 async def list_orders():
     """List all orders with their current status."""
-    orders = [
+    statuses = [
         {"order_id": order_id, "status": status}
         for order_id, status in app.state.order_statuses.items()
     ]
-    return {"orders": orders, "count": len(orders)}
+    return {"orders": statuses, "count": len(statuses)}
 
 @app.get("/order/{order_id}")
 async def get_order_status(order_id: str):
-    """Get the current status of an order."""
+    """Get the current status of an order, with the OrderPlaced event it was created from."""
     status = app.state.order_statuses.get(order_id)
     if status is None:
         raise HTTPException(status_code=404, detail="Order not found")
-    return {"order_id": order_id, "status": status}
->>>>>>> 439cbb2 (made some changes to order service)
+    order = {"order_id": order_id, "status": status}
+    if order_id in orders:
+        order["data"] = orders[order_id]["data"]
+    return order
@@ -0,0 +1,210 @@
+# async-rabbitmq/order_service/publisher.py
+"""
+Confirm-mode publishing for the order service.
+
+The channel runs with publisher confirms, and every publish waits for the
+broker's ack before it returns. A nack, an unroutable return (publishes are
+mandatory), a closed channel or a missing ack within `confirm_timeout`
+raises PublishError. So a message is never lost silently. A missing ack
+raises the subclass PublishTimeout: the broker may still have taken the
+message, so the caller must treat the outcome as unknown, not as failed.
+
+Confirms are pipelined. Up to `max_outstanding` publishes may be waiting for
+their ack at once, so concurrent requests share the broker round-trip
+instead of queueing behind it. Past that limit, publish() waits for a slot.
+
+BatchingPublisher adds micro-batching. Publishes are collected for up to
+`batch_ms` or `batch_size` messages. The batch then takes its confirm
+slots, writes all of its messages back to back, and only then waits for
+their acks together (publish a batch, then wait for its confirms). Writes
+of different batches never interleave. Each caller still gets its own ack
+(or error). Callers still queued when the publisher is closed get a
+PublishError.
+
+The only thing either publisher needs from the channel is
+`exchange.publish(message, routing_key=..., mandatory=...)`. A stand-in
+exchange can therefore replace RabbitMQ in tests and benchmarks
+(see async-rabbitmq/tests/bench_publish.py).
+"""
+import asyncio
+import time
+
+from aio_pika.exceptions import AMQPError, ChannelInvalidStateError, DeliveryError
+from pamqp.commands import Basic
+
+from common.metrics import Histogram, exponential_buckets
+
+
+class PublishError(Exception):
+    """The broker did not take responsibility for the message (nack, returned, no confirm in time,
+    or the channel closed)."""
+
+
+class PublishTimeout(PublishError):
+    """No confirm arrived in time. The message may or may not have reached the broker."""
+
+
+class ConfirmPublisher:
+    def __init__(self, exchange, max_outstanding: int = 256, confirm_timeout: float = 5.0):
+        self.exchange = exchange
+        self.max_outstanding = max_outstanding
+        self.confirm_timeout = confirm_timeout
+        self._slots = asyncio.Semaphore(max_outstanding)
+        self.outstanding = 0
+        self.confirmed = 0
+        self.failed = {"nack": 0, "returned": 0, "timeout": 0, "channel": 0}
+        self.confirm_ms = Histogram(exponential_buckets(0.05, 2, 16))   # 50 µs .. 1.6 s
+
+    async def publish(self, message, routing_key: str) -> float:
+        """Publish and wait for the broker's ack; returns the confirm latency in ms."""
+        started = time.perf_counter()
+        await self._confirm(message, routing_key)
+        return self._record(started)
+
+    async def _confirm(self, message, routing_key: str):
+        async with self._slots:
+            await self._publish_once(message, routing_key)
+
+    async def _publish_once(self, message, routing_key: str):
+        """One publish and its confirm; the caller holds a slot."""
+        self.outstanding += 1
+        try:
+            confirmation = await asyncio.wait_for(
+                self.exchange.publish(message, routing_key=routing_key, mandatory=True),
+                self.confirm_timeout,
+            )
+        except asyncio.TimeoutError:
+            self.failed["timeout"] += 1
+            raise PublishTimeout(f"no publisher confirm within {self.confirm_timeout:g}s")
+        except DeliveryError as e:
+            self.failed["returned"] += 1
+            raise PublishError(f"message returned by broker: {e}")
+        except (AMQPError, ChannelInvalidStateError) as e:
+            self.failed["channel"] += 1
+            raise PublishError(f"publish channel unavailable: {e}")
+        finally:
+            self.outstanding -= 1
+        if isinstance(confirmation, Basic.Nack):
+            self.failed["nack"] += 1
+            raise PublishError("message nacked by broker")
+
+    def _record(self, started: float) -> float:
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        self.confirmed += 1
+        self.confirm_ms.observe(elapsed_ms)
+        return elapsed_ms
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "mode": "pipelined",
+            "max_outstanding": self.max_outstanding,
+            "outstanding": self.outstanding,
+            "confirmed": self.confirmed,
+            "failed": dict(self.failed),
+            "confirm_ms": self.confirm_ms.snapshot(),
+        }
+
+
+class BatchingPublisher(ConfirmPublisher):
+    def __init__(self, exchange, max_outstanding: int = 256, confirm_timeout: float = 5.0,
+                 batch_size: int = 64, batch_ms: float = 2.0):
+        super().__init__(exchange, max_outstanding, confirm_timeout)
+        self.batch_size = max(min(batch_size, max_outstanding), 1)   # a batch holds a slot per message
+        self.batch_wait = batch_ms / 1000.0
+        self.batches = 0
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._settling: set[asyncio.Task] = set()   # the loop only keeps weak references to tasks
+        self._closed = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def publish(self, message, routing_key: str) -> float:
+        if self._closed:
+            raise PublishError("publisher closed")
+        started = time.perf_counter()
+        done = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((message, routing_key, done))
+        await done
+        return self._record(started)
+
+    async def _collect(self, batch: list):
+        batch.append(await self._queue.get())
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+    async def _run(self):
+        while True:
+            batch, held = [], 0
+            try:
+                await self._collect(batch)
+                # every slot of the batch first, so its writes are not interleaved with the next batch
+                for _ in batch:
+                    await self._slots.acquire()
+                    held += 1
+            except asyncio.CancelledError:
+                for _ in range(held):
+                    self._slots.release()
+                self._fail(batch)
+                raise
+            self.batches += 1
+            task = asyncio.ensure_future(self._settle(batch))
+            self._settling.add(task)
+            task.add_done_callback(self._settling.discard)
+
+    async def _settle(self, batch: list):
+        try:
+            # gather starts every publish in the same loop turn: the whole batch is written
+            # before any of its acks is awaited
+            results = await asyncio.gather(
+                *(self._publish_once(message, routing_key) for message, routing_key, _ in batch),
+                return_exceptions=True,
+            )
+        finally:
+            for _ in batch:
+                self._slots.release()
+        for (_, _, done), result in zip(batch, results):
+            if done.done():
+                continue
+            if isinstance(result, BaseException):
+                done.set_exception(result)
+            else:
+                done.set_result(None)
+
+    def _fail(self, batch: list):
+        for _, _, done in batch:
+            if not done.done():
+                done.set_exception(PublishError("publisher closed before the message was published"))
+
+    async def close(self):
+        """Stop batching: queued publishes fail with PublishError, batches already written get their acks."""
+        self._closed = True
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        queued = []
+        while not self._queue.empty():
+            queued.append(self._queue.get_nowait())
+        self._fail(queued)
+        if self._settling:
+            await asyncio.gather(*self._settling, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "mode": "batch",
+            "batch_size": self.batch_size,
+            "batch_ms": self.batch_wait * 1000.0,
+            "batches": self.batches,
+            "queued": self._queue.qsize(),
+        }
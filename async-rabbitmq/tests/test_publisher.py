@@ -0,0 +1,122 @@
+"""
+Tests for the order service's confirm-mode publishers (order_service/publisher.py).
+
+The broker is replaced by bench_publish's StandInExchange and variants that
+nack, return or never confirm chosen messages.
+
+Usage (from the repository root; needs the order service requirements):
+    python -m pytest async-rabbitmq/tests/test_publisher.py
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path[:0] = [REPO_ROOT, os.path.join(REPO_ROOT, "async-rabbitmq", "order_service"), os.path.dirname(__file__)]
+pytest.importorskip("aio_pika")
+
+import aio_pika  # noqa: E402
+from aio_pika.exceptions import DeliveryError  # noqa: E402
+from pamqp.commands import Basic  # noqa: E402
+
+from bench_publish import StandInExchange  # noqa: E402
+from publisher import BatchingPublisher, ConfirmPublisher, PublishError, PublishTimeout  # noqa: E402
+
+
+class ScriptedExchange(StandInExchange):
+    """Acks like StandInExchange, except for bodies listed in `nack`, `returned` or `silent`."""
+
+    def __init__(self, nack=(), returned=(), silent=(), rtt_ms: float = 1.0):
+        super().__init__(rtt_ms, channel_us=0)
+        self.nack, self.returned, self.silent = set(nack), set(returned), set(silent)
+        self.written = []
+
+    async def publish(self, message, routing_key: str, mandatory: bool = False, **kwargs):
+        self.written.append(message.body)
+        if message.body in self.silent:
+            await asyncio.sleep(3600)
+        confirmation = await super().publish(message, routing_key, mandatory, **kwargs)
+        if message.body in self.returned:
+            raise DeliveryError(None, None)
+        if message.body in self.nack:
+            return Basic.Nack()
+        return confirmation
+
+
+def message(body: bytes):
+    return aio_pika.Message(body=body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT)
+
+
+async def outcomes(publisher, bodies) -> list:
+    results = await asyncio.gather(*(publisher.publish(message(b), "order.placed") for b in bodies),
+                                   return_exceptions=True)
+    await publisher.close()
+    return [type(r).__name__ if isinstance(r, BaseException) else "ok" for r in results]
+
+
+@pytest.mark.parametrize("mode", ["pipelined", "batch"])
+class TestConfirmPaths:
+    @staticmethod
+    def publisher(mode: str, exchange, **kwargs):
+        if mode == "batch":
+            return BatchingPublisher(exchange, batch_size=4, batch_ms=1, **kwargs)
+        return ConfirmPublisher(exchange, **kwargs)
+
+    def test_ack_nack_and_return(self, mode):
+        async def run():
+            exchange = ScriptedExchange(nack={b"2"}, returned={b"3"})
+            publisher = self.publisher(mode, exchange)
+            result = await outcomes(publisher, [b"1", b"2", b"3", b"4"])
+            return result, publisher
+        result, publisher = asyncio.run(run())
+        assert result == ["ok", "PublishError", "PublishError", "ok"]
+        assert publisher.confirmed == 2
+        assert publisher.failed == {"nack": 1, "returned": 1, "timeout": 0, "channel": 0}
+        assert publisher.outstanding == 0
+
+    def test_missing_confirm_is_a_timeout(self, mode):
+        async def run():
+            exchange = ScriptedExchange(silent={b"2"})
+            publisher = self.publisher(mode, exchange, confirm_timeout=0.05)
+            result = await outcomes(publisher, [b"1", b"2"])
+            return result, publisher
+        result, publisher = asyncio.run(run())
+        assert result == ["ok", "PublishTimeout"]
+        assert issubclass(PublishTimeout, PublishError)
+        assert publisher.failed["timeout"] == 1
+
+
+class TestBatching:
+    def test_batch_is_written_before_any_ack_is_awaited(self):
+        async def run():
+            exchange = ScriptedExchange(rtt_ms=20)
+            publisher = BatchingPublisher(exchange, batch_size=8, batch_ms=5)
+            sends = [asyncio.ensure_future(publisher.publish(message(b"%d" % i), "order.placed"))
+                     for i in range(8)]
+            await asyncio.sleep(0.012)               # batch collected and written, no ack yet
+            written = len(exchange.written)
+            await asyncio.gather(*sends)
+            await publisher.close()
+            return written, publisher
+        written, publisher = asyncio.run(run())
+        assert written == 8
+        assert publisher.batches == 1
+
+    def test_close_fails_queued_publishes(self):
+        async def run():
+            exchange = ScriptedExchange()
+            publisher = BatchingPublisher(exchange, batch_size=64, batch_ms=1000)
+            sends = [asyncio.ensure_future(publisher.publish(message(b"%d" % i), "order.placed"))
+                     for i in range(3)]
+            await asyncio.sleep(0.01)                # still collecting the first batch
+            await publisher.close()
+            results = await asyncio.gather(*sends, return_exceptions=True)
+            with pytest.raises(PublishError):
+                await publisher.publish(message(b"late"), "order.placed")
+            return results, exchange
+        results, exchange = asyncio.run(run())
+        assert all(isinstance(r, PublishError) for r in results)
+        assert exchange.written == []
@@ -0,0 +1,69 @@
+"""
+common/bench_serialization.py
+
+Encode/decode cost (µs/event) and size (bytes/event) of every format in
+common/serialization.py, for the events the services actually send.
+
+Usage (from the repository root):
+    python -m common.bench_serialization --events 50000
+"""
+
+import argparse
+import time
+import uuid
+from datetime import datetime, timezone
+
+from common.serialization import SERIALIZERS, decode_event
+
+
+def sample_events() -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "kafka OrderPlaced": {
+            "eventId": str(uuid.uuid4()),
+            "eventType": "OrderPlaced",
+            "orderId": f"o-{uuid.uuid4().hex[:8]}",
+            "items": [{"sku": "burrito", "qty": 1}],
+            "createdAt": now,
+        },
+        "kafka InventoryReserved": {
+            "eventId": str(uuid.uuid4()),
+            "eventType": "InventoryReserved",
+            "orderId": f"o-{uuid.uuid4().hex[:8]}",
+            "reservedAt": now,
+            "createdAt": now,
+        },
+        "rabbit OrderPlaced": {
+            "event_type": "OrderPlaced",
+            "order_id": str(uuid.uuid4()),
+            "user_id": "u-123",
+            "restaurant_id": "r-456",
+            "items": [{"sku": "burger", "qty": 2}, {"sku": "fries", "qty": 1}],
+            "ts": now,
+        },
+    }
+
+
+def per_event_us(fn, arg, n: int) -> float:
+    started = time.perf_counter()
+    for _ in range(n):
+        fn(arg)
+    return (time.perf_counter() - started) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark event serializers.")
+    parser.add_argument("--events", type=int, default=50_000)
+    args = parser.parse_args()
+
+    print(f"{'event':<26} {'format':<8} {'bytes':>6} {'encode us':>10} {'decode us':>10}")
+    for label, event in sample_events().items():
+        for name, serializer in SERIALIZERS.items():
+            payload = serializer.encode(event)
+            encode_us = per_event_us(serializer.encode, event, args.events)
+            decode_us = per_event_us(decode_event, payload, args.events)
+            print(f"{label:<26} {name:<8} {len(payload):>6} {encode_us:>10.2f} {decode_us:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+common/bench_stock_ledger.py
+
+Microbenchmark: StockLedger reserve+release pairs per second against thread count.
+
+Two workloads are measured for every thread count:
+- disjoint: each thread reserves its own SKUs (no lock is ever shared)
+- shared:   every thread reserves the same SKU (worst-case contention)
+
+Note that CPython's GIL caps total throughput for pure-Python work, so the
+interesting number is how flat "disjoint" stays as threads are added compared
+with "shared".
+
+Usage (from the repository root):
+    python -m common.bench_stock_ledger --threads 1 2 4 8 --seconds 2
+"""
+
+import argparse
+import threading
+import time
+
+from common.stock_ledger import StockLedger
+
+
+def run(threads: int, seconds: float, shared: bool, items_per_order: int) -> float:
+    ledger = StockLedger(default_available=10**12)
+    counts = [0] * threads
+    stop = threading.Event()
+    start_barrier = threading.Barrier(threads + 1)
+
+    def worker(index: int):
+        if shared:
+            items = [{"sku": f"shared-{i}", "qty": 1} for i in range(items_per_order)]
+        else:
+            items = [{"sku": f"t{index}-{i}", "qty": 1} for i in range(items_per_order)]
+        n = 0
+        start_barrier.wait()
+        while not stop.is_set():
+            order_id = f"bench-{index}-{n}"
+            ledger.reserve(order_id, items)
+            ledger.release(order_id)
+            n += 1
+        counts[index] = n
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    time.sleep(seconds)
+    stop.set()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return sum(counts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark StockLedger reservations/sec against thread count.")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--items", type=int, default=2, help="distinct SKUs per order (default 2)")
+    args = parser.parse_args()
+
+    print(f"{'threads':>8} {'disjoint res/s':>16} {'shared res/s':>14}")
+    for threads in args.threads:
+        disjoint = run(threads, args.seconds, shared=False, items_per_order=args.items)
+        shared = run(threads, args.seconds, shared=True, items_per_order=args.items)
+        print(f"{threads:>8} {disjoint:>16,.0f} {shared:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
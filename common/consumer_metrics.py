@@ -0,0 +1,191 @@
+"""
+common/consumer_metrics.py
+
+Lag and throughput instrumentation for the Kafka consumers, rendered in the
+Prometheus text format.
+
+Per-partition numbers come from librdkafka's own statistics (stats_cb every
+`statistics.interval.ms`), so nothing is counted per message. Each report
+gives the committed offset, high watermark, lag and cumulative
+messages/bytes fetched. The rates are the deltas between two reports.
+Processing time is timed for one message in `sample_every` only. The poll-loop
+idle ratio is the share of wall time spent blocked in poll()/consume(),
+taken per statistics interval.
+
+- ConsumerMetrics.config(): the consumer config keys to add (stats_cb, interval)
+- ConsumerMetrics.poll/consume(consumer, ...): timed wrappers for the poll loop
+- ConsumerMetrics.sample() / observe_processing(ms): sampled processing time
+- ConsumerMetrics.render(): Prometheus exposition text
+- serve_metrics(port, render): stdlib HTTP server for services without one
+
+Usage:
+    from common.consumer_metrics import ConsumerMetrics, serve_metrics
+
+    consumer_metrics = ConsumerMetrics("inventory_consumer")
+    consumer = Consumer({**conf, **consumer_metrics.config()})
+    msg = consumer_metrics.poll(consumer, 1.0)
+    serve_metrics(9102, consumer_metrics.render)
+"""
+
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common.metrics import Histogram, exponential_buckets
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_PARTITION_GAUGES = (
+    ("committed_offset", "Last committed offset of the consumer group"),
+    ("high_watermark", "Partition high watermark (next offset to be written)"),
+    ("lag", "Messages between the committed offset and the high watermark"),
+    ("messages_per_second", "Messages fetched per second over the last statistics interval"),
+    ("bytes_per_second", "Message bytes fetched per second over the last statistics interval"),
+)
+_PARTITION_COUNTERS = (
+    ("messages_total", "Messages fetched"),
+    ("bytes_total", "Message bytes fetched"),
+)
+
+
+class ConsumerMetrics:
+    def __init__(self, service: str, sample_every: int = 16, stats_interval_ms: int = 5000):
+        self.service = service
+        self.sample_every = max(1, sample_every)
+        self.stats_interval_ms = stats_interval_ms
+        self.processing_ms = Histogram(exponential_buckets(0.01, 2, 18))   # 10 µs .. 1.3 s
+        self.partitions: dict[tuple[str, int], dict] = {}   # replaced whole on every report
+        self.idle_ratio = 0.0
+        self.reports = 0
+        self._seen = 0
+        self._waited = 0.0             # seconds blocked in poll()/consume(); poll thread only
+        self._mark = (time.monotonic(), 0.0)
+        self._reported_at = 0.0
+
+    def config(self) -> dict:
+        return {"statistics.interval.ms": self.stats_interval_ms, "stats_cb": self.on_stats}
+
+    def poll(self, consumer, timeout: float):
+        started = time.perf_counter()
+        msg = consumer.poll(timeout)
+        self._waited += time.perf_counter() - started
+        return msg
+
+    def consume(self, consumer, num_messages: int, timeout: float) -> list:
+        started = time.perf_counter()
+        messages = consumer.consume(num_messages, timeout)
+        self._waited += time.perf_counter() - started
+        return messages
+
+    def sample(self) -> bool:
+        """True for one call in `sample_every`: time this message. Unsynchronised; off by a few is fine."""
+        self._seen += 1
+        return self._seen % self.sample_every == 0
+
+    def observe_processing(self, ms: float):
+        self.processing_ms.observe(ms)
+
+    def on_stats(self, stats_json: str):
+        # librdkafka calls this from inside poll()/consume() on the poll thread
+        now = time.monotonic()
+        try:
+            stats = json.loads(stats_json)
+        except ValueError:
+            return
+        mark_at, mark_waited = self._mark
+        if now > mark_at:
+            self.idle_ratio = min(1.0, (self._waited - mark_waited) / (now - mark_at))
+        self._mark = (now, self._waited)
+
+        previous = self.partitions
+        partitions = {}
+        for topic, topic_stats in stats.get("topics", {}).items():
+            for pid, p in topic_stats.get("partitions", {}).items():
+                partition = int(pid)
+                if partition < 0 or not p.get("desired"):
+                    continue            # -1 is librdkafka's unassigned bucket; skip partitions not ours
+                committed, high = p.get("committed_offset", -1), p.get("hi_offset", -1)
+                lag = p.get("consumer_lag", -1)
+                if lag < 0 and committed >= 0 and high >= 0:
+                    lag = high - committed
+                row = {
+                    "committed_offset": committed,
+                    "high_watermark": high,
+                    "lag": lag,
+                    "messages_total": p.get("rxmsgs", 0),
+                    "bytes_total": p.get("rxbytes", 0),
+                    "messages_per_second": 0.0,
+                    "bytes_per_second": 0.0,
+                }
+                before = previous.get((topic, partition))
+                if before is not None and now > self._reported_at:
+                    elapsed = now - self._reported_at
+                    row["messages_per_second"] = max(0, row["messages_total"] - before["messages_total"]) / elapsed
+                    row["bytes_per_second"] = max(0, row["bytes_total"] - before["bytes_total"]) / elapsed
+                partitions[(topic, partition)] = row
+        self.partitions = partitions     # single reference swap: readers never see a half-built dict
+        self._reported_at = now
+        self.reports += 1
+
+    def render(self) -> str:
+        """Prometheus text exposition of everything above."""
+        service = f'service="{self.service}"'
+        partitions = self.partitions
+        lines = []
+        for metric_type, metrics in (("gauge", _PARTITION_GAUGES), ("counter", _PARTITION_COUNTERS)):
+            for name, help_text in metrics:
+                metric = f"kafka_consumer_{name}"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} {metric_type}")
+                for (topic, partition), row in sorted(partitions.items()):
+                    value = row[name]
+                    if value < 0:
+                        continue        # librdkafka's "unknown" (nothing committed / not fetched yet)
+                    value = f"{value:.3f}" if isinstance(value, float) else str(value)
+                    lines.append(f'{metric}{{{service},topic="{topic}",partition="{partition}"}} {value}')
+
+        lines.append("# HELP kafka_consumer_lag_total Lag summed over the assigned partitions")
+        lines.append("# TYPE kafka_consumer_lag_total gauge")
+        lines.append(f"kafka_consumer_lag_total{{{service}}} {sum(max(0, r['lag']) for r in partitions.values())}")
+        lines.append("# HELP kafka_consumer_poll_idle_ratio Share of the last statistics interval spent "
+                     "blocked in poll/consume")
+        lines.append("# TYPE kafka_consumer_poll_idle_ratio gauge")
+        lines.append(f"kafka_consumer_poll_idle_ratio{{{service}}} {self.idle_ratio:.4f}")
+
+        snapshot = self.processing_ms.snapshot()
+        metric = "kafka_consumer_processing_milliseconds"
+        lines.append(f"# HELP {metric} Time to process one message (sampled: 1 in {self.sample_every})")
+        lines.append(f"# TYPE {metric} histogram")
+        for bound, cumulative in snapshot["buckets"].items():
+            lines.append(f'{metric}_bucket{{{service},le="{bound}"}} {cumulative}')
+        lines.append(f"{metric}_sum{{{service}}} {snapshot['sum']}")
+        lines.append(f"{metric}_count{{{service}}} {snapshot['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(port: int, render, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve GET /metrics (render() output) on a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass                         # scrapes would flood the service log
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("Serving Prometheus metrics on :%d/metrics", port)
+    return server
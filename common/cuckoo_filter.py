@@ -0,0 +1,204 @@
+"""
+common/cuckoo_filter.py
+
+Cuckoo filter over the 64-bit order-ID hashes used by common/idempotency.py.
+It answers "definitely not seen" or "maybe seen" in about 2-4 bytes per ID,
+and unlike a Bloom filter it supports deletion. That matters because the
+idempotency store expires and evicts IDs.
+
+- 4 slots per bucket, 16-bit fingerprints in a flat `array("H")`
+- Each ID has two candidate buckets (partial-key cuckoo hashing), so a lookup
+  reads at most 8 slots
+- False-positive rate is about 8 * fill_ratio / 2^16, i.e. at most ~1e-4
+- `snapshot()` / `restore()` write and read the raw table, so a restarted
+  consumer does not have to rebuild the filter from scratch
+
+Usage:
+    from common.cuckoo_filter import CuckooFilter
+
+    f = CuckooFilter(capacity=1_000_000)
+    f.add(key)                 # key: 64-bit int, e.g. idempotency.hash_key(order_id)
+    f.contains(key)            # False -> definitely never added
+    f.delete(key)
+"""
+
+import json
+import os
+import random
+import struct
+from array import array
+
+BUCKET_SIZE = 4
+MAX_KICKS = 500
+TARGET_LOAD = 0.9          # a 4-way cuckoo table fills reliably to ~95%
+_EMPTY = 0
+_MAGIC = b"CKF1"
+_HEADER = struct.Struct("<4sI")   # magic, length of the JSON metadata that follows
+
+
+def _buckets_for(capacity: int) -> int:
+    buckets = 1
+    while buckets * BUCKET_SIZE * TARGET_LOAD < capacity:
+        buckets *= 2
+    return buckets
+
+
+class CuckooFilter:
+    """Approximate membership of 64-bit keys with deletion."""
+
+    def __init__(self, capacity: int = 1_000_000, num_buckets: int | None = None):
+        self.num_buckets = num_buckets or _buckets_for(max(capacity, 1))
+        self._mask = self.num_buckets - 1
+        self._slots = array("H", bytes(2 * self.num_buckets * BUCKET_SIZE))
+        self.count = 0
+        # a fingerprint that could not be placed after MAX_KICKS; while it is
+        # set the filter is full and further adds fail
+        self._victim: tuple[int, int] | None = None
+        self._random = random.Random(0)
+
+    def _fingerprint_and_index(self, key: int) -> tuple[int, int]:
+        # bucket from the low bits, fingerprint from independent high bits
+        fingerprint = (key >> 32) & 0xFFFF or 1
+        return fingerprint, key & self._mask
+
+    def _alt_index(self, index: int, fingerprint: int) -> int:
+        return (index ^ (fingerprint * 0x5BD1E995)) & self._mask
+
+    def _insert_into(self, index: int, fingerprint: int) -> bool:
+        base = index * BUCKET_SIZE
+        slots = self._slots
+        for slot in range(base, base + BUCKET_SIZE):
+            if slots[slot] == _EMPTY:
+                slots[slot] = fingerprint
+                return True
+        return False
+
+    def _remove_from(self, index: int, fingerprint: int) -> bool:
+        base = index * BUCKET_SIZE
+        slots = self._slots
+        for slot in range(base, base + BUCKET_SIZE):
+            if slots[slot] == fingerprint:
+                slots[slot] = _EMPTY
+                return True
+        return False
+
+    def add(self, key: int) -> bool:
+        """Insert a key; False if the filter is full and the key was NOT stored.
+
+        After a False, contains() can answer "absent" for that key, including
+        after a delete() has made room again, so the caller must not trust
+        negatives until it rebuilds the filter with every key.
+        """
+        if self._victim is not None:
+            return False
+        fingerprint, i1 = self._fingerprint_and_index(key)
+        i2 = self._alt_index(i1, fingerprint)
+        if self._insert_into(i1, fingerprint) or self._insert_into(i2, fingerprint):
+            self.count += 1
+            return True
+        index = self._random.choice((i1, i2))
+        for _ in range(MAX_KICKS):
+            slot = index * BUCKET_SIZE + self._random.randrange(BUCKET_SIZE)
+            fingerprint, self._slots[slot] = self._slots[slot], fingerprint
+            index = self._alt_index(index, fingerprint)
+            if self._insert_into(index, fingerprint):
+                self.count += 1
+                return True
+        # the key itself is stored; one displaced fingerprint is parked as the victim
+        self._victim = (fingerprint, index)
+        self.count += 1
+        return True
+
+    def contains(self, key: int) -> bool:
+        fingerprint, i1 = self._fingerprint_and_index(key)
+        slots = self._slots
+        base = i1 * BUCKET_SIZE
+        if fingerprint in slots[base:base + BUCKET_SIZE]:
+            return True
+        i2 = self._alt_index(i1, fingerprint)
+        base = i2 * BUCKET_SIZE
+        if fingerprint in slots[base:base + BUCKET_SIZE]:
+            return True
+        victim = self._victim
+        return victim is not None and victim[0] == fingerprint and victim[1] in (i1, i2)
+
+    def delete(self, key: int) -> bool:
+        """Remove one copy of a key. Only delete keys that were added, or another key may be lost."""
+        fingerprint, i1 = self._fingerprint_and_index(key)
+        i2 = self._alt_index(i1, fingerprint)
+        if self._remove_from(i1, fingerprint) or self._remove_from(i2, fingerprint):
+            self.count -= 1
+            if self._victim is not None:
+                # room was freed: try to re-home the parked fingerprint
+                victim_fp, victim_index = self._victim
+                if (self._insert_into(victim_index, victim_fp)
+                        or self._insert_into(self._alt_index(victim_index, victim_fp), victim_fp)):
+                    self._victim = None
+            return True
+        if self._victim is not None and self._victim[0] == fingerprint and self._victim[1] in (i1, i2):
+            self._victim = None
+            self.count -= 1
+            return True
+        return False
+
+    @property
+    def full(self) -> bool:
+        return self._victim is not None
+
+    def fill_ratio(self) -> float:
+        return self.count / (self.num_buckets * BUCKET_SIZE)
+
+    def estimated_fp_rate(self) -> float:
+        """Chance that a never-added key hits one of the 2 * BUCKET_SIZE candidate slots."""
+        return 1.0 - (1.0 - 1.0 / 0xFFFF) ** (2 * BUCKET_SIZE * self.fill_ratio())
+
+    def memory_bytes(self) -> int:
+        return self._slots.itemsize * len(self._slots)
+
+    def stats(self) -> dict:
+        return {
+            "entries": self.count,
+            "buckets": self.num_buckets,
+            "fill_ratio": round(self.fill_ratio(), 4),
+            "estimated_fp_rate": self.estimated_fp_rate(),
+            "memory_bytes": self.memory_bytes(),
+            "full": self.full,
+        }
+
+    # ---- snapshot / restore ----
+
+    def snapshot(self, path: str, **meta):
+        """Write the table (plus caller metadata) to `path` atomically."""
+        header = json.dumps({
+            "num_buckets": self.num_buckets,
+            "count": self.count,
+            "victim": self._victim,
+            "meta": meta,
+        }).encode()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, len(header)))
+            f.write(header)
+            self._slots.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def restore(cls, path: str) -> tuple["CuckooFilter", dict]:
+        """Load a snapshot; returns (filter, meta). Raises ValueError on a corrupt file."""
+        with open(path, "rb") as f:
+            magic, header_len = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError(f"{path}: not a cuckoo filter snapshot")
+            header = json.loads(f.read(header_len))
+            restored = cls(num_buckets=header["num_buckets"])
+            slots = array("H")
+            try:
+                slots.fromfile(f, restored.num_buckets * BUCKET_SIZE)
+            except EOFError as e:
+                raise ValueError(f"{path}: truncated snapshot") from e
+        restored._slots = slots
+        restored.count = header["count"]
+        restored._victim = tuple(header["victim"]) if header["victim"] else None
+        return restored, header["meta"]
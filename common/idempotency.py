@@ -0,0 +1,434 @@
+"""
+common/idempotency.py
+
+Bounded, optionally durable store of processed order IDs, used by the
+inventory consumers of Part B (async-rabbitmq) and Part C (streaming-kafka)
+in place of an ever-growing in-memory `set`.
+
+- Compact keys: every order ID is stored as a fixed-width 64-bit BLAKE2b hash
+  in flat `array`s (an open-addressing table plus an insertion-order ring),
+  not as a Python string in a set. That costs about 36 bytes per ID. The
+  chance of two distinct IDs colliding is about n^2 / 2^65, roughly 3e-6 at
+  ten million IDs.
+- Bounded: entries expire after `ttl_seconds`, and once `capacity` IDs are
+  held the oldest one is evicted. Every entry gets the same TTL, so the oldest
+  entry is always the next one to expire and the two rules share one ring.
+- Durable (optional): every add is appended to a binary log of 12-byte records
+  (8-byte key, 4-byte expiry in epoch seconds). On start the log is read back
+  in one pass (warm start) and is compacted once it holds mostly dead records.
+- Pre-filter (optional): a cuckoo filter (common/cuckoo_filter.py) in front of
+  the table answers "definitely new" for most new orders without an exact
+  lookup. It always holds every live key: if an add finds it full, the
+  filter is rebuilt at twice the size. On close it is snapshotted next to the
+  log (`<path>.filter`) and restored on the next start instead of being rebuilt.
+
+Drop-in for the old sets: supports `order_id in store`, `store.add(order_id)`
+and `store.discard(order_id)`.
+
+Usage:
+    from common.idempotency import IdempotencyStore
+
+    processed_orders = IdempotencyStore(capacity=1_000_000, ttl_seconds=86400,
+                                        path="/data/processed_orders.idx")
+    if processed_orders.check_and_add(order_id):
+        ...  # first time this order is seen
+"""
+
+import hashlib
+import logging
+import os
+import struct
+import threading
+import time
+from array import array
+
+from common.cuckoo_filter import CuckooFilter
+
+logger = logging.getLogger(__name__)
+
+_RECORD = struct.Struct("<QI")   # key, expiry (epoch seconds); expiry 0 = tombstone
+_TOMBSTONE = 0
+_EMPTY = 0                       # table slot marker; real keys are never 0
+_MIN_TABLE = 1024
+
+
+def hash_key(order_id: str) -> int:
+    """Fixed-width 64-bit key for an order ID (never 0)."""
+    key = int.from_bytes(hashlib.blake2b(order_id.encode(), digest_size=8).digest(), "little")
+    return key or 1
+
+
+class IdempotencyStore:
+    """TTL + capacity bounded set of hashed order IDs with an optional append-only log."""
+
+    def __init__(self, capacity: int = 1_000_000, ttl_seconds: float = 7 * 24 * 3600,
+                 path: str | None = None, flush_every: int = 1, prefilter: bool = False):
+        self.capacity = max(capacity, 1)
+        self.ttl = int(ttl_seconds)
+        self.path = path
+        self.flush_every = max(flush_every, 1)
+        self._lock = threading.Lock()
+        # open-addressing hash table (linear probing, load factor <= 1/2)
+        self._table_keys = array("Q", bytes(8 * _MIN_TABLE))
+        self._table_expiry = array("I", bytes(4 * _MIN_TABLE))
+        self._mask = _MIN_TABLE - 1
+        self._count = 0
+        # insertion-order ring; the head is always the oldest (= next to expire) entry
+        ring_size = min(self.capacity, _MIN_TABLE // 2)
+        self._ring_keys = array("Q", bytes(8 * ring_size))
+        self._ring_expiry = array("I", bytes(4 * ring_size))
+        self._ring_head = 0
+        self._ring_len = 0
+        self._log = None
+        self._log_records = 0
+        self._unflushed = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.warm_start_seconds = 0.0
+        self._filter = CuckooFilter(self.capacity) if prefilter else None
+        self._filter_sync = True       # False while replaying a log behind a restored filter
+        self.filter_restored = False
+        self.prefilter_negatives = 0   # lookups answered "new" by the filter alone
+        self.false_positives = 0       # filter said "maybe", exact table said no
+        self.filter_resizes = 0        # rebuilds after the filter ran full
+        if path:
+            self._load()
+            self._log = open(path, "ab")
+
+    # ---- hash table ----
+
+    def _find(self, key: int) -> int:
+        keys, mask = self._table_keys, self._mask
+        slot = key & mask
+        while True:
+            current = keys[slot]
+            if current == key:
+                return slot
+            if current == _EMPTY:
+                return -1
+            slot = (slot + 1) & mask
+
+    def _table_put(self, key: int, expiry: int) -> bool:
+        """Insert or refresh a key; True if it was not in the table."""
+        keys, mask = self._table_keys, self._mask
+        slot = key & mask
+        while True:
+            current = keys[slot]
+            if current == key:
+                self._table_expiry[slot] = expiry
+                return False
+            if current == _EMPTY:
+                keys[slot] = key
+                self._table_expiry[slot] = expiry
+                self._count += 1
+                return True
+            slot = (slot + 1) & mask
+
+    def _table_delete(self, slot: int):
+        """Backward-shift deletion, so probing never needs tombstones."""
+        keys, expiry, mask = self._table_keys, self._table_expiry, self._mask
+        if self._filter is not None and self._filter_sync:
+            self._filter.delete(keys[slot])
+        hole = slot
+        probe = slot
+        while True:
+            probe = (probe + 1) & mask
+            key = keys[probe]
+            if key == _EMPTY:
+                break
+            home = key & mask
+            # the entry at `probe` may move into the hole unless its home lies cyclically in (hole, probe]
+            if (hole < probe and hole < home <= probe) or (hole > probe and (home > hole or home <= probe)):
+                continue
+            keys[hole] = key
+            expiry[hole] = expiry[probe]
+            hole = probe
+        keys[hole] = _EMPTY
+        expiry[hole] = 0
+        self._count -= 1
+
+    def _grow_table(self):
+        old_keys, old_expiry = self._table_keys, self._table_expiry
+        size = len(old_keys) * 2
+        self._table_keys = array("Q", bytes(8 * size))
+        self._table_expiry = array("I", bytes(4 * size))
+        self._mask = size - 1
+        self._count = 0
+        for key, expiry in zip(old_keys, old_expiry):
+            if key != _EMPTY:
+                self._table_put(key, expiry)
+
+    # ---- ring ----
+
+    def _ring_push(self, key: int, expiry: int):
+        size = len(self._ring_keys)
+        if self._ring_len == size:
+            # grow (only happens while below capacity): unroll into a larger ring
+            new_size = min(size * 2, self.capacity)
+            order = [(self._ring_head + i) % size for i in range(size)]
+            self._ring_keys = array("Q", [self._ring_keys[i] for i in order]) + array("Q", bytes(8 * (new_size - size)))
+            self._ring_expiry = array("I", [self._ring_expiry[i] for i in order]) + array("I", bytes(4 * (new_size - size)))
+            self._ring_head = 0
+            size = new_size
+        tail = (self._ring_head + self._ring_len) % size
+        self._ring_keys[tail] = key
+        self._ring_expiry[tail] = expiry
+        self._ring_len += 1
+
+    def _ring_pop(self):
+        """Drop the oldest ring entry and its table entry, unless it was re-added or discarded since."""
+        key = self._ring_keys[self._ring_head]
+        expiry = self._ring_expiry[self._ring_head]
+        self._ring_head = (self._ring_head + 1) % len(self._ring_keys)
+        self._ring_len -= 1
+        slot = self._find(key)
+        if slot >= 0 and self._table_expiry[slot] == expiry:
+            self._table_delete(slot)
+            return True
+        return False
+
+    def _live_ring_entries(self):
+        size = len(self._ring_keys)
+        for i in range(self._ring_len):
+            index = (self._ring_head + i) % size
+            key, expiry = self._ring_keys[index], self._ring_expiry[index]
+            slot = self._find(key)
+            if slot >= 0 and self._table_expiry[slot] == expiry:
+                yield key, expiry
+
+    # ---- core operations (caller holds the lock) ----
+
+    def _expire(self, now: int):
+        while self._ring_len and self._ring_expiry[self._ring_head] <= now:
+            if self._ring_pop():
+                self.expirations += 1
+
+    def _contains(self, key: int, now: int) -> bool:
+        if self._filter is not None and not self._filter.contains(key):
+            self.prefilter_negatives += 1
+            return False
+        slot = self._find(key)
+        if slot < 0:
+            if self._filter is not None:
+                self.false_positives += 1
+            return False
+        return self._table_expiry[slot] > now
+
+    def _insert(self, key: int, expiry: int):
+        while self._ring_len >= self.capacity:
+            if self._ring_pop():
+                self.evictions += 1
+        if (self._count + 1) * 2 > len(self._table_keys):
+            self._grow_table()
+        if self._table_put(key, expiry) and self._filter is not None and self._filter_sync:
+            if not self._filter.add(key):
+                # the filter is full and the key is not in it: a negative for
+                # this key would be wrong, so move every live key to a larger filter
+                self._rebuild_filter(2 * self._filter.num_buckets)
+                self.filter_resizes += 1
+        self._ring_push(key, expiry)
+
+    def _add(self, key: int, now: int):
+        self._expire(now)
+        expiry = now + self.ttl
+        self._insert(key, expiry)
+        self._append(key, expiry)
+
+    # ---- persistence ----
+
+    @property
+    def _filter_path(self) -> str:
+        return f"{self.path}.filter"
+
+    def _restore_filter(self, log_records: int) -> int | None:
+        """Adopt the filter snapshot if it matches the log; returns the snapshot time."""
+        try:
+            restored, meta = CuckooFilter.restore(self._filter_path)
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, OSError) as e:
+            logger.warning("Ignoring unreadable filter snapshot: %s", e)
+            return None
+        finally:
+            # a snapshot is only valid for the log it was taken with; never reuse it
+            if os.path.exists(self._filter_path):
+                os.remove(self._filter_path)
+        if restored.num_buckets < self._filter.num_buckets or meta.get("log_records") != log_records:
+            return None
+        self._filter = restored
+        return int(meta["snapshot_time"])
+
+    def _rebuild_filter(self, num_buckets: int | None = None):
+        """Re-insert every key in the table, doubling the filter until all of them fit."""
+        num_buckets = num_buckets or self._filter.num_buckets
+        while True:
+            rebuilt = CuckooFilter(num_buckets=num_buckets)
+            if all(rebuilt.add(key) for key in self._table_keys if key != _EMPTY):
+                break
+            num_buckets *= 2
+        self._filter = rebuilt
+
+    def _load(self):
+        started = time.perf_counter()
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        usable = len(data) - len(data) % _RECORD.size
+        if usable != len(data):
+            # a crash mid-write left a partial record; drop it
+            with open(self.path, "r+b") as f:
+                f.truncate(usable)
+        now = int(time.time())
+        cutoff = now
+        snapshot_time = self._restore_filter(usable // _RECORD.size) if self._filter is not None else None
+        if snapshot_time is not None:
+            # rebuild the table as it was at snapshot time, which is what the
+            # restored filter holds, then expire up to now with the filter in sync
+            cutoff = snapshot_time
+            self._filter_sync = False
+        for key, expiry in _RECORD.iter_unpack(memoryview(data)[:usable]):
+            if expiry == _TOMBSTONE:
+                slot = self._find(key)
+                if slot >= 0:
+                    self._table_delete(slot)
+            elif expiry > cutoff:
+                self._insert(key, expiry)
+        self._filter_sync = True
+        if snapshot_time is not None:
+            self.filter_restored = self._filter.count == self._count
+            if not self.filter_restored:
+                self._rebuild_filter()
+        self._expire(now)
+        self._log_records = usable // _RECORD.size
+        self.warm_start_seconds = time.perf_counter() - started
+
+    def _append(self, key: int, expiry: int):
+        if self._log is None:
+            return
+        self._log.write(_RECORD.pack(key, expiry))
+        self._log_records += 1
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self._log.flush()
+            self._unflushed = 0
+        if self._log_records > max(2 * self._count, 100_000):
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the log with only the live entries (atomic rename)."""
+        tmp_path = f"{self.path}.compact"
+        with open(tmp_path, "wb") as tmp:
+            tmp.write(b"".join(_RECORD.pack(k, e) for k, e in self._live_ring_entries()))
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        self._log.close()
+        os.replace(tmp_path, self.path)
+        self._log = open(self.path, "ab")
+        self._log_records = self._count
+        self._unflushed = 0
+
+    def flush(self):
+        """Push buffered log records to the OS (e.g. before committing consumer offsets)."""
+        with self._lock:
+            if self._log is not None:
+                self._log.flush()
+                self._unflushed = 0
+
+    def close(self):
+        """Flush and close the log, snapshotting the pre-filter next to it."""
+        with self._lock:
+            if self._log is not None:
+                now = int(time.time())
+                self._expire(now)
+                self._log.flush()
+                self._log.close()
+                self._log = None
+                if self._filter is not None:
+                    self._filter.snapshot(self._filter_path, log_records=self._log_records,
+                                          snapshot_time=now)
+
+    # ---- set-like API ----
+
+    def __contains__(self, order_id: str) -> bool:
+        key = hash_key(order_id)
+        with self._lock:
+            found = self._contains(key, int(time.time()))
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return found
+
+    def add(self, order_id: str):
+        key = hash_key(order_id)
+        with self._lock:
+            self._add(key, int(time.time()))
+
+    def check_and_add(self, order_id: str) -> bool:
+        """Atomically record order_id; True if it was not already present."""
+        key = hash_key(order_id)
+        with self._lock:
+            now = int(time.time())
+            if self._contains(key, now):
+                self.hits += 1
+                return False
+            self.misses += 1
+            self._add(key, now)
+            return True
+
+    def discard(self, order_id: str):
+        key = hash_key(order_id)
+        with self._lock:
+            slot = self._find(key)
+            if slot >= 0:
+                self._table_delete(slot)
+                self._append(key, _TOMBSTONE)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def stats(self) -> dict:
+        return {
+            "entries": self._count,
+            "capacity": self.capacity,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "memory_bytes": (self._table_keys.itemsize * len(self._table_keys)
+                             + self._table_expiry.itemsize * len(self._table_expiry)
+                             + self._ring_keys.itemsize * len(self._ring_keys)
+                             + self._ring_expiry.itemsize * len(self._ring_expiry)),
+            "log_records": self._log_records,
+            "warm_start_seconds": round(self.warm_start_seconds, 4),
+            "prefilter": self.prefilter_stats(),
+        }
+
+    def prefilter_stats(self) -> dict | None:
+        if self._filter is None:
+            return None
+        negatives = self.prefilter_negatives + self.false_positives
+        return {
+            **self._filter.stats(),
+            "restored": self.filter_restored,
+            "skipped_lookups": self.prefilter_negatives,
+            "false_positives": self.false_positives,
+            "resizes": self.filter_resizes,
+            "observed_fp_rate": self.false_positives / negatives if negatives else 0.0,
+        }
+
+
+def store_from_env(default_path: str | None = None) -> IdempotencyStore:
+    """Build a store from the IDEMPOTENCY_* environment variables."""
+    return IdempotencyStore(
+        capacity=int(os.getenv("IDEMPOTENCY_CAPACITY", "1000000")),
+        ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(7 * 24 * 3600))),
+        path=os.getenv("IDEMPOTENCY_LOG_PATH", default_path) or None,
+        flush_every=int(os.getenv("IDEMPOTENCY_FLUSH_EVERY", "1")),
+        prefilter=os.getenv("IDEMPOTENCY_PREFILTER", "false").lower() == "true",
+    )
@@ -0,0 +1,80 @@
+"""
+common/metrics.py
+
+Minimal thread-safe metric primitives for the services' JSON /metrics
+endpoints. No external metrics library is required.
+
+- Histogram: fixed upper bounds (Prometheus-style cumulative buckets) plus
+  count, sum, max and bucket-interpolated percentiles
+- exponential_buckets(start, factor, count): bucket bounds for latencies/sizes
+
+Usage:
+    from common.metrics import Histogram, exponential_buckets
+
+    produce_wait_ms = Histogram(exponential_buckets(0.1, 2, 16))
+    produce_wait_ms.observe(3.2)
+    produce_wait_ms.snapshot()
+    # {"count": 1, "sum": 3.2, "max": 3.2, "p50": ..., "buckets": {"0.1": 0, ..., "+Inf": 1}}
+"""
+
+import bisect
+import math
+import threading
+
+
+def exponential_buckets(start: float, factor: float, count: int) -> list[float]:
+    """[start, start*factor, start*factor^2, ...] with `count` bounds."""
+    return [start * factor ** i for i in range(count)]
+
+
+class Histogram:
+    def __init__(self, bounds: list[float]):
+        self.bounds = sorted(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)   # last bucket is +Inf
+        self._lock = threading.Lock()
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, q: float) -> float:
+        """Estimate the q-th percentile (0-100) by interpolating inside its bucket."""
+        with self._lock:
+            counts, total, largest = list(self._counts), self.count, self.max
+        if total == 0:
+            return 0.0
+        rank = q / 100.0 * total
+        seen = 0
+        for index, n in enumerate(counts):
+            if n and seen + n >= rank:
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else largest
+                return min(lower + (upper - lower) * (rank - seen) / n, largest)
+            seen += n
+        return largest
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts, total, value_sum, largest = list(self._counts), self.count, self.sum, self.max
+        cumulative = 0
+        buckets = {}
+        for bound, n in zip(self.bounds + [math.inf], counts):
+            cumulative += n
+            buckets["+Inf" if bound == math.inf else f"{bound:g}"] = cumulative
+        return {
+            "count": total,
+            "sum": round(value_sum, 3),
+            "max": round(largest, 3),
+            "p50": round(self.percentile(50), 3),
+            "p95": round(self.percentile(95), 3),
+            "p99": round(self.percentile(99), 3),
+            "buckets": buckets,
+        }
@@ -0,0 +1,315 @@
+"""
+common/serialization.py
+
+Pluggable event serializers for the Kafka and RabbitMQ parts. Consumers
+auto-detect the format, so producers can switch formats without a
+coordinated rollout.
+
+Formats:
+- "json"   (application/json): the original `json.dumps` encoding
+- "struct" (application/x-event-struct): compact schema-based binary
+    magic 0xB1 | version | (field tag, value)*
+  Field names become 1-byte tags from FIELDS. Event types become a 1-byte
+  enum. UUIDs take 16 bytes. ISO timestamps become int64 epoch milliseconds.
+  Strings and counts are varint-prefixed. An event with a field or value the
+  schema cannot represent is written as JSON instead, so encoding never
+  loses data.
+
+Detection: the transport's content type when present (Kafka header
+`content-type`, AMQP `content_type`). Otherwise the first byte: 0xB1 is
+struct, anything else is JSON.
+
+Note that struct timestamps are decoded as UTC ISO strings with millisecond
+precision ("2026-01-01T12:00:00.123+00:00").
+
+Usage:
+    from common.serialization import decode_event, serializer_from_env
+
+    serializer = serializer_from_env()                # EVENT_FORMAT=json|struct
+    payload = serializer.encode(event)
+    headers = [("content-type", serializer.content_type)]
+    event = decode_event(payload, content_type)       # content_type may be None
+"""
+
+import json
+import os
+import struct
+from datetime import datetime, timezone
+
+MAGIC = 0xB1
+VERSION = 1
+
+_INT64 = struct.Struct("<q")
+
+# event types known to every part; index is the wire value
+EVENT_TYPES = ["OrderPlaced", "InventoryReserved", "InventoryFailed"]
+_EVENT_TYPE_IDS = {name: i for i, name in enumerate(EVENT_TYPES)}
+
+# field name -> (tag, kind). Tags are part of the wire format: append, never reuse.
+FIELDS = {
+    # streaming-kafka (camelCase)
+    "eventId": (1, "id"),
+    "eventType": (2, "event_type"),
+    "orderId": (3, "id"),
+    "items": (4, "items"),
+    "createdAt": (5, "ts"),
+    "reservedAt": (6, "ts"),
+    "reason": (7, "str"),
+    "shortages": (8, "counts"),
+    "restaurantId": (9, "str"),
+    # async-rabbitmq (snake_case)
+    "event_type": (16, "event_type"),
+    "order_id": (17, "id"),
+    "user_id": (18, "str"),
+    "restaurant_id": (19, "str"),
+    "ts": (20, "ts"),
+}
+
+
+class _Unencodable(Exception):
+    """The event does not fit the struct schema; fall back to JSON."""
+
+
+# ---- primitives ----
+
+def _write_varint(out: bytearray, value: int):
+    if value < 0:
+        raise _Unencodable(value)
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _write_str(out: bytearray, value):
+    if not isinstance(value, str):
+        raise _Unencodable(value)
+    raw = value.encode()
+    _write_varint(out, len(raw))
+    out += raw
+
+
+def _read_str(data: bytes, pos: int) -> tuple[str, int]:
+    length, pos = _read_varint(data, pos)
+    return data[pos:pos + length].decode(), pos + length
+
+
+def _write_qty(out: bytearray, value):
+    if type(value) is not int:
+        raise _Unencodable(value)
+    _write_varint(out, value)
+
+
+# ---- field kinds: one encoder and one decoder per kind ----
+
+def _encode_str(out: bytearray, value):
+    _write_str(out, value)
+
+
+def _encode_id(out: bytearray, value):
+    # canonical (lower-case, hyphenated) UUID strings in 16 bytes, anything else as a string
+    if isinstance(value, str) and len(value) == 36 and value[8] == value[13] == value[18] == value[23] == "-":
+        try:
+            raw = bytes.fromhex(value.replace("-", ""))
+        except ValueError:
+            raw = None
+        if raw is not None and value == value.lower():
+            out.append(0)
+            out += raw
+            return
+    out.append(1)
+    _write_str(out, value)
+
+
+def _encode_event_type(out: bytearray, value):
+    try:
+        out.append(_EVENT_TYPE_IDS[value])
+    except (KeyError, TypeError):
+        raise _Unencodable(value)
+
+
+def _encode_ts(out: bytearray, value):
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (ValueError, AttributeError):
+        raise _Unencodable(value)
+    if dt.tzinfo is None:
+        raise _Unencodable(value)
+    out += _INT64.pack(round(dt.timestamp() * 1000))
+
+
+def _encode_items(out: bytearray, value):
+    if not isinstance(value, list):
+        raise _Unencodable(value)
+    _write_varint(out, len(value))
+    for item in value:
+        if not isinstance(item, dict) or item.keys() != {"sku", "qty"}:
+            raise _Unencodable(item)
+        _write_str(out, item["sku"])
+        _write_qty(out, item["qty"])
+
+
+def _encode_counts(out: bytearray, value):
+    if not isinstance(value, dict):
+        raise _Unencodable(value)
+    _write_varint(out, len(value))
+    for key, count in value.items():
+        _write_str(out, key)
+        _write_qty(out, count)
+
+
+def _decode_id(data: bytes, pos: int):
+    if data[pos] == 0:
+        h = data[pos + 1:pos + 17].hex()
+        return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}", pos + 17
+    return _read_str(data, pos + 1)
+
+
+def _decode_event_type(data: bytes, pos: int):
+    return EVENT_TYPES[data[pos]], pos + 1
+
+
+_last_second = [None, ""]   # events arrive in time order: cache the formatted second
+
+
+def _decode_ts(data: bytes, pos: int):
+    (millis,) = _INT64.unpack_from(data, pos)
+    seconds, ms = divmod(millis, 1000)
+    cached_second, prefix = _last_second
+    if seconds != cached_second:
+        prefix = datetime.fromtimestamp(seconds, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        _last_second[:] = [seconds, prefix]
+    return f"{prefix}.{ms:03d}+00:00", pos + 8
+
+
+def _decode_items(data: bytes, pos: int):
+    count, pos = _read_varint(data, pos)
+    items = []
+    for _ in range(count):
+        sku, pos = _read_str(data, pos)
+        qty, pos = _read_varint(data, pos)
+        items.append({"sku": sku, "qty": qty})
+    return items, pos
+
+
+def _decode_counts(data: bytes, pos: int):
+    count, pos = _read_varint(data, pos)
+    counts = {}
+    for _ in range(count):
+        key, pos = _read_str(data, pos)
+        counts[key], pos = _read_varint(data, pos)
+    return counts, pos
+
+
+_KINDS = {
+    "str": (_encode_str, _read_str),
+    "id": (_encode_id, _decode_id),
+    "event_type": (_encode_event_type, _decode_event_type),
+    "ts": (_encode_ts, _decode_ts),
+    "items": (_encode_items, _decode_items),
+    "counts": (_encode_counts, _decode_counts),
+}
+# resolved once: name -> (tag, encoder) and tag -> (name, decoder)
+_ENCODERS = {name: (tag, _KINDS[kind][0]) for name, (tag, kind) in FIELDS.items()}
+_DECODERS = {tag: (name, _KINDS[kind][1]) for name, (tag, kind) in FIELDS.items()}
+
+
+# ---- serializers ----
+
+class JsonSerializer:
+    name = "json"
+    content_type = "application/json"
+
+    def encode(self, event: dict) -> bytes:
+        return json.dumps(event).encode()
+
+    def decode(self, payload: bytes) -> dict:
+        return json.loads(payload)
+
+
+class StructSerializer:
+    name = "struct"
+    content_type = "application/x-event-struct"
+
+    def encode(self, event: dict) -> bytes:
+        out = bytearray((MAGIC, VERSION))
+        try:
+            for name, value in event.items():
+                if value is None:
+                    raise _Unencodable(name)
+                tag, encode = _ENCODERS[name]
+                out.append(tag)
+                encode(out, value)
+        except (_Unencodable, KeyError):
+            return JSON.encode(event)
+        return bytes(out)
+
+    def decode(self, payload: bytes) -> dict:
+        if len(payload) < 2 or payload[0] != MAGIC:
+            raise ValueError("not a struct-encoded event")
+        if payload[1] != VERSION:
+            raise ValueError(f"unsupported struct event version {payload[1]}")
+        event = {}
+        pos, end = 2, len(payload)
+        try:
+            while pos < end:
+                name, decode = _DECODERS[payload[pos]]
+                event[name], pos = decode(payload, pos + 1)
+        except (KeyError, IndexError, struct.error, UnicodeDecodeError) as e:
+            raise ValueError(f"corrupt struct event at byte {pos}: {e!r}") from e
+        return event
+
+
+JSON = JsonSerializer()
+STRUCT = StructSerializer()
+SERIALIZERS = {s.name: s for s in (JSON, STRUCT)}
+_BY_CONTENT_TYPE = {s.content_type: s for s in (JSON, STRUCT)}
+
+
+def get_serializer(name: str):
+    try:
+        return SERIALIZERS[name]
+    except KeyError:
+        raise ValueError(f"unknown event format {name!r}, expected one of {sorted(SERIALIZERS)}") from None
+
+
+def serializer_from_env():
+    return get_serializer(os.getenv("EVENT_FORMAT", "json"))
+
+
+def decode_event(payload: bytes, content_type: str | bytes | None = None) -> dict:
+    """Decode an event in any supported format. Raises ValueError if it is not decodable.
+
+    The content type only selects the decoder when it agrees with the payload:
+    a struct serializer falls back to JSON per event, so the first byte has the
+    final say.
+    """
+    if isinstance(content_type, bytes):
+        content_type = content_type.decode(errors="replace")
+    if payload[:1] == bytes((MAGIC,)):
+        return STRUCT.decode(payload)
+    if content_type and content_type not in _BY_CONTENT_TYPE:
+        raise ValueError(f"unsupported content type {content_type!r}")
+    try:
+        return JSON.decode(payload)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"malformed JSON event: {e}") from e
+
+
+def header_value(headers, name: str = "content-type") -> bytes | None:
+    """Look up a header in confluent-kafka's list of (key, value) tuples."""
+    for key, value in headers or ():
+        if key == name:
+            return value
+    return None
@@ -0,0 +1,212 @@
+"""
+common/stock_ledger.py
+
+In-process stock ledger shared by the inventory services of all three parts.
+Tracks available and reserved units per SKU and reserves/releases all items of
+an order atomically.
+
+Concurrency model:
+- Every SKU has its own lock, so reservations touching different SKUs never
+  wait on each other.
+- A multi-item reservation takes its SKU locks in sorted order, which keeps
+  concurrent multi-item reservations deadlock free.
+- Reservations are recorded per order ID (under a lock striped by order ID),
+  so reserving the same order twice is a no-op. Retries and redeliveries are
+  therefore safe.
+
+Bounded: a reservation that is neither committed nor released is committed
+automatically after `retention_seconds`, or once `max_reservations` orders
+are held (oldest first). Its units stay consumed, and its order ID is
+forgotten, so a retry of that order after this point reserves again. The
+retention must therefore cover the callers' retry and redelivery window.
+
+Usage:
+    from common.stock_ledger import StockLedger
+
+    ledger = StockLedger(default_available=1000)
+    result = ledger.reserve("o-3f2a1b4c", [{"sku": "burrito", "qty": 2}])
+    if not result.ok:
+        print(result.shortages)     # {"burrito": 1}  (units missing)
+    ledger.release("o-3f2a1b4c")
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+
+class ReservationResult(NamedTuple):
+    ok: bool
+    order_id: str
+    items: dict           # sku -> qty requested (duplicates merged)
+    shortages: dict       # sku -> units missing, empty when ok
+    duplicate: bool = False
+
+
+class _SkuStock:
+    __slots__ = ("available", "reserved", "lock")
+
+    def __init__(self, available: int):
+        self.available = available
+        self.reserved = 0
+        self.lock = threading.Lock()
+
+
+def _merge_items(items) -> dict:
+    """Normalise [{"sku": s, "qty": q}, ...] or [(s, q), ...] into {sku: total_qty}.
+
+    Raises ValueError or TypeError for a malformed item (no sku, a negative or non-integer qty)."""
+    merged: dict = {}
+    for item in items:
+        if isinstance(item, dict):
+            sku, qty = item.get("sku"), item.get("qty", 1)
+        else:
+            sku, qty = item
+        if isinstance(qty, bool) or (isinstance(qty, float) and not qty.is_integer()):
+            raise ValueError(f"invalid quantity in item: {item!r}")
+        qty = int(qty)
+        if sku is None or qty < 0:
+            raise ValueError(f"invalid item: {item!r}")
+        merged[sku] = merged.get(sku, 0) + qty
+    return merged
+
+
+class StockLedger:
+    """SKU -> available/reserved counts with atomic multi-item reserve and release."""
+
+    def __init__(self, initial_stock: dict | None = None, default_available: int = 0,
+                 order_stripes: int = 64, retention_seconds: float = 3600.0,
+                 max_reservations: int = 100_000):
+        self.default_available = default_available
+        self.retention = retention_seconds
+        self.max_reservations = max(max_reservations, 1)
+        self.expired = 0
+        self._skus: dict = {}
+        self._reservations: dict = {}
+        self._order_locks = [threading.Lock() for _ in range(order_stripes)]
+        # order ID -> expiry, in reservation order; the head is always the next to expire
+        self._held: OrderedDict = OrderedDict()
+        self._held_lock = threading.Lock()
+        for sku, qty in (initial_stock or {}).items():
+            self._skus[sku] = _SkuStock(int(qty))
+
+    def _stock(self, sku: str) -> _SkuStock:
+        stock = self._skus.get(sku)
+        if stock is None:
+            # setdefault is atomic, so two threads seeing a new SKU agree on one entry
+            stock = self._skus.setdefault(sku, _SkuStock(self.default_available))
+        return stock
+
+    def _order_lock(self, order_id: str) -> threading.Lock:
+        return self._order_locks[hash(order_id) % len(self._order_locks)]
+
+    def _expire(self):
+        """Commit reservations past their retention, and the oldest ones beyond max_reservations."""
+        now = time.monotonic()
+        while True:
+            with self._held_lock:
+                if not self._held:
+                    return
+                order_id, expiry = next(iter(self._held.items()))
+                if expiry > now and len(self._held) <= self.max_reservations:
+                    return
+                del self._held[order_id]
+            # settled outside _held_lock: _settle takes the order lock first, then _held_lock
+            if self._settle(order_id, return_to_stock=False):
+                self.expired += 1
+
+    def reserve(self, order_id: str, items) -> ReservationResult:
+        """Reserve every item of an order, or nothing if any SKU is short."""
+        wanted = _merge_items(items)
+        self._expire()
+        with self._order_lock(order_id):
+            existing = self._reservations.get(order_id)
+            if existing is not None:
+                return ReservationResult(True, order_id, dict(existing), {}, duplicate=True)
+
+            skus = sorted(wanted)
+            stocks = [self._stock(sku) for sku in skus]
+            for stock in stocks:
+                stock.lock.acquire()
+            try:
+                shortages = {
+                    sku: wanted[sku] - stock.available
+                    for sku, stock in zip(skus, stocks)
+                    if stock.available < wanted[sku]
+                }
+                if shortages:
+                    return ReservationResult(False, order_id, wanted, shortages)
+                for sku, stock in zip(skus, stocks):
+                    stock.available -= wanted[sku]
+                    stock.reserved += wanted[sku]
+            finally:
+                for stock in reversed(stocks):
+                    stock.lock.release()
+
+            self._reservations[order_id] = wanted
+            with self._held_lock:
+                self._held[order_id] = time.monotonic() + self.retention
+            return ReservationResult(True, order_id, wanted, {})
+
+    def _settle(self, order_id: str, return_to_stock: bool) -> bool:
+        with self._order_lock(order_id):
+            held = self._reservations.pop(order_id, None)
+            if held is None:
+                return False
+            with self._held_lock:
+                self._held.pop(order_id, None)
+            skus = sorted(held)
+            stocks = [self._stock(sku) for sku in skus]
+            for stock in stocks:
+                stock.lock.acquire()
+            try:
+                for sku, stock in zip(skus, stocks):
+                    stock.reserved -= held[sku]
+                    if return_to_stock:
+                        stock.available += held[sku]
+            finally:
+                for stock in reversed(stocks):
+                    stock.lock.release()
+            return True
+
+    def release(self, order_id: str) -> bool:
+        """Return an order's reserved units to available stock. False if nothing was held."""
+        return self._settle(order_id, return_to_stock=True)
+
+    def commit(self, order_id: str) -> bool:
+        """Consume an order's reserved units (e.g. once it is fulfilled)."""
+        return self._settle(order_id, return_to_stock=False)
+
+    def restock(self, sku: str, qty: int):
+        stock = self._stock(sku)
+        with stock.lock:
+            stock.available += int(qty)
+
+    def level(self, sku: str) -> dict:
+        stock = self._stock(sku)
+        with stock.lock:
+            return {"available": stock.available, "reserved": stock.reserved}
+
+    def is_reserved(self, order_id: str) -> bool:
+        return order_id in self._reservations
+
+    def __len__(self) -> int:
+        """Number of orders currently holding a reservation."""
+        return len(self._reservations)
+
+    def snapshot(self) -> dict:
+        """{sku: {"available": n, "reserved": n}} for every SKU seen so far."""
+        return {sku: self.level(sku) for sku in list(self._skus)}
+
+
+def parse_initial_stock(raw: str) -> dict:
+    """Parse "sku=qty,sku=qty" (e.g. from an env var) into {sku: qty}."""
+    stock = {}
+    for entry in raw.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        sku, _, qty = entry.partition("=")
+        stock[sku.strip()] = int(qty)
+    return stock
@@ -0,0 +1,125 @@
+"""
+Tests for common/idempotency.py and common/cuckoo_filter.py.
+
+Usage (from the repository root):
+    python -m pytest common/tests
+"""
+
+import os
+import sys
+from collections import deque
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, REPO_ROOT)
+
+from common.cuckoo_filter import CuckooFilter  # noqa: E402
+from common.idempotency import IdempotencyStore, hash_key  # noqa: E402
+
+
+class TestCuckooFilter:
+    def test_add_contains_delete(self):
+        f = CuckooFilter(capacity=1000)
+        keys = [hash_key(f"o-{i}") for i in range(900)]
+        assert all(f.add(key) for key in keys)
+        assert all(f.contains(key) for key in keys)
+        for key in keys[:450]:
+            assert f.delete(key)
+        assert all(f.contains(key) for key in keys[450:])
+        assert f.count == 450
+
+    def test_add_fails_once_full(self):
+        f = CuckooFilter(num_buckets=2)
+        results = [f.add(hash_key(f"o-{i}")) for i in range(32)]
+        assert f.full
+        assert results[-1] is False
+
+    def test_snapshot_round_trip(self, tmp_path):
+        f = CuckooFilter(capacity=1000)
+        keys = [hash_key(f"o-{i}") for i in range(500)]
+        for key in keys:
+            f.add(key)
+        path = str(tmp_path / "filter")
+        f.snapshot(path, log_records=500)
+        restored, meta = CuckooFilter.restore(path)
+        assert meta == {"log_records": 500}
+        assert restored.count == 500
+        assert all(restored.contains(key) for key in keys)
+
+
+class TestIdempotencyStore:
+    def test_check_and_add(self):
+        store = IdempotencyStore(capacity=100)
+        assert store.check_and_add("o-1")
+        assert not store.check_and_add("o-1")
+        assert "o-1" in store
+        store.discard("o-1")
+        assert "o-1" not in store
+
+    def test_capacity_evicts_oldest(self):
+        store = IdempotencyStore(capacity=10)
+        for i in range(25):
+            store.add(f"o-{i}")
+        assert len(store) == 10
+        assert "o-14" not in store
+        assert all(f"o-{i}" in store for i in range(15, 25))
+
+    def test_ttl_expires(self, monkeypatch):
+        import common.idempotency as idempotency
+        now = [1_000_000.0]
+        monkeypatch.setattr(idempotency.time, "time", lambda: now[0])
+        store = IdempotencyStore(capacity=100, ttl_seconds=60)
+        store.add("o-1")
+        now[0] += 30
+        store.add("o-2")
+        now[0] += 31
+        assert "o-1" not in store
+        assert "o-2" in store
+
+    def test_warm_start_from_log(self, tmp_path):
+        path = str(tmp_path / "processed.idx")
+        store = IdempotencyStore(capacity=1000, path=path, prefilter=True)
+        for i in range(500):
+            store.add(f"o-{i}")
+        store.discard("o-7")
+        store.close()
+
+        reopened = IdempotencyStore(capacity=1000, path=path, prefilter=True)
+        assert reopened.filter_restored
+        assert len(reopened) == 499
+        assert "o-7" not in reopened
+        assert all(f"o-{i}" in reopened for i in range(500) if i != 7)
+        reopened.close()
+
+    def test_prefilter_keeps_keys_added_while_full(self):
+        # capacity 7 gives a 2-bucket filter; pick IDs whose two candidate
+        # buckets are both bucket 0, so the fifth one fills it
+        store = IdempotencyStore(capacity=7, prefilter=True)
+        probe = store._filter
+
+        def bucket_zero_only(order_id):
+            fingerprint, index = probe._fingerprint_and_index(hash_key(order_id))
+            return index == 0 and probe._alt_index(index, fingerprint) == 0
+
+        ids = [order_id for order_id in (f"o-{i}" for i in range(10_000)) if bucket_zero_only(order_id)][:6]
+        for order_id in ids[:5]:
+            store.add(order_id)
+        assert store._filter.full
+        store.add(ids[5])                       # added while the filter is full
+        store.discard(ids[0])                   # frees a slot, so the filter is no longer full
+        assert not store._filter.full
+        assert all(order_id in store for order_id in ids[1:])
+        assert not store.check_and_add(ids[5])
+
+    def test_prefilter_has_no_false_negatives_under_churn(self):
+        store = IdempotencyStore(capacity=7, prefilter=True)
+        live = deque(maxlen=7)
+        reported_new = 0
+        for i in range(60_000):
+            order_id = f"o-{i}"
+            store.add(order_id)
+            live.append(order_id)
+            if i % 7 == 0 and len(live) > 1:
+                store.discard(live.popleft())
+            if i % 5 == 0:
+                reported_new += sum(store.check_and_add(seen) for seen in live)
+        assert reported_new == 0
@@ -0,0 +1,89 @@
+"""
+Tests for common/serialization.py.
+
+Usage (from the repository root):
+    python -m pytest common/tests/test_serialization.py
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, REPO_ROOT)
+
+from common.serialization import (JSON, MAGIC, STRUCT, decode_event, get_serializer,  # noqa: E402
+                                  header_value)
+
+ORDER_PLACED = {
+    "eventId": "6f1c2a9e-0b7d-4c8e-9a41-3d2f5e6a7b8c",
+    "eventType": "OrderPlaced",
+    "orderId": "load-000042",
+    "createdAt": "2026-01-01T12:00:00.123+00:00",
+    "restaurantId": "r-7",
+    "items": [{"sku": "burrito", "qty": 2}, {"sku": "taco", "qty": 1}],
+}
+INVENTORY_FAILED = {
+    "event_type": "InventoryFailed",
+    "order_id": "0d9e8f7a-6b5c-4d3e-8f2a-1b0c9d8e7f6a",
+    "reason": "insufficient_stock",
+    "shortages": {"burrito": 3},
+    "ts": "2026-01-01T12:00:01.000+00:00",
+}
+
+
+class TestRoundTrip:
+    @pytest.mark.parametrize("event", [ORDER_PLACED, INVENTORY_FAILED])
+    @pytest.mark.parametrize("serializer", [JSON, STRUCT])
+    def test_round_trip(self, serializer, event):
+        assert serializer.decode(serializer.encode(event)) == event
+
+    def test_struct_is_smaller_than_json(self):
+        assert len(STRUCT.encode(ORDER_PLACED)) < len(JSON.encode(ORDER_PLACED)) / 2
+
+    def test_struct_timestamps_come_back_as_utc_milliseconds(self):
+        event = {"eventType": "OrderPlaced", "createdAt": "2026-01-01T13:00:00.5+01:00"}
+        assert STRUCT.decode(STRUCT.encode(event))["createdAt"] == "2026-01-01T12:00:00.500+00:00"
+
+    @pytest.mark.parametrize("event", [
+        {**ORDER_PLACED, "coupon": "FREE"},                           # field not in the schema
+        {**ORDER_PLACED, "eventType": "OrderCancelled"},              # unknown event type
+        {**ORDER_PLACED, "createdAt": "yesterday"},                   # not a timestamp
+        {**ORDER_PLACED, "items": [{"sku": "burrito", "qty": 1, "note": "extra salsa"}]},
+    ])
+    def test_unencodable_events_fall_back_to_json(self, event):
+        payload = STRUCT.encode(event)
+        assert payload[0] != MAGIC
+        assert json.loads(payload) == event
+
+
+class TestAutoDetect:
+    @pytest.mark.parametrize("serializer", [JSON, STRUCT])
+    @pytest.mark.parametrize("with_content_type", [True, False])
+    def test_decode_event_detects_the_format(self, serializer, with_content_type):
+        content_type = serializer.content_type.encode() if with_content_type else None
+        assert decode_event(serializer.encode(ORDER_PLACED), content_type) == ORDER_PLACED
+
+    def test_struct_fallback_labelled_struct_decodes_as_json(self):
+        event = {**ORDER_PLACED, "coupon": "FREE"}
+        assert decode_event(STRUCT.encode(event), STRUCT.content_type) == event
+
+    def test_unknown_content_type_is_rejected(self):
+        with pytest.raises(ValueError):
+            decode_event(JSON.encode(ORDER_PLACED), "application/avro")
+
+    @pytest.mark.parametrize("payload", [b"{not json", bytes((MAGIC, 99, 1)), bytes((MAGIC, 1, 3, 1, 200))])
+    def test_malformed_payloads_raise_value_error(self, payload):
+        with pytest.raises(ValueError):
+            decode_event(payload)
+
+    def test_header_value(self):
+        headers = [("trace-id", b"abc"), ("content-type", b"application/x-event-struct")]
+        assert header_value(headers) == b"application/x-event-struct"
+        assert header_value(None) is None
+
+    def test_unknown_format_name(self):
+        with pytest.raises(ValueError):
+            get_serializer("avro")
@@ -0,0 +1,144 @@
+"""
+Tests for common/stock_ledger.py.
+
+Usage (from the repository root):
+    python -m pytest common/tests/test_stock_ledger.py
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, REPO_ROOT)
+
+from common import stock_ledger  # noqa: E402
+from common.stock_ledger import StockLedger  # noqa: E402
+
+
+def run_threads(target, count: int):
+    start = threading.Barrier(count)
+
+    def worker(index):
+        start.wait()
+        target(index)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class TestReserve:
+    def test_all_or_nothing(self):
+        ledger = StockLedger({"burrito": 5, "taco": 1})
+        result = ledger.reserve("o-1", [{"sku": "burrito", "qty": 2}, {"sku": "taco", "qty": 2}])
+        assert not result.ok
+        assert result.shortages == {"taco": 1}
+        assert ledger.snapshot() == {"burrito": {"available": 5, "reserved": 0},
+                                     "taco": {"available": 1, "reserved": 0}}
+
+    def test_same_order_twice_is_a_duplicate(self):
+        ledger = StockLedger({"burrito": 5})
+        assert ledger.reserve("o-1", [("burrito", 2)]).ok
+        again = ledger.reserve("o-1", [("burrito", 2)])
+        assert again.ok and again.duplicate
+        assert ledger.level("burrito") == {"available": 3, "reserved": 2}
+
+    @pytest.mark.parametrize("items", [
+        [{"qty": 1}], [{"sku": "burrito", "qty": -1}], [{"sku": "burrito", "qty": "two"}],
+        [{"sku": "burrito", "qty": 1.5}], [{"sku": "burrito", "qty": None}], ["burrito"],
+    ])
+    def test_malformed_items_are_rejected_without_reserving(self, items):
+        ledger = StockLedger({"burrito": 5})
+        with pytest.raises((TypeError, ValueError)):
+            ledger.reserve("o-1", items)
+        assert not ledger.is_reserved("o-1")
+        assert ledger.level("burrito") == {"available": 5, "reserved": 0}
+
+    def test_release_and_commit(self):
+        ledger = StockLedger({"burrito": 5})
+        ledger.reserve("o-1", [("burrito", 2)])
+        ledger.reserve("o-2", [("burrito", 1)])
+        assert ledger.release("o-1")
+        assert ledger.commit("o-2")
+        assert not ledger.release("o-1")
+        assert ledger.level("burrito") == {"available": 4, "reserved": 0}
+
+
+class TestConcurrency:
+    def test_stock_is_never_oversold(self):
+        ledger = StockLedger({"burrito": 100, "taco": 100})
+        ok = []
+
+        def reserve(index):
+            for n in range(50):
+                # half the threads list the SKUs in the other order
+                items = [("burrito", 1), ("taco", 1)] if index % 2 else [("taco", 1), ("burrito", 1)]
+                if ledger.reserve(f"o-{index}-{n}", items).ok:
+                    ok.append(1)
+
+        run_threads(reserve, 8)
+        assert len(ok) == 100
+        for sku in ("burrito", "taco"):
+            assert ledger.level(sku) == {"available": 0, "reserved": 100}
+
+    def test_concurrent_retries_of_one_order_reserve_once(self):
+        ledger = StockLedger({"burrito": 100})
+        results = []
+        run_threads(lambda index: results.append(ledger.reserve("o-1", [("burrito", 3)])), 16)
+        assert sum(not r.duplicate for r in results) == 1
+        assert all(r.ok for r in results)
+        assert ledger.level("burrito") == {"available": 97, "reserved": 3}
+
+    def test_concurrent_reserve_and_release_balance(self):
+        ledger = StockLedger({"burrito": 1000})
+
+        def cycle(index):
+            for n in range(200):
+                order_id = f"o-{index}-{n}"
+                ledger.reserve(order_id, [("burrito", 1)])
+                ledger.release(order_id)
+
+        run_threads(cycle, 8)
+        assert ledger.level("burrito") == {"available": 1000, "reserved": 0}
+        assert len(ledger) == 0
+
+
+class TestBounds:
+    def test_oldest_reservations_are_committed_beyond_the_limit(self):
+        ledger = StockLedger({"burrito": 100}, max_reservations=10)
+        for n in range(25):
+            ledger.reserve(f"o-{n}", [("burrito", 1)])
+        assert len(ledger) <= 11
+        assert not ledger.is_reserved("o-0")
+        assert ledger.is_reserved("o-24")
+        assert ledger.expired == 25 - len(ledger)
+        level = ledger.level("burrito")
+        assert level["available"] == 75
+        assert level["reserved"] == len(ledger)
+
+    def test_reservations_are_committed_after_retention(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(stock_ledger.time, "monotonic", lambda: now[0])
+        ledger = StockLedger({"burrito": 10}, retention_seconds=60)
+        ledger.reserve("o-1", [("burrito", 2)])
+        now[0] += 30
+        ledger.reserve("o-2", [("burrito", 1)])
+        now[0] += 31
+        ledger.reserve("o-3", [("burrito", 1)])
+        assert not ledger.is_reserved("o-1")
+        assert ledger.is_reserved("o-2")
+        assert ledger.level("burrito") == {"available": 6, "reserved": 2}
+
+    def test_settled_orders_leave_the_expiry_ring(self):
+        ledger = StockLedger({"burrito": 10}, max_reservations=2)
+        ledger.reserve("o-1", [("burrito", 1)])
+        ledger.release("o-1")
+        ledger.reserve("o-2", [("burrito", 1)])
+        ledger.reserve("o-3", [("burrito", 1)])
+        assert ledger.expired == 0
+        assert ledger.is_reserved("o-2") and ledger.is_reserved("o-3")
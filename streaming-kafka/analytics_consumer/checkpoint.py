@@ -0,0 +1,115 @@
+"""
+Local checkpoints of analytics_consumer state.
+
+A checkpoint is the metrics state (counters plus window engine) together
+with the consumer position (next offset) of every partition the state
+already covers. Restoring one and seeking each partition to its offset gives
+exactly the state a replay from offset 0 would have reached there. So a
+replay only has to re-read the messages after the checkpoint.
+
+Each checkpoint is a JSON file `ckpt-<id>.json` in one directory, written to
+a temp file and renamed into place so a crash never leaves a torn
+checkpoint. Only the newest `keep` files are retained.
+
+Usage:
+    store = CheckpointStore("/data/checkpoints", keep=20)
+    store.save(offsets, state)                 # offsets: {(topic, partition): next_offset}
+    checkpoint = store.latest()                # or store.get(id), store.before(epoch_minute)
+    checkpoint.offsets, checkpoint.state
+"""
+
+import json
+import logging
+import os
+import time
+from typing import NamedTuple
+
+logger = logging.getLogger("analytics_consumer")
+
+
+class Checkpoint(NamedTuple):
+    id: int
+    created_at: float                              # unix time
+    offsets: dict[tuple[str, int], int]            # (topic, partition) -> next offset to read
+    state: dict
+
+    def describe(self) -> dict:
+        return {
+            "id": self.id,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.created_at)),
+            "offsets": {f"{topic}-{partition}": offset for (topic, partition), offset in sorted(self.offsets.items())},
+        }
+
+
+class CheckpointStore:
+    def __init__(self, directory: str, keep: int = 20):
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, checkpoint_id: int) -> str:
+        return os.path.join(self.directory, f"ckpt-{checkpoint_id:010d}.json")
+
+    def ids(self) -> list[int]:
+        """Ids of the stored checkpoints, oldest first."""
+        ids = []
+        for name in os.listdir(self.directory):
+            if name.startswith("ckpt-") and name.endswith(".json"):
+                try:
+                    ids.append(int(name[5:-5]))
+                except ValueError:
+                    continue
+        return sorted(ids)
+
+    def save(self, offsets: dict[tuple[str, int], int], state: dict) -> Checkpoint:
+        ids = self.ids()
+        checkpoint = Checkpoint((ids[-1] + 1) if ids else 1, time.time(), dict(offsets), state)
+        record = {
+            "id": checkpoint.id,
+            "created_at": checkpoint.created_at,
+            "offsets": [[topic, partition, offset] for (topic, partition), offset in sorted(offsets.items())],
+            "state": state,
+        }
+        path = self._path(checkpoint.id)
+        with open(path + ".tmp", "w") as f:
+            json.dump(record, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+        for old in ids[:max(0, len(ids) + 1 - self.keep)]:
+            try:
+                os.remove(self._path(old))
+            except OSError:
+                pass
+        return checkpoint
+
+    def get(self, checkpoint_id: int) -> Checkpoint | None:
+        try:
+            with open(self._path(checkpoint_id)) as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Unreadable checkpoint %d: %s", checkpoint_id, e)
+            return None
+        offsets = {(topic, partition): offset for topic, partition, offset in record["offsets"]}
+        return Checkpoint(record["id"], record["created_at"], offsets, record["state"])
+
+    def latest(self) -> Checkpoint | None:
+        for checkpoint_id in reversed(self.ids()):
+            checkpoint = self.get(checkpoint_id)
+            if checkpoint is not None:
+                return checkpoint
+        return None
+
+    def before(self, minute: int) -> Checkpoint | None:
+        """Newest checkpoint that holds no event at or after epoch `minute`, so all of [minute, now) is recomputed."""
+        for checkpoint_id in reversed(self.ids()):
+            checkpoint = self.get(checkpoint_id)
+            if checkpoint is None:
+                continue
+            newest = checkpoint.state["windows"]["max_minute"]
+            if newest is None or newest < minute:
+                return checkpoint
+        return None
@@ -0,0 +1,75 @@
+"""
+Metrics state for analytics_consumer that readers can look at without
+blocking the consumer.
+
+ShardedCounters: named integer counters. Every writer thread gets its own
+list of slots, registered once under a lock; after that an increment is a
+plain list update with no lock. Readers sum the shards. A read is not an
+atomic cut across counters (total_reservations may already include an event
+that failed_reservations does not yet), but every counter is exact on its
+own and writers are never delayed.
+
+Published: a reference to an immutable value. The consumer thread replaces
+it, for example with a rendered copy of the windows every few hundred
+milliseconds, and readers take whatever was published last. Swapping a
+reference is atomic, so neither side ever waits.
+"""
+
+import threading
+import time
+
+
+class ShardedCounters:
+    def __init__(self, *names: str):
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self._shards: list[list[int]] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()   # only taken to register a new writer thread
+
+    def shard(self) -> list[int]:
+        """The calling thread's slots; index them with `self.index[name]` on hot paths."""
+        try:
+            return self._local.slots
+        except AttributeError:
+            slots = [0] * len(self.names)
+            with self._lock:
+                self._shards.append(slots)
+            self._local.slots = slots
+            return slots
+
+    def add(self, name: str, amount: int = 1):
+        self.shard()[self.index[name]] += amount
+
+    def snapshot(self) -> dict[str, int]:
+        shards = list(self._shards)
+        return {name: sum(slots[i] for slots in shards) for i, name in enumerate(self.names)}
+
+    def reset(self):
+        """Zero every shard. Call it from a writer while the other writers are idle (e.g. before a replay)."""
+        for slots in list(self._shards):
+            slots[:] = [0] * len(self.names)
+
+    def load(self, values: dict[str, int]):
+        """Reset, then credit `values` to the calling thread's shard (restoring a checkpoint)."""
+        self.reset()
+        slots = self.shard()
+        for name, value in values.items():
+            if name in self.index:
+                slots[self.index[name]] = value
+
+
+class Published:
+    """Latest value published by one writer, read without locks. `age()` says how stale it is."""
+
+    def __init__(self, value=None):
+        self._value = (value, time.monotonic())
+
+    def publish(self, value):
+        self._value = (value, time.monotonic())
+
+    def get(self):
+        return self._value[0]
+
+    def age(self) -> float:
+        return time.monotonic() - self._value[1]
@@ -0,0 +1,255 @@
+"""
+Order -> reservation latency for analytics_consumer.
+
+LatencyJoin pairs each OrderPlaced with the InventoryReserved or
+InventoryFailed for the same orderId. The latency is the result's
+createdAt minus the order's createdAt. The two topics are read
+independently, so either side may arrive first. Unmatched sides wait in
+insertion-ordered dicts. They are dropped when they fall more than `ttl`
+behind the newest event time seen, or when more than `max_pending` are
+waiting (oldest first). So the join state is bounded.
+
+Matched latencies go into a LatencySketch for the result's event-time
+minute. The sketch is log-linear (HDR-style): exact below 128 µs, then 64
+sub-buckets per power of two, so a quantile is within ~1.6% of the true
+value. Sketches merge by adding bucket counts, which is how the 1m / 5m /
+1h windows are built from the per-minute ones.
+
+Replays do not stream through the join. A replay collects the createdAt of
+every order and result it reads and hands the complete maps to rebuild().
+So the outcome does not depend on how the two topics' partitions happened
+to interleave, and a sequential and a partition-parallel replay of the same
+log give the same sketches.
+"""
+
+from collections import deque
+
+SUB_BUCKETS = 64          # per power of two: relative error <= 1 / SUB_BUCKETS
+_LINEAR = 2 * SUB_BUCKETS  # values below this (µs) get their own bucket
+
+
+def _index(value_us: int) -> int:
+    if value_us < _LINEAR:
+        return value_us
+    shift = value_us.bit_length() - 7
+    return _LINEAR + (shift - 1) * SUB_BUCKETS + ((value_us >> shift) - SUB_BUCKETS)
+
+
+def _lower_bound(index: int) -> int:
+    if index < _LINEAR:
+        return index
+    shift, sub = divmod(index - _LINEAR, SUB_BUCKETS)
+    return (SUB_BUCKETS + sub) << (shift + 1)
+
+
+class LatencySketch:
+    """Mergeable log-linear latency histogram (milliseconds in, milliseconds out)."""
+
+    def __init__(self):
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, latency_ms: float):
+        index = _index(max(0, round(latency_ms * 1000)))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total_ms += latency_ms
+        if latency_ms > self.max_ms:
+            self.max_ms = latency_ms
+
+    def merge(self, other: "LatencySketch"):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def quantile(self, q: float) -> float:
+        """Latency (ms) at quantile q: the midpoint of the bucket holding the q-th value."""
+        if not self.count:
+            return 0.0
+        rank = max(1, round(q * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                low, high = _lower_bound(index), _lower_bound(index + 1)
+                return min((low + high - 1) / 2000.0, self.max_ms)
+        return self.max_ms
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.50), 3),
+            "p95_ms": round(self.quantile(0.95), 3),
+            "p99_ms": round(self.quantile(0.99), 3),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+    def to_state(self) -> dict:
+        return {"buckets": sorted(self.buckets.items()), "count": self.count,
+                "total_ms": self.total_ms, "max_ms": self.max_ms}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "LatencySketch":
+        sketch = cls()
+        sketch.buckets = {index: count for index, count in state["buckets"]}
+        sketch.count, sketch.total_ms, sketch.max_ms = state["count"], state["total_ms"], state["max_ms"]
+        return sketch
+
+
+WINDOWS = {"1m": 1, "5m": 5, "1h": 60}
+
+
+class LatencyJoin:
+    """Streaming join of orders and their reservation results. Consumer thread only."""
+
+    def __init__(self, ttl_seconds: float = 600.0, max_pending: int = 100_000, retention_minutes: int = 60):
+        self.ttl_ms = int(ttl_seconds * 1000)
+        self.max_pending = max_pending
+        self.retention_minutes = retention_minutes
+        self.reset()
+
+    def reset(self):
+        self.orders: dict[str, int] = {}       # orderId -> createdAt (ms), waiting for a result
+        self.results: dict[str, int] = {}      # orderId -> result createdAt (ms), waiting for the order
+        self.minutes: deque[tuple[int, LatencySketch]] = deque()   # (result minute, sketch), ascending
+        self.overall = LatencySketch()
+        self.newest_ms = 0
+        self.matched = 0
+        self.expired = 0                       # unmatched orders/results dropped by TTL or size
+        self.negative = 0                      # result stamped before its order (clock skew), recorded as 0
+
+    def order(self, order_id: str, created_ms: int):
+        result_ms = self.results.pop(order_id, None)
+        if result_ms is not None:
+            self._match(created_ms, result_ms)
+        else:
+            self._wait(self.orders, order_id, created_ms)
+
+    def result(self, order_id: str, created_ms: int):
+        order_ms = self.orders.pop(order_id, None)
+        if order_ms is not None:
+            self._match(order_ms, created_ms)
+        else:
+            self._wait(self.results, order_id, created_ms)
+
+    def _wait(self, pending: dict, order_id: str, created_ms: int):
+        pending[order_id] = created_ms
+        if created_ms > self.newest_ms:
+            self.newest_ms = created_ms
+            self._expire()
+        while len(pending) > self.max_pending:
+            del pending[next(iter(pending))]
+            self.expired += 1
+
+    def _expire(self):
+        cutoff = self.newest_ms - self.ttl_ms
+        for pending in (self.orders, self.results):
+            while pending:
+                order_id = next(iter(pending))
+                if pending[order_id] >= cutoff:
+                    break
+                del pending[order_id]
+                self.expired += 1
+
+    def _match(self, order_ms: int, result_ms: int):
+        latency_ms = result_ms - order_ms
+        if latency_ms < 0:
+            self.negative += 1
+            latency_ms = 0
+        self.matched += 1
+        self.overall.record(latency_ms)
+        minute = result_ms // 60_000
+        if not self.minutes or self.minutes[-1][0] < minute:
+            self.minutes.append((minute, LatencySketch()))
+            while self.minutes and self.minutes[0][0] <= minute - self.retention_minutes:
+                self.minutes.popleft()
+            sketch = self.minutes[-1][1]
+        else:
+            # a result behind the newest minute: find its sketch (rare, short scan from the end)
+            sketch = None
+            for i in range(len(self.minutes) - 1, -1, -1):
+                if self.minutes[i][0] == minute:
+                    sketch = self.minutes[i][1]
+                    break
+                if self.minutes[i][0] < minute:
+                    sketch = LatencySketch()
+                    self.minutes.insert(i + 1, (minute, sketch))
+                    break
+            if sketch is None:
+                return                         # older than the retained minutes; still in `overall`
+        sketch.record(latency_ms)
+
+    def rebuild(self, orders: dict[str, int], results: dict[str, int]):
+        """Reset and join complete maps of orderId -> createdAt (ms), as collected by a replay.
+
+        Every order with a result is matched. Unmatched sides within `ttl` of the newest event time
+        are left pending for the live stream to complete; older ones count as expired.
+        """
+        self.reset()
+        pairs = sorted((result_ms, orders[order_id]) for order_id, result_ms in results.items()
+                       if order_id in orders)
+        for result_ms, order_ms in pairs:
+            self._match(order_ms, result_ms)
+        self.newest_ms = max(max(orders.values(), default=0), max(results.values(), default=0))
+        cutoff = self.newest_ms - self.ttl_ms
+        for pending, side, other in ((self.orders, orders, results), (self.results, results, orders)):
+            for order_id, created_ms in sorted(side.items(), key=lambda item: item[1]):
+                if order_id in other:
+                    continue
+                if created_ms >= cutoff:
+                    pending[order_id] = created_ms
+                else:
+                    self.expired += 1
+            while len(pending) > self.max_pending:
+                del pending[next(iter(pending))]
+                self.expired += 1
+
+    def windows(self) -> dict:
+        """p50/p95/p99 over the last 1, 5 and 60 minutes (ending at the newest result minute) and overall."""
+        result = {}
+        newest = self.minutes[-1][0] if self.minutes else 0
+        for name, size in WINDOWS.items():
+            merged = LatencySketch()
+            for minute, sketch in self.minutes:
+                if minute > newest - size:
+                    merged.merge(sketch)
+            result[name] = merged.summary()
+        result["all"] = self.overall.summary()
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            **self.windows(),
+            "matched": self.matched,
+            "pending_orders": len(self.orders),
+            "pending_results": len(self.results),
+            "expired_unmatched": self.expired,
+            "negative_latencies": self.negative,
+        }
+
+    def to_state(self) -> dict:
+        return {
+            "orders": list(self.orders.items()),
+            "results": list(self.results.items()),
+            "minutes": [[minute, sketch.to_state()] for minute, sketch in self.minutes],
+            "overall": self.overall.to_state(),
+            "newest_ms": self.newest_ms,
+            "matched": self.matched,
+            "expired": self.expired,
+            "negative": self.negative,
+        }
+
+    def load_state(self, state: dict):
+        self.reset()
+        self.orders = dict((order_id, ms) for order_id, ms in state["orders"])
+        self.results = dict((order_id, ms) for order_id, ms in state["results"])
+        self.minutes = deque((minute, LatencySketch.from_state(s)) for minute, s in state["minutes"])
+        self.overall = LatencySketch.from_state(state["overall"])
+        self.newest_ms = state["newest_ms"]
+        self.matched, self.expired, self.negative = state["matched"], state["expired"], state["negative"]
+
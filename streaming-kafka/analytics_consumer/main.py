@@ -1,15 +1,22 @@
-import json
 import logging
 import os
 import threading
 import time
-from collections import defaultdict
-from datetime import datetime
+from datetime import datetime, timezone
 
 from confluent_kafka import Consumer, KafkaError, TopicPartition
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Response
 import uvicorn
 
+from checkpoint import CheckpointStore
+from common.consumer_metrics import CONTENT_TYPE, ConsumerMetrics
+from common.serialization import decode_event, header_value
+from counters import Published, ShardedCounters
+from latency import LatencyJoin
+from replay import Backfill, ParallelReplay
+from rollups import DIMENSIONS, RollupStore
+from windowing import WindowEngine, event_minute, event_ms, minute_label, order_minute, parse_time_ms
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("analytics_consumer")
 
@@ -19,61 +26,111 @@ ORDERS_TOPIC = "orders"
 INVENTORY_TOPIC = "inventory-events"
 GROUP_ID = "analytics-group"
 METRICS_FILE = "/app/metrics.txt"
-
-# Metrics state
-orders_per_minute: dict[str, int] = defaultdict(int)  # minute_bucket -> count
-total_reservations = 0
-failed_reservations = 0
-total_orders = 0
-metrics_lock = threading.Lock()
-
-# Signal for replay
+# event-time windows: how far (minutes) events may trail the newest one, and closed windows kept per size
+ALLOWED_LATENESS_MINUTES = int(os.getenv("ANALYTICS_ALLOWED_LATENESS_MINUTES", "2"))
+WINDOW_RETENTION = int(os.getenv("ANALYTICS_WINDOW_RETENTION", "60"))
+# how often the consumer thread publishes a rendered copy of the windows for readers
+WINDOW_PUBLISH_INTERVAL_MS = int(os.getenv("ANALYTICS_WINDOW_PUBLISH_INTERVAL_MS", "500"))
+# local checkpoints of the metrics keyed by consumer offsets (empty dir = disabled)
+CHECKPOINT_DIR = os.getenv("ANALYTICS_CHECKPOINT_DIR", "")
+CHECKPOINT_INTERVAL_SECONDS = float(os.getenv("ANALYTICS_CHECKPOINT_INTERVAL_SECONDS", "30"))
+CHECKPOINTS_KEPT = int(os.getenv("ANALYTICS_CHECKPOINTS_KEPT", "20"))
+# mode=parallel replays: one task per partition on this many workers (processes or threads)
+REPLAY_WORKERS = int(os.getenv("ANALYTICS_REPLAY_WORKERS", str(os.cpu_count() or 4)))
+REPLAY_EXECUTOR = os.getenv("ANALYTICS_REPLAY_EXECUTOR", "process")
+# time-range queries are short: threads avoid the process start-up cost
+RANGE_QUERY_EXECUTOR = os.getenv("ANALYTICS_RANGE_QUERY_EXECUTOR", "thread")
+# dimensional rollups: minute buckets kept, hour buckets kept
+ROLLUP_MINUTES = int(os.getenv("ANALYTICS_ROLLUP_MINUTES", "1440"))
+ROLLUP_HOURS = int(os.getenv("ANALYTICS_ROLLUP_HOURS", "168"))
+QUERY_MAX_LIMIT = 1000
+# order -> reservation latency join: how long (event time) an unmatched side waits, and how many may wait
+LATENCY_TTL_SECONDS = float(os.getenv("ANALYTICS_LATENCY_TTL_SECONDS", "600"))
+LATENCY_MAX_PENDING = int(os.getenv("ANALYTICS_LATENCY_MAX_PENDING", "100000"))
+# consumer lag/throughput for GET /metrics/prometheus: librdkafka statistics interval, processing-time sampling
+KAFKA_STATS_INTERVAL_MS = int(os.getenv("KAFKA_STATS_INTERVAL_MS", "5000"))
+CONSUMER_METRICS_SAMPLE_EVERY = int(os.getenv("CONSUMER_METRICS_SAMPLE_EVERY", "16"))
+
+# Metrics state. Only the consumer thread writes it, and readers never take a lock:
+# counters are summed from per-thread shards, and windows are read from the last published copy.
+counters = ShardedCounters("total_orders", "total_reservations", "failed_reservations", "unbucketed_orders")
+TOTAL_ORDERS, TOTAL_RESERVATIONS, FAILED_RESERVATIONS, UNBUCKETED_ORDERS = range(4)
+order_windows = WindowEngine(allowed_lateness=ALLOWED_LATENESS_MINUTES, retention=WINDOW_RETENTION)
+# per-restaurant / per-SKU / per-outcome rollups; queried directly (single writer, lock-free reads)
+rollups = RollupStore(ROLLUP_MINUTES, ROLLUP_HOURS)
+# latency sketches are published with the windows, like them
+latency = LatencyJoin(LATENCY_TTL_SECONDS, LATENCY_MAX_PENDING)
+windows_view = Published({"orders_per_minute": {}, "windows": order_windows.snapshot(),
+                          "latency": latency.snapshot()})
+_next_publish = 0.0
+
+checkpoints = CheckpointStore(CHECKPOINT_DIR, CHECKPOINTS_KEPT) if CHECKPOINT_DIR else None
+consumer_metrics = ConsumerMetrics("analytics_consumer", CONSUMER_METRICS_SAMPLE_EVERY, KAFKA_STATS_INTERVAL_MS)
+
+# Signal for replay: the mode ("full", "checkpoint" or "parallel") and the checkpoint to restore
 replay_requested = threading.Event()
+replay_mode = "full"
+replay_from = None
+parallel_replay: ParallelReplay | None = None   # the running or last parallel replay, for /replay/status
+# mode=full replays: while the consumer catches up to where the log ended when the replay started,
+# window counts and latency timestamps go to `backfill`; the windows and the latency join are rebuilt
+# from it once every partition in `catch_up_ends` ((topic, partition) -> end offset) has been read
+backfill: Backfill | None = None
+catch_up_ends: dict[tuple[str, int], int] = {}
 
 app = FastAPI()
 
 
-def get_minute_bucket(created_at: str) -> str:
-    """Extract minute bucket from ISO timestamp (event time bucketing)."""
-    try:
-        dt = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
-        return dt.strftime("%Y-%m-%dT%H:%M")
-    except (ValueError, AttributeError):
-        return "unknown"
+def publish_windows():
+    """Render the windows for readers. Consumer thread only."""
+    global _next_publish
+    windows_view.publish({
+        "orders_per_minute": order_windows.per_minute(),
+        "windows": order_windows.snapshot(),
+        "latency": latency.snapshot(),
+    })
+    _next_publish = time.monotonic() + WINDOW_PUBLISH_INTERVAL_MS / 1000.0
 
 
 def reset_metrics():
-    global total_reservations, failed_reservations, total_orders
-    with metrics_lock:
-        orders_per_minute.clear()
-        total_reservations = 0
-        failed_reservations = 0
-        total_orders = 0
-
-
-def _get_failure_rate():
+    """Consumer thread only (the consumer is closed while this runs)."""
+    global backfill
+    backfill = None
+    catch_up_ends.clear()
+    counters.reset()
+    order_windows.reset()
+    rollups.reset()
+    latency.reset()
+    publish_windows()
+
+
+def _get_failure_rate(totals: dict) -> float:
     return (
-        failed_reservations / total_reservations
-        if total_reservations > 0
+        totals["failed_reservations"] / totals["total_reservations"]
+        if totals["total_reservations"] > 0
         else 0.0
     )
 
 def write_metrics():
-    with metrics_lock:
-        failure_rate = _get_failure_rate()
-        lines = [
-            "=== Analytics Metrics ===",
-            f"Total orders seen: {total_orders}",
-            f"Total reservations: {total_reservations}",
-            f"Failed reservations: {failed_reservations}",
-            f"Failure rate: {failure_rate:.4f}",
-            "",
-            "Orders per minute:",
-        ]
-        for bucket in sorted(orders_per_minute.keys()):
-            lines.append(f"  {bucket}: {orders_per_minute[bucket]}")
-
-        report = "\n".join(lines)
+    totals = counters.snapshot()
+    view = windows_view.get()
+    lines = [
+        "=== Analytics Metrics ===",
+        f"Total orders seen: {totals['total_orders']}",
+        f"Total reservations: {totals['total_reservations']}",
+        f"Failed reservations: {totals['failed_reservations']}",
+        f"Failure rate: {_get_failure_rate(totals):.4f}",
+        "",
+        f"Late orders (behind watermark): {view['windows']['late_events']}",
+        "Order -> reservation latency (1m): p50={p50_ms}ms p95={p95_ms}ms p99={p99_ms}ms".format(
+            **view["latency"]["1m"]),
+        "",
+        "Orders per minute:",
+    ]
+    for bucket, count in view["orders_per_minute"].items():
+        lines.append(f"  {bucket}: {count}")
+
+    report = "\n".join(lines)
 
     logger.info("\n%s", report)
     try:
@@ -85,46 +142,208 @@ def write_metrics():
     return report
 
 
-def process_message(event: dict):
-    global total_reservations, failed_reservations, total_orders
-
+def process_message(event: dict, timestamp_ms: int | None = None, partition: tuple[str, int] | None = None):
+    """Update metrics for one event from `partition`; `timestamp_ms` (the Kafka message time) is used when
+    createdAt is unusable."""
     event_type = event.get("eventType", "")
+    slots = counters.shard()
+    minute = order_minute(event, timestamp_ms)
+    if minute is not None:
+        rollups.record(minute, event)
+    # catching up after a full replay: collect for the rebuild instead of streaming
+    windows, join = (backfill, backfill) if backfill is not None else (order_windows, latency)
+
+    if event_type == "OrderPlaced":
+        slots[TOTAL_ORDERS] += 1
+        if minute is None:
+            slots[UNBUCKETED_ORDERS] += 1
+        else:
+            windows.add(minute, partition=partition)
+        created_ms = event_ms(event.get("createdAt"))
+        if created_ms is not None and event.get("orderId"):
+            join.order(event["orderId"], created_ms)
+
+    elif event_type in ("InventoryReserved", "InventoryFailed"):
+        slots[TOTAL_RESERVATIONS] += 1
+        if event_type == "InventoryFailed":
+            slots[FAILED_RESERVATIONS] += 1
+        created_ms = event_ms(event.get("createdAt"))
+        if created_ms is not None and event.get("orderId"):
+            join.result(event["orderId"], created_ms)
+
+    if time.monotonic() >= _next_publish:
+        publish_windows()
+
+
+def handle_message(msg):
+    """Decode and process one Kafka message, and track catch-up progress. Consumer thread only."""
+    try:
+        # JSON or struct, detected from the content-type header / magic byte
+        event = decode_event(msg.value(), header_value(msg.headers()))
+        _, timestamp_ms = msg.timestamp()
+        process_message(event, timestamp_ms if timestamp_ms > 0 else None, (msg.topic(), msg.partition()))
+    except ValueError as e:
+        logger.error("Failed to decode message: %s", e)
+    if backfill is not None:
+        caught_up(msg.topic(), msg.partition(), msg.offset() + 1)
+
+
+def start_catch_up(ends: dict[tuple[str, int], int]):
+    """Collect window counts and latency timestamps until every partition has been read up to its offset
+    in `ends`, then rebuild from them (see replay.Backfill). Call after reset_metrics()."""
+    global backfill
+    catch_up_ends.clear()
+    catch_up_ends.update((tp, end) for tp, end in ends.items() if end > 0)
+    backfill = Backfill() if catch_up_ends else None
+
+
+def caught_up(topic: str, partition: int, next_offset: int):
+    """`next_offset` is the next offset to read from the partition; finish the catch-up once all are read."""
+    global backfill
+    end = catch_up_ends.get((topic, partition))
+    if end is None or next_offset < end:
+        return
+    del catch_up_ends[(topic, partition)]
+    if not catch_up_ends:
+        backfill.apply(order_windows, latency)
+        backfill = None
+        publish_windows()
+        logger.info("Replay: caught up; windows and latency rebuilt from the whole log")
+
+
+def log_end_offsets() -> dict[tuple[str, int], int]:
+    consumer = Consumer({"bootstrap.servers": KAFKA_BOOTSTRAP_SERVERS, "group.id": GROUP_ID})
+    try:
+        return {(topic, pid): consumer.get_watermark_offsets(TopicPartition(topic, pid), timeout=10)[1]
+                for topic, pid in all_partitions()}
+    finally:
+        consumer.close()
+
+
+def metrics_state() -> dict:
+    """Counters and windows as one JSON-serialisable value. Consumer thread only."""
+    return {"counters": counters.snapshot(), "windows": order_windows.to_state(), "rollups": rollups.to_state(),
+            "latency": latency.to_state()}
+
+
+def restore_metrics(state: dict):
+    """Load a metrics_state() value. Consumer thread only. Raises ValueError if it no longer fits the config."""
+    global backfill
+    order_windows.load_state(state["windows"])
+    backfill = None
+    catch_up_ends.clear()
+    counters.load(state["counters"])
+    rollups.reset()
+    if "rollups" in state:
+        rollups.merge_state(state["rollups"])
+    if "latency" in state:
+        latency.load_state(state["latency"])
+    else:
+        latency.reset()
+    publish_windows()
+
+
+def take_checkpoint(consumer: Consumer):
+    """Checkpoint the metrics with the position of every partition. Call between messages."""
+    assignment = consumer.assignment()
+    if not assignment:
+        return
+    offsets = {}
+    unknown = []
+    for tp in consumer.position(assignment):
+        if tp.offset >= 0:
+            offsets[(tp.topic, tp.partition)] = tp.offset
+        else:
+            unknown.append(TopicPartition(tp.topic, tp.partition))
+    if unknown:
+        # nothing fetched yet since (re)start: the committed offset is where the state stops
+        for tp in consumer.committed(unknown, timeout=10):
+            offsets[(tp.topic, tp.partition)] = max(tp.offset, 0)
+    try:
+        checkpoint = checkpoints.save(offsets, metrics_state())
+    except OSError as e:
+        logger.warning("Could not write checkpoint: %s", e)
+        return
+    logger.info("Checkpoint %d written (%d partitions)", checkpoint.id, len(offsets))
+
+
+def all_partitions() -> list[tuple[str, int]]:
+    from confluent_kafka.admin import AdminClient
+    admin = AdminClient({"bootstrap.servers": KAFKA_BOOTSTRAP_SERVERS})
+    partitions = []
+    for topic in [ORDERS_TOPIC, INVENTORY_TOPIC]:
+        metadata = admin.list_topics(topic, timeout=10)
+        topic_meta = metadata.topics.get(topic)
+        if topic_meta:
+            partitions.extend((topic, pid) for pid in topic_meta.partitions)
+    return partitions
+
+
+def rewind_group(offsets: dict[tuple[str, int], int]):
+    """Commit `offsets` for the group (0 for partitions not listed) so the next consumer starts there."""
+    reset_offsets = [TopicPartition(topic, pid, offsets.get((topic, pid), 0)) for topic, pid in all_partitions()]
+    if reset_offsets:
+        # Use a temporary consumer to commit the offsets
+        tmp_consumer = Consumer({
+            "bootstrap.servers": KAFKA_BOOTSTRAP_SERVERS,
+            "group.id": GROUP_ID,
+        })
+        tmp_consumer.commit(offsets=reset_offsets, asynchronous=False)
+        tmp_consumer.close()
+        logger.info("Offsets reset for %d partitions", len(reset_offsets))
 
-    with metrics_lock:
-        if event_type == "OrderPlaced":
-            total_orders += 1
-            created_at = event.get("createdAt", "")
-            bucket = get_minute_bucket(created_at)
-            orders_per_minute[bucket] += 1
-
-        elif event_type == "InventoryReserved":
-            total_reservations += 1
 
-        elif event_type == "InventoryFailed":
-            total_reservations += 1
-            failed_reservations += 1
+def start_from_checkpoint(checkpoint) -> bool:
+    """Restore `checkpoint` and rewind the group to its offsets; False if it cannot be used."""
+    try:
+        restore_metrics(checkpoint.state)
+    except (ValueError, KeyError) as e:
+        logger.warning("Checkpoint %d not usable (%s)", checkpoint.id, e)
+        return False
+    rewind_group(checkpoint.offsets)
+    logger.info("Restored checkpoint %d", checkpoint.id)
+    return True
 
 
 def consumer_loop():
     """Main consumer loop running in a background thread."""
+    # resume where the last checkpoint left off instead of continuing with empty metrics
+    if checkpoints is not None:
+        latest = checkpoints.latest()
+        if latest is not None:
+            start_from_checkpoint(latest)
+
     while True:
         consumer = Consumer({
             "bootstrap.servers": KAFKA_BOOTSTRAP_SERVERS,
             "group.id": GROUP_ID,
             "auto.offset.reset": "earliest",
             "enable.auto.commit": False,
+            # end-of-partition events tell a catch-up that a partition ending in transaction markers is read
+            "enable.partition.eof": True,
+            **consumer_metrics.config(),
         })
-        consumer.subscribe([ORDERS_TOPIC, INVENTORY_TOPIC])
+        consumer.subscribe([ORDERS_TOPIC, INVENTORY_TOPIC], on_assign=expect_partitions,
+                           on_revoke=release_partitions)
         logger.info("Analytics consumer started (group=%s)", GROUP_ID)
 
         last_metrics_time = time.time()
+        next_checkpoint = time.monotonic() + CHECKPOINT_INTERVAL_SECONDS
+        since_checkpoint = 0
         idle_count = 0
 
         try:
             while not replay_requested.is_set():
-                msg = consumer.poll(1.0)
+                if (checkpoints is not None and since_checkpoint and backfill is None
+                        and time.monotonic() >= next_checkpoint):
+                    take_checkpoint(consumer)
+                    next_checkpoint = time.monotonic() + CHECKPOINT_INTERVAL_SECONDS
+                    since_checkpoint = 0
+
+                msg = consumer_metrics.poll(consumer, 1.0)
                 if msg is None:
                     idle_count += 1
+                    publish_windows()
                     # Write metrics periodically (every 5s of idle)
                     if time.time() - last_metrics_time > 5:
                         write_metrics()
@@ -134,18 +353,21 @@ def consumer_loop():
                 if msg.error():
                     if msg.error().code() == KafkaError._PARTITION_EOF:
                         idle_count += 1
+                        if backfill is not None:
+                            caught_up(msg.topic(), msg.partition(), msg.offset())
                         continue
                     logger.error("Consumer error: %s", msg.error())
                     continue
 
                 idle_count = 0
-                try:
-                    event = json.loads(msg.value().decode("utf-8"))
-                    process_message(event)
-                except (json.JSONDecodeError, UnicodeDecodeError) as e:
-                    logger.error("Failed to decode message: %s", e)
+                sampled = consumer_metrics.sample()
+                started = time.perf_counter() if sampled else 0.0
+                handle_message(msg)
+                if sampled:
+                    consumer_metrics.observe_processing((time.perf_counter() - started) * 1000.0)
 
                 consumer.commit(message=msg)
+                since_checkpoint += 1
 
                 # Periodic metrics write
                 if time.time() - last_metrics_time > 5:
@@ -157,58 +379,228 @@ def consumer_loop():
         finally:
             consumer.close()
 
-        # If replay was requested, reset and restart
+        # If replay was requested, restore (or reset) and restart
         if replay_requested.is_set():
-            logger.info("Replay requested — resetting metrics and offsets")
-            reset_metrics()
+            mode, checkpoint = replay_mode, replay_from
             replay_requested.clear()
+            if mode == "checkpoint" and checkpoint is not None and start_from_checkpoint(checkpoint):
+                logger.info("Replay: restarting consumer from checkpoint %d", checkpoint.id)
+                continue
 
-            # Reset offsets by committing offset 0 for all partitions
-            from confluent_kafka.admin import AdminClient
-            admin = AdminClient({"bootstrap.servers": KAFKA_BOOTSTRAP_SERVERS})
-
-            # Build list of all topic-partitions to reset
-            reset_offsets = []
-            for topic in [ORDERS_TOPIC, INVENTORY_TOPIC]:
-                metadata = admin.list_topics(topic, timeout=10)
-                topic_meta = metadata.topics.get(topic)
-                if topic_meta:
-                    for pid in topic_meta.partitions:
-                        reset_offsets.append(TopicPartition(topic, pid, 0))
-
-            if reset_offsets:
-                # Use a temporary consumer to commit offset 0
-                tmp_consumer = Consumer({
-                    "bootstrap.servers": KAFKA_BOOTSTRAP_SERVERS,
-                    "group.id": GROUP_ID,
-                })
-                tmp_consumer.commit(offsets=reset_offsets, asynchronous=False)
-                tmp_consumer.close()
-                logger.info("Offsets reset for %d partitions", len(reset_offsets))
+            if mode == "parallel":
+                try:
+                    run_parallel_replay()
+                    continue
+                except Exception as e:
+                    logger.error("Parallel replay failed, falling back to a sequential replay: %s", e)
 
+            logger.info("Replay requested — resetting metrics and offsets")
+            reset_metrics()
+            rewind_group({})
+            start_catch_up(log_end_offsets())
             logger.info("Replay: restarting consumer from beginning")
             # Loop will restart with fresh consumer
 
 
+def expect_partitions(consumer, partitions):
+    """on_assign: the windows' watermark waits until every assigned orders partition has sent an order."""
+    order_windows.expect_partitions([(tp.topic, tp.partition) for tp in partitions if tp.topic == ORDERS_TOPIC])
+
+
+def release_partitions(consumer, partitions):
+    """on_revoke: the windows stop waiting for revoked partitions before advancing the watermark."""
+    order_windows.release_partitions([(tp.topic, tp.partition) for tp in partitions])
+
+
+def run_parallel_replay():
+    """Recompute the metrics from the whole log, partition-parallel, then resume live consumption after it."""
+    global parallel_replay
+    parallel_replay = ParallelReplay(KAFKA_BOOTSTRAP_SERVERS, [ORDERS_TOPIC, INVENTORY_TOPIC],
+                                     workers=REPLAY_WORKERS, executor=REPLAY_EXECUTOR,
+                                     rollup_slots=(ROLLUP_MINUTES, ROLLUP_HOURS), join_latency=True)
+    result = parallel_replay.run()
+    reset_metrics()
+    counters.load(result.counters)
+    result.backfill.apply(order_windows, latency)
+    rollups.merge_state(result.rollups.to_state())
+    publish_windows()
+    rewind_group(result.end_offsets)
+    logger.info("Replay: restarting consumer after parallel replay (%.0f events/s)", result.events_per_sec)
+
+
+def range_query(start_ms: int, end_ms: int) -> dict:
+    """Aggregate only the messages timestamped in [start_ms, end_ms), without touching the live metrics."""
+    query = ParallelReplay(KAFKA_BOOTSTRAP_SERVERS, [ORDERS_TOPIC, INVENTORY_TOPIC], workers=REPLAY_WORKERS,
+                           executor=RANGE_QUERY_EXECUTOR, start_ms=start_ms, end_ms=end_ms,
+                           rollup_slots=(ROLLUP_MINUTES, ROLLUP_HOURS), join_latency=True)
+    result = query.run()
+    # keep every closed window of the range, not just the live retention
+    span = (max(result.minutes) - min(result.minutes) + 1) if result.minutes else 1
+    windows = WindowEngine(allowed_lateness=ALLOWED_LATENESS_MINUTES, retention=span)
+    join = LatencyJoin(LATENCY_TTL_SECONDS, LATENCY_MAX_PENDING, retention_minutes=span)
+    result.backfill.apply(windows, join)
+    status = query.status()
+    return {
+        "from": datetime.fromtimestamp(start_ms / 1000, tz=timezone.utc).isoformat(),
+        "to": datetime.fromtimestamp(end_ms / 1000, tz=timezone.utc).isoformat(),
+        **result.counters,
+        "failure_rate": round(_get_failure_rate(result.counters), 4),
+        "orders_per_minute": {minute_label(m): c for m, c in result.minutes.items()},
+        "windows": windows.snapshot(),
+        "top": {dimension: dict(result.rollups.top(dimension, start_ms // 60_000, -(-end_ms // 60_000), 10)[0])
+                for dimension in DIMENSIONS},
+        "latency": {**join.overall.summary(),
+                    "unmatched_orders": len(result.backfill.order_times) - join.matched,
+                    "unmatched_results": len(result.backfill.result_times) - join.matched},
+        "events_read": result.events,
+        "elapsed_seconds": round(result.elapsed, 3),
+        "events_per_sec": round(result.events_per_sec, 1),
+        "partitions": {name: {k: p[k] for k in ("start", "end", "events")} for name, p in status["partitions"].items()},
+    }
+
+
 @app.post("/replay")
-def replay():
-    """Trigger a replay — reset offsets and recompute metrics."""
+def replay(mode: str = "checkpoint", checkpoint: int | None = None, since: str | None = None,
+           start: str | None = Query(None, alias="from"), end: str | None = Query(None, alias="to")):
+    """Trigger a replay and recompute metrics.
+
+    from=<ISO time>[&to=<ISO time>] (to defaults to now): answer for that time range only. Each
+    partition is seeked by timestamp and read up to the end time; the result is returned
+    directly and the live metrics are left alone.
+
+    mode=checkpoint (default): restore a checkpoint and re-read only the messages after it —
+    `checkpoint=<id>`, else the newest one before `since` (ISO time), else the latest.
+    Falls back to a full replay when there is none. mode=full: reset offsets to 0; the windows and
+    latency are rebuilt from the whole log once the consumer has caught up to where it ended.
+    mode=parallel: full replay with every partition read concurrently (see /replay/status).
+    Both full modes give the same metrics for the same log.
+    """
+    global replay_from, replay_mode
+    if start is not None or end is not None:
+        start_ms = parse_time_ms(start) if start is not None else None
+        end_ms = parse_time_ms(end) if end is not None else int(time.time() * 1000)
+        if start_ms is None or end_ms is None:
+            raise HTTPException(status_code=400, detail="from (required) and to must be ISO-8601 timestamps")
+        if end_ms <= start_ms:
+            raise HTTPException(status_code=400, detail="to must be after from")
+        return range_query(start_ms, end_ms)
+
+    if mode not in ("checkpoint", "full", "parallel"):
+        raise HTTPException(status_code=400, detail="mode must be 'checkpoint', 'full' or 'parallel'")
+
+    chosen = None
+    if mode == "checkpoint" and checkpoints is not None:
+        if checkpoint is not None:
+            chosen = checkpoints.get(checkpoint)
+            if chosen is None:
+                raise HTTPException(status_code=404, detail=f"checkpoint {checkpoint} not found")
+        elif since is not None:
+            minute = event_minute(since)
+            if minute is None:
+                raise HTTPException(status_code=400, detail="since must be an ISO-8601 timestamp")
+            chosen = checkpoints.before(minute)
+        else:
+            chosen = checkpoints.latest()
+
+    if mode == "checkpoint" and chosen is None:
+        mode = "full"
     before_metrics = write_metrics()
+    replay_mode, replay_from = mode, chosen
     replay_requested.set()
-    return {"status": "replay_triggered", "before_metrics": before_metrics}
+    return {
+        "status": "replay_triggered",
+        "mode": mode,
+        "checkpoint": chosen.describe() if chosen is not None else None,
+        "before_metrics": before_metrics,
+    }
+
+
+@app.get("/query")
+def query(dimension: str, start: str | None = Query(None, alias="from"), end: str | None = Query(None, alias="to"),
+          group_by: str = "key", key: str | None = None, top: int | None = None,
+          limit: int = 100, cursor: str | None = None):
+    """Query the rollups over [from, to) (default: the last hour).
+
+    group_by=key: totals per key, largest first (`top` keeps the K largest).
+    group_by=minute|hour: a time series of all keys, or of `key` only.
+    Rows are paginated: pass the returned `next_cursor` as `cursor` for the next page.
+    """
+    if dimension not in DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"dimension must be one of {list(DIMENSIONS)}")
+    if group_by not in ("key", "minute", "hour"):
+        raise HTTPException(status_code=400, detail="group_by must be 'key', 'minute' or 'hour'")
+    end_ms = parse_time_ms(end) if end is not None else int(time.time() * 1000)
+    start_ms = parse_time_ms(start) if start is not None else (end_ms - 3_600_000 if end_ms is not None else None)
+    if start_ms is None or end_ms is None or end_ms <= start_ms:
+        raise HTTPException(status_code=400, detail="from and to must be ISO-8601 timestamps with from < to")
+    try:
+        offset = int(cursor) if cursor else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    limit = max(1, min(limit, QUERY_MAX_LIMIT))
+
+    first, last = start_ms // 60_000, -(-end_ms // 60_000)   # minutes [first, last)
+    if group_by == "key":
+        if top is not None:
+            ranked, scanned = rollups.top(dimension, first, last, max(top, 0))
+        else:
+            totals, scanned = rollups.totals(dimension, first, last)
+            ranked = sorted(totals.items(), key=lambda kv: (-kv[1], kv[0]))
+        rows = [{"key": k, "value": v} for k, v in ranked]
+    else:
+        points, scanned = rollups.series(dimension, first, last, 1 if group_by == "minute" else 60, key)
+        rows = [{"time": minute_label(m), "value": v} for m, v in points]
+
+    page = rows[offset:offset + limit]
+    return {
+        "dimension": dimension,
+        "from": datetime.fromtimestamp(start_ms / 1000, tz=timezone.utc).isoformat(),
+        "to": datetime.fromtimestamp(end_ms / 1000, tz=timezone.utc).isoformat(),
+        "group_by": group_by,
+        "rows": page,
+        "total_rows": len(rows),
+        "next_cursor": str(offset + limit) if offset + limit < len(rows) else None,
+        "buckets_scanned": scanned,
+    }
+
+
+@app.get("/replay/status")
+def replay_status():
+    """Per-partition progress and throughput of the running (or last) parallel replay."""
+    if parallel_replay is None:
+        return {"running": False, "partitions": {}}
+    return parallel_replay.status()
+
+
+@app.get("/checkpoints")
+def list_checkpoints():
+    if checkpoints is None:
+        return {"enabled": False, "checkpoints": []}
+    found = [checkpoints.get(checkpoint_id) for checkpoint_id in checkpoints.ids()]
+    return {"enabled": True, "checkpoints": [c.describe() for c in found if c is not None]}
 
 
 @app.get("/metrics")
 def get_metrics():
-    with metrics_lock:
-        failure_rate = _get_failure_rate()
-        return {
-            "total_orders": total_orders,
-            "total_reservations": total_reservations,
-            "failed_reservations": failed_reservations,
-            "failure_rate": round(failure_rate, 4),
-            "orders_per_minute": dict(orders_per_minute),
-        }
+    # never blocks the consumer: summed counter shards plus the last published windows
+    totals = counters.snapshot()
+    view = windows_view.get()
+    return {
+        **totals,
+        "failure_rate": round(_get_failure_rate(totals), 4),
+        "orders_per_minute": view["orders_per_minute"],
+        "windows": view["windows"],
+        "latency": view["latency"],
+        "windows_age_ms": round(windows_view.age() * 1000.0, 1),
+        "catching_up": backfill is not None,
+    }
+
+
+@app.get("/metrics/prometheus")
+def get_prometheus_metrics():
+    """Per-partition committed offset, high watermark, lag and rates, sampled processing time and
+    poll idle ratio, in the Prometheus text format (from librdkafka statistics, not per message)."""
+    return Response(consumer_metrics.render(), media_type=CONTENT_TYPE)
 
 
 @app.get("/health")
@@ -0,0 +1,311 @@
+"""
+Partition-parallel replay for analytics_consumer.
+
+Every partition of the input topics is read on its own, from its low
+watermark up to the high watermark captured when the replay starts. Each
+read produces a partial aggregate: counter totals, order counts per
+event-time minute, and dimensional rollups. The work runs in a process pool (spawned, not forked,
+because librdkafka does not survive fork) or in a thread pool.
+
+Partial aggregates are merged by plain addition, in (topic, partition)
+order. Addition does not depend on the order of events, so the merged
+result is exactly what reading the same partitions one after another
+(workers=1) gives.
+
+The windows and the latency join are not streamed during a replay. Each
+partial carries a Backfill: complete order counts per minute, the newest
+minute per partition, and, with join_latency, the createdAt (ms) of every
+order and reservation result. Backfill.apply() rebuilds the windows from
+the complete counts, so nothing is late, and joins the complete maps by
+orderId (orders and their results sit in different topics, so the join
+cannot happen per partition). The sequential replay in main.py (mode=full)
+fills one Backfill as the consumer catches up and applies it the same way,
+so both replay paths give the same counters, windows and latency. The maps
+hold one entry per order and result read, until the replay finishes.
+
+Progress (offset and events per partition) and overall throughput are
+available from status() while the replay runs.
+
+Time-range replays (start_ms / end_ms) look up the first offset at or after
+each bound with offsets_for_times(). Each partition is then read only
+between those offsets. Messages whose timestamp falls outside the range are
+skipped, because producer timestamps are not strictly ordered within a
+partition.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from typing import NamedTuple
+
+from confluent_kafka import Consumer, KafkaError, TopicPartition
+
+from common.serialization import decode_event, header_value
+from latency import LatencyJoin
+from rollups import RollupStore
+from windowing import WindowEngine, event_ms, order_minute
+
+logger = logging.getLogger("analytics_consumer")
+
+COUNTER_NAMES = ("total_orders", "total_reservations", "failed_reservations", "unbucketed_orders")
+PROGRESS_EVERY = 5000   # messages between progress updates from a worker
+
+
+class Backfill:
+    """What a replay rebuilds the windows and the latency join from, once it has read everything.
+
+    Has the add() of WindowEngine and the order()/result() of LatencyJoin, so the consumer can feed
+    it in their place while it catches up.
+    """
+
+    def __init__(self, join_latency: bool = True):
+        self.join_latency = join_latency
+        self.minutes: dict[int, int] = {}            # epoch minute -> OrderPlaced count
+        self.partition_max: dict = {}                # (topic, partition) -> newest order minute in it
+        self.order_times: dict[str, int] = {}        # orderId -> createdAt (ms)
+        self.result_times: dict[str, int] = {}
+
+    def add(self, minute: int, count: int = 1, partition=None) -> bool:
+        self.minutes[minute] = self.minutes.get(minute, 0) + count
+        if minute > self.partition_max.get(partition, minute - 1):
+            self.partition_max[partition] = minute
+        return True
+
+    def order(self, order_id: str, created_ms: int):
+        if self.join_latency:
+            self.order_times[order_id] = created_ms
+
+    def result(self, order_id: str, created_ms: int):
+        if self.join_latency:
+            self.result_times[order_id] = created_ms
+
+    def merge(self, other: "Backfill"):
+        for minute, count in other.minutes.items():
+            self.minutes[minute] = self.minutes.get(minute, 0) + count
+        for partition, minute in other.partition_max.items():
+            self.partition_max[partition] = max(minute, self.partition_max.get(partition, minute))
+        self.order_times.update(other.order_times)
+        self.result_times.update(other.result_times)
+
+    def apply(self, windows: WindowEngine, latency: LatencyJoin | None = None):
+        """Replace the state of `windows` (and `latency`) with what was collected."""
+        windows.rebuild(self.minutes, self.partition_max)
+        if latency is not None:
+            latency.rebuild(self.order_times, self.result_times)
+
+
+class ReplayResult(NamedTuple):
+    counters: dict[str, int]
+    backfill: Backfill
+    rollups: RollupStore
+    end_offsets: dict[tuple[str, int], int]      # where the live consumer should resume
+    events: int
+    elapsed: float
+
+    @property
+    def minutes(self) -> dict[int, int]:
+        """Epoch minute -> OrderPlaced count, in time order."""
+        return dict(sorted(self.backfill.minutes.items()))
+
+    @property
+    def events_per_sec(self) -> float:
+        return self.events / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def replay_partition(bootstrap: str, topic: str, partition: int, start: int, end: int, progress,
+                     start_ms: int | None = None, end_ms: int | None = None,
+                     rollup_slots: tuple[int, int] = (1440, 168), join_latency: bool = False) -> dict:
+    """Aggregate offsets [start, end) of one partition, optionally only messages timestamped in
+    [start_ms, end_ms). Runs in a worker process or thread."""
+    counts = dict.fromkeys(COUNTER_NAMES, 0)
+    backfill = Backfill(join_latency)
+    rollups = RollupStore(*rollup_slots)
+    events = 0
+    key = f"{topic}-{partition}"
+    if end > start:
+        consumer = Consumer({
+            "bootstrap.servers": bootstrap,
+            "group.id": "analytics-replay",
+            "enable.auto.commit": False,
+            "enable.partition.eof": True,
+        })
+        consumer.assign([TopicPartition(topic, partition, start)])
+        done = False
+        try:
+            while not done:
+                for msg in consumer.consume(1000, 1.0):
+                    if msg.error():
+                        # EOF before `end` happens when the tail is transaction markers
+                        done = done or msg.error().code() == KafkaError._PARTITION_EOF
+                        continue
+                    if msg.offset() >= end:
+                        done = True
+                        break
+                    done = msg.offset() >= end - 1
+                    _, timestamp_ms = msg.timestamp()
+                    if ((start_ms is not None and timestamp_ms < start_ms)
+                            or (end_ms is not None and timestamp_ms >= end_ms)):
+                        continue
+                    events += 1
+                    try:
+                        event = decode_event(msg.value(), header_value(msg.headers()))
+                    except ValueError:
+                        continue
+                    event_type = event.get("eventType", "")
+                    minute = order_minute(event, timestamp_ms if timestamp_ms > 0 else None)
+                    if minute is not None:
+                        rollups.record(minute, event)
+                    if event_type == "OrderPlaced":
+                        counts["total_orders"] += 1
+                        if minute is None:
+                            counts["unbucketed_orders"] += 1
+                        else:
+                            backfill.add(minute, partition=(topic, partition))
+                    elif event_type == "InventoryReserved":
+                        counts["total_reservations"] += 1
+                    elif event_type == "InventoryFailed":
+                        counts["total_reservations"] += 1
+                        counts["failed_reservations"] += 1
+                    if join_latency and event.get("orderId"):
+                        created_ms = event_ms(event.get("createdAt"))
+                        if created_ms is not None:
+                            if event_type == "OrderPlaced":
+                                backfill.order(event["orderId"], created_ms)
+                            elif event_type in ("InventoryReserved", "InventoryFailed"):
+                                backfill.result(event["orderId"], created_ms)
+                    if events % PROGRESS_EVERY == 0:
+                        progress[key] = (msg.offset() + 1, events)
+        finally:
+            consumer.close()
+    progress[key] = (end, events)
+    return {"topic": topic, "partition": partition, "counters": counts, "backfill": backfill,
+            "rollups": rollups.to_state(), "events": events}
+
+
+class ParallelReplay:
+    def __init__(self, bootstrap: str, topics: list[str], workers: int = 4, executor: str = "process",
+                 start_ms: int | None = None, end_ms: int | None = None,
+                 rollup_slots: tuple[int, int] = (1440, 168), join_latency: bool = False):
+        if executor not in ("process", "thread"):
+            raise ValueError(f"executor must be 'process' or 'thread', not {executor!r}")
+        self.bootstrap = bootstrap
+        self.topics = topics
+        self.workers = max(1, workers)
+        self.executor = executor
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.rollup_slots = rollup_slots
+        self.join_latency = join_latency
+        self._ranges: dict[tuple[str, int], tuple[int, int]] = {}
+        self._progress = {}
+        self._started = None
+        self._finished = None
+        self._lock = threading.Lock()
+
+    def _partition_ranges(self) -> dict[tuple[str, int], tuple[int, int]]:
+        consumer = Consumer({"bootstrap.servers": self.bootstrap, "group.id": "analytics-replay"})
+        try:
+            ranges = {}
+            for topic in self.topics:
+                metadata = consumer.list_topics(topic, timeout=10).topics.get(topic)
+                for partition in sorted(metadata.partitions if metadata else ()):
+                    low, high = consumer.get_watermark_offsets(TopicPartition(topic, partition), timeout=10)
+                    ranges[(topic, partition)] = (low, high)
+            if self.start_ms is not None:
+                ranges = self._narrow(consumer, ranges, self.start_ms, 0)
+            if self.end_ms is not None:
+                ranges = self._narrow(consumer, ranges, self.end_ms, 1)
+            return ranges
+        finally:
+            consumer.close()
+
+    @staticmethod
+    def _narrow(consumer: Consumer, ranges: dict, timestamp_ms: int, bound: int) -> dict:
+        """Move the start (bound=0) or end (bound=1) of every range to the first offset at or after timestamp_ms."""
+        found = consumer.offsets_for_times(
+            [TopicPartition(topic, partition, timestamp_ms) for topic, partition in ranges], timeout=10)
+        narrowed = dict(ranges)
+        for tp in found:
+            low, high = ranges[(tp.topic, tp.partition)]
+            offset = tp.offset if tp.offset >= 0 else high   # -1: nothing that late in this partition
+            offset = min(max(offset, low), high)
+            narrowed[(tp.topic, tp.partition)] = (offset, high) if bound == 0 else (low, offset)
+        return narrowed
+
+    def run(self) -> ReplayResult:
+        ranges = self._partition_ranges()
+        with self._lock:
+            self._ranges = ranges
+            self._started, self._finished = time.perf_counter(), None
+
+        if self.executor == "process":
+            context = get_context("spawn")
+            manager = context.Manager()
+            pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            progress = manager.dict()
+        else:
+            manager = None
+            pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="replay")
+            progress = {}
+        self._progress = progress
+
+        try:
+            with pool:
+                futures = [
+                    pool.submit(replay_partition, self.bootstrap, topic, partition, low, high, progress,
+                                self.start_ms, self.end_ms, self.rollup_slots, self.join_latency)
+                    for (topic, partition), (low, high) in ranges.items()
+                ]
+                partials = [future.result() for future in futures]
+        finally:
+            self._progress = dict(progress)
+            if manager is not None:
+                manager.shutdown()
+
+        # deterministic merge: integer sums in (topic, partition) order
+        partials.sort(key=lambda partial: (partial["topic"], partial["partition"]))
+        counts = dict.fromkeys(COUNTER_NAMES, 0)
+        backfill = Backfill(self.join_latency)
+        rollups = RollupStore(*self.rollup_slots)
+        for partial in partials:
+            for name, value in partial["counters"].items():
+                counts[name] += value
+            backfill.merge(partial["backfill"])
+            rollups.merge_state(partial["rollups"])
+
+        with self._lock:
+            self._finished = time.perf_counter()
+        result = ReplayResult(counts, backfill, rollups, {tp: high for tp, (_, high) in ranges.items()},
+                              sum(partial["events"] for partial in partials), self._finished - self._started)
+        logger.info("Parallel replay: %d events from %d partitions in %.2fs (%.0f events/s, %d workers)",
+                    result.events, len(ranges), result.elapsed, result.events_per_sec, self.workers)
+        return result
+
+    def status(self) -> dict:
+        with self._lock:
+            ranges, started, finished = dict(self._ranges), self._started, self._finished
+        try:
+            progress = dict(self._progress)
+        except (OSError, EOFError):   # the manager process just went away
+            progress = {}
+        partitions = {}
+        total = 0
+        for (topic, partition), (low, high) in ranges.items():
+            offset, events = progress.get(f"{topic}-{partition}", (low, 0))
+            total += events
+            partitions[f"{topic}-{partition}"] = {
+                "start": low, "end": high, "offset": offset, "events": events,
+                "done": round((offset - low) / (high - low), 4) if high > low else 1.0,
+            }
+        elapsed = ((finished or time.perf_counter()) - started) if started else 0.0
+        return {
+            "running": started is not None and finished is None,
+            "workers": self.workers,
+            "executor": self.executor,
+            "events": total,
+            "elapsed_seconds": round(elapsed, 3),
+            "events_per_sec": round(total / elapsed, 1) if elapsed > 0 else 0.0,
+            "partitions": partitions,
+        }
@@ -0,0 +1,187 @@
+"""
+Per-minute dimensional rollups for analytics_consumer, with range, group-by
+and top-K queries.
+
+Every event is recorded in the bucket for its event-time minute, under one
+or more dimensions:
+
+- restaurant: orders per `restaurantId` ("unknown" when the order has none)
+- sku:        units ordered per SKU
+- outcome:    reservation results ("reserved", "out_of_stock", "invalid_items")
+- shortage:   failed orders per SKU that was short
+
+Buckets live in two fixed-size rings, indexed by time modulo the ring size:
+one-minute buckets for `minute_slots` minutes and one-hour rollups for
+`hour_slots` hours. Both are updated on write. A query over a range reads
+whole hours from the hour ring and only the ragged edges from the minute
+ring, so its cost is O(buckets in range) however long the service has run;
+a range is first clamped to what the hour ring retains, so an old `from`
+does not walk years of empty buckets.
+Memory is fixed by the ring sizes times the distinct keys per bucket.
+
+There is a single writer (the consumer thread) and any number of readers,
+with no lock. A recycled slot gets a fresh dict, so readers copy a bucket
+with dict.copy() (atomic under the GIL) and re-check the slot's stamp.
+"""
+
+import heapq
+from array import array
+
+DIMENSIONS = ("restaurant", "sku", "outcome", "shortage")
+
+
+def event_dimensions(event: dict) -> list[tuple[str, str, int]]:
+    """(dimension, key, value) rows an event contributes."""
+    event_type = event.get("eventType")
+    if event_type == "OrderPlaced":
+        rows = [("restaurant", str(event.get("restaurantId") or "unknown"), 1)]
+        for item in event.get("items") or ():
+            if isinstance(item, dict) and isinstance(item.get("qty"), int):
+                rows.append(("sku", str(item.get("sku")), item["qty"]))
+        return rows
+    if event_type == "InventoryReserved":
+        return [("outcome", "reserved", 1)]
+    if event_type == "InventoryFailed":
+        rows = [("outcome", str(event.get("reason") or "failed").lower(), 1)]
+        rows.extend(("shortage", str(sku), 1) for sku in (event.get("shortages") or {}))
+        return rows
+    return []
+
+
+class _Ring:
+    """Fixed number of time buckets; bucket `t` lives in slot t % slots. Single writer."""
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.stamps = array("q", [-1]) * slots
+        self.buckets: list[dict[str, dict[str, int]]] = [{} for _ in range(slots)]
+        self.newest = -1
+
+    def add(self, t: int, dimension: str, key: str, value: int) -> bool:
+        if t <= self.newest - self.slots:
+            return False                       # older than the ring holds
+        i = t % self.slots
+        if self.stamps[i] != t:
+            self.buckets[i] = {}               # recycle: fresh dict, readers keep the old one
+            self.stamps[i] = t
+        counts = self.buckets[i].get(dimension)
+        if counts is None:
+            counts = self.buckets[i][dimension] = {}
+        counts[key] = counts.get(key, 0) + value
+        if t > self.newest:
+            self.newest = t
+        return True
+
+    def read(self, t: int, dimension: str) -> dict[str, int] | None:
+        i = t % self.slots
+        if self.stamps[i] != t:
+            return None
+        counts = self.buckets[i].get(dimension)
+        counts = counts.copy() if counts else None
+        return counts if self.stamps[i] == t else None
+
+    def holds(self, t: int) -> bool:
+        return self.newest - self.slots < t <= self.newest
+
+    def items(self):
+        for i in range(self.slots):
+            if self.stamps[i] >= 0:
+                yield self.stamps[i], self.buckets[i]
+
+
+class RollupStore:
+    def __init__(self, minute_slots: int = 1440, hour_slots: int = 168):
+        self.minute_slots = minute_slots
+        self.hour_slots = hour_slots
+        self.reset()
+
+    def reset(self):
+        self.minutes = _Ring(self.minute_slots)
+        self.hours = _Ring(self.hour_slots)
+        self.dropped = 0          # events older than the hour ring
+
+    def record(self, minute: int, event: dict):
+        """Add an event at its event-time minute. Consumer thread only."""
+        for dimension, key, value in event_dimensions(event):
+            self.add(minute, dimension, key, value)
+
+    def add(self, minute: int, dimension: str, key: str, value: int = 1):
+        self.minutes.add(minute, dimension, key, value)
+        if not self.hours.add(minute // 60, dimension, key, value):
+            self.dropped += 1
+
+    def _clamp(self, start: int, end: int) -> tuple[int, int]:
+        """[start, end) cut down to the minutes the hour ring still holds (empty when nothing is retained)."""
+        newest = self.hours.newest
+        if newest < 0:
+            return start, start
+        start = max(start, (newest - self.hour_slots + 1) * 60)
+        end = min(end, (newest + 1) * 60)
+        return start, max(start, end)
+
+    def _plan(self, start: int, end: int) -> list[tuple[_Ring, int]]:
+        """Buckets covering minutes [start, end): whole hours from the hour ring, edges from the minute ring."""
+        plan = []
+        minute, end = self._clamp(start, end)
+        while minute < end:
+            hour = minute // 60
+            if minute % 60 == 0 and minute + 60 <= end:
+                plan.append((self.hours, hour))
+                minute += 60
+                continue
+            if self.minutes.holds(minute):
+                plan.append((self.minutes, minute))
+            minute += 1
+        return plan
+
+    def totals(self, dimension: str, start: int, end: int) -> tuple[dict[str, int], int]:
+        """Per-key totals over minutes [start, end), and the number of buckets read."""
+        totals: dict[str, int] = {}
+        plan = self._plan(start, end)
+        for ring, t in plan:
+            counts = ring.read(t, dimension)
+            if counts:
+                for key, value in counts.items():
+                    totals[key] = totals.get(key, 0) + value
+        return totals, len(plan)
+
+    def top(self, dimension: str, start: int, end: int, k: int) -> tuple[list[tuple[str, int]], int]:
+        totals, scanned = self.totals(dimension, start, end)
+        # largest first, ties by key: the same order as a full sort
+        return heapq.nsmallest(k, totals.items(), key=lambda kv: (-kv[1], kv[0])), scanned
+
+    def series(self, dimension: str, start: int, end: int, step: int,
+               key: str | None = None) -> tuple[list[tuple[int, int]], int]:
+        """(bucket start minute, value) for every non-empty `step`-minute bucket (1 or 60) in [start, end),
+        for one key or all keys, and the number of buckets read."""
+        points = []
+        scanned = 0
+        start, end = self._clamp(start, end)
+        for bucket in range(start - start % step, end, step):
+            value = 0
+            plan = self._plan(max(bucket, start), min(bucket + step, end))
+            scanned += len(plan)
+            for ring, t in plan:
+                counts = ring.read(t, dimension)
+                if counts:
+                    value += counts.get(key, 0) if key is not None else sum(counts.values())
+            if value:
+                points.append((bucket, value))
+        return points, scanned
+
+    def to_state(self) -> dict:
+        """JSON-serialisable contents of both rings (for checkpoints and replay merges)."""
+        return {
+            "minutes": sorted([t, bucket] for t, bucket in self.minutes.items()),
+            "hours": sorted([t, bucket] for t, bucket in self.hours.items()),
+            "dropped": self.dropped,
+        }
+
+    def merge_state(self, state: dict):
+        """Add the contents of a to_state() result (summing with what is already here)."""
+        for ring, rows in ((self.minutes, state["minutes"]), (self.hours, state["hours"])):
+            for t, bucket in rows:
+                for dimension, counts in bucket.items():
+                    for key, value in counts.items():
+                        ring.add(t, dimension, key, value)
+        self.dropped += state["dropped"]
@@ -0,0 +1,297 @@
+"""
+Event-time windowing for analytics_consumer.
+
+Events are counted into one-minute panes keyed by epoch minute, an integer.
+Every window is a sum of panes:
+
+- tumbling "1m" and "1h" windows: size == slide
+- sliding "5m" window: five minutes wide, sliding by one minute
+
+Each input partition has its own watermark: the newest event time seen in
+that partition, less `allowed_lateness` minutes. The engine's watermark is
+the minimum over the partitions seen so far, as in Kafka Streams and Flink.
+So a partition that races ahead (for example while a consumer reads
+partitions batch by batch) cannot make the others' events late. A window
+closes once its end is at or before the watermark. Its count is then
+appended to a bounded history, and panes no window can still need are
+evicted. An event older than the watermark is late: it is counted in
+`late_events` and not added to any window, so closed results never change.
+Partitions announced with expect_partitions() (the consumer's assignment)
+hold the watermark until they have sent an event. Likewise a partition that
+stops sending holds it back, so windows stay open longer but nothing is
+dropped. Revoked partitions are released with release_partitions().
+
+Memory is bounded by the largest window plus the lateness (open panes) and
+by `retention` closed results per window, however long the consumer runs.
+
+Timestamps are turned into epoch minutes without datetime formatting: the
+"YYYY-MM-DDTHH:MM" prefix plus UTC offset is parsed once and memoised, since
+events arrive roughly in time order.
+"""
+
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+MINUTE_MS = 60_000
+
+
+class WindowSpec(NamedTuple):
+    name: str
+    size: int    # minutes
+    slide: int   # minutes; == size for tumbling windows
+
+
+DEFAULT_WINDOWS = (
+    WindowSpec("1m", 1, 1),
+    WindowSpec("5m", 5, 1),
+    WindowSpec("1h", 60, 60),
+)
+
+_minute_cache: dict[str, int] = {}
+
+
+def parse_time_ms(value: str) -> int | None:
+    """ISO-8601 timestamp -> epoch milliseconds (naive times are UTC), or None if it cannot be parsed."""
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (ValueError, AttributeError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return round(dt.timestamp() * 1000)
+
+
+def _offset(created_at: str) -> tuple[str, int]:
+    """UTC offset of an ISO-8601 timestamp ("" if naive) and how many trailing characters spell it."""
+    if created_at.endswith("Z"):
+        return "+00:00", 1
+    if len(created_at) > 19 and created_at[-6] in "+-" and created_at[-3] == ":":
+        return created_at[-6:], 6
+    return "", 0
+
+
+def event_minute(created_at) -> int | None:
+    """Epoch minute of an ISO-8601 timestamp, or None if it cannot be parsed. Naive times are UTC."""
+    if not isinstance(created_at, str) or len(created_at) < 16:
+        return None
+    offset, _ = _offset(created_at)
+    key = created_at[:16] + offset
+    minute = _minute_cache.get(key)
+    if minute is None:
+        try:
+            dt = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        minute = int(dt.timestamp()) // 60
+        if len(_minute_cache) >= 4096:
+            _minute_cache.clear()
+        _minute_cache[key] = minute
+    return minute
+
+
+def event_ms(created_at) -> int | None:
+    """Epoch milliseconds of an ISO-8601 timestamp: the memoised minute plus the seconds field."""
+    minute = event_minute(created_at)
+    if minute is None:
+        return None
+    seconds = created_at[17:len(created_at) - _offset(created_at)[1]]
+    if not seconds:
+        return minute * MINUTE_MS
+    try:
+        return minute * MINUTE_MS + round(float(seconds) * 1000)
+    except ValueError:
+        return parse_time_ms(created_at)
+
+
+def order_minute(event: dict, timestamp_ms: int | None = None) -> int | None:
+    """Event-time minute of an order: its createdAt, else the Kafka message timestamp."""
+    minute = event_minute(event.get("createdAt"))
+    if minute is None and timestamp_ms:
+        minute = timestamp_ms // MINUTE_MS
+    return minute
+
+
+def _partition_name(partition) -> str:
+    if isinstance(partition, tuple):
+        return "-".join(str(part) for part in partition)
+    return "all" if partition is None else str(partition)
+
+
+def minute_label(minute: int) -> str:
+    """Epoch minute -> "YYYY-MM-DDTHH:MM" (UTC). Only used when rendering results."""
+    return time.strftime("%Y-%m-%dT%H:%M", time.gmtime(minute * 60))
+
+
+class WindowEngine:
+    """Counts events into tumbling and sliding event-time windows. Not thread-safe."""
+
+    def __init__(self, windows=DEFAULT_WINDOWS, allowed_lateness: int = 2, retention: int = 60):
+        self.windows = tuple(windows)
+        self.allowed_lateness = allowed_lateness
+        self.retention = retention
+        self._horizon = max(spec.size for spec in self.windows)
+        self.reset()
+
+    def reset(self):
+        self.panes: dict[int, int] = {}          # epoch minute -> count, for minutes >= watermark - horizon
+        self.closed = {spec.name: deque(maxlen=self.retention) for spec in self.windows}  # (start, count)
+        self._next_end: dict[str, int | None] = {spec.name: None for spec in self.windows}
+        self.max_minute: int | None = None
+        self.partition_max: dict = {}            # partition -> newest minute seen in it
+        self.waiting: set = set()                # expected partitions that have not sent an event yet
+        self.watermark: int | None = None        # every minute < watermark is final
+        self.late_events = 0
+
+    def add(self, minute: int, count: int = 1, partition=None) -> bool:
+        """Count an event at `minute` from `partition` (any hashable, e.g. (topic, partition));
+        returns False (and counts it as late) if its pane is already final."""
+        newest = self.partition_max.get(partition)
+        advanced = newest is None or minute > newest
+        if advanced:
+            self.partition_max[partition] = minute
+        if self.watermark is not None and minute < self.watermark:
+            self.late_events += count
+            return False
+        self.panes[minute] = self.panes.get(minute, 0) + count
+        if self.max_minute is None or minute > self.max_minute:
+            self.max_minute = minute
+        if advanced:
+            self.waiting.discard(partition)
+            self._advance_partitions()
+        return True
+
+    def expect_partitions(self, partitions):
+        """Hold the watermark until each of `partitions` (e.g. just assigned) has sent an event."""
+        self.waiting.update(p for p in partitions if p not in self.partition_max)
+
+    def release_partitions(self, partitions):
+        """Stop waiting for `partitions` (e.g. revoked from this consumer) before advancing the watermark."""
+        for partition in partitions:
+            self.partition_max.pop(partition, None)
+            self.waiting.discard(partition)
+        self._advance_partitions()
+
+    def _advance_partitions(self):
+        if self.partition_max and not self.waiting:
+            self._advance(min(self.partition_max.values()) - self.allowed_lateness)
+
+    def _advance(self, watermark: int):
+        if self.watermark is not None and watermark <= self.watermark:
+            return
+        self.watermark = watermark
+        for spec in self.windows:
+            self._close_windows(spec, watermark)
+        floor = watermark - self._horizon
+        for minute in [m for m in self.panes if m < floor]:
+            del self.panes[minute]
+
+    def _first_end(self, spec: WindowSpec, minute: int) -> int:
+        """End of the earliest window of `spec` that contains `minute`."""
+        return (minute // spec.slide + 1) * spec.slide
+
+    def _close_windows(self, spec: WindowSpec, watermark: int):
+        end = self._next_end[spec.name]
+        if end is None:
+            end = self._first_end(spec, min(self.panes))
+        closed = self.closed[spec.name]
+        while end <= watermark:
+            start = end - spec.size
+            count = sum(self.panes.get(m, 0) for m in range(start, end))
+            if count:
+                closed.append((start, count))
+                end += spec.slide
+                continue
+            # empty window: skip straight to the next one that can hold an event
+            later = [m for m in self.panes if m >= end]
+            if not later:
+                end = self._first_end(spec, watermark)
+                break
+            end = max(end + spec.slide, self._first_end(spec, min(later)))
+        self._next_end[spec.name] = end
+
+    def open_windows(self, spec: WindowSpec) -> dict[int, int]:
+        """Windows of `spec` that have not closed yet: start minute -> count so far."""
+        end = self._next_end[spec.name]
+        if end is None or self.max_minute is None:
+            return {}
+        result = {}
+        while end - spec.size <= self.max_minute:
+            start = end - spec.size
+            count = sum(self.panes.get(m, 0) for m in range(start, end))
+            if count:
+                result[start] = count
+            end += spec.slide
+        return result
+
+    def per_minute(self) -> dict[str, int]:
+        """Retained one-minute counts (closed history plus open panes), keyed by minute label."""
+        counts = {}
+        if self.windows and self.windows[0].size == 1:
+            counts.update(self.closed[self.windows[0].name])
+        counts.update((m, c) for m, c in self.panes.items() if self.watermark is None or m >= self.watermark)
+        return {minute_label(m): counts[m] for m in sorted(counts)}
+
+    def rebuild(self, minutes: dict[int, int], partition_max: dict | None = None):
+        """Reset and recompute from complete per-minute counts, so nothing is late. `partition_max`
+        (partition -> newest minute read from it) sets the watermarks live events continue from;
+        without it the watermark trails the newest minute."""
+        self.reset()
+        if not minutes:
+            return
+        self.panes = dict(minutes)
+        self.max_minute = max(minutes)
+        self.partition_max = dict(partition_max or {})
+        newest = min(self.partition_max.values()) if self.partition_max else self.max_minute
+        self._advance(newest - self.allowed_lateness)
+
+    def to_state(self) -> dict:
+        """JSON-serialisable engine state (for checkpoints); see load_state()."""
+        return {
+            "windows": [list(spec) for spec in self.windows],
+            "allowed_lateness": self.allowed_lateness,
+            "panes": sorted(self.panes.items()),
+            "closed": {name: list(closed) for name, closed in self.closed.items()},
+            "next_end": dict(self._next_end),
+            "max_minute": self.max_minute,
+            "partitions": [[list(p) if isinstance(p, tuple) else p, m] for p, m in self.partition_max.items()],
+            "watermark": self.watermark,
+            "late_events": self.late_events,
+        }
+
+    def load_state(self, state: dict):
+        """Replace this engine's state with a to_state() result. Raises ValueError if the window layout differs."""
+        if ([tuple(spec) for spec in state["windows"]] != [tuple(spec) for spec in self.windows]
+                or state["allowed_lateness"] != self.allowed_lateness):
+            raise ValueError("checkpoint was taken with a different window configuration")
+        self.reset()
+        self.panes = {minute: count for minute, count in state["panes"]}
+        for name, closed in state["closed"].items():
+            self.closed[name].extend((start, count) for start, count in closed)
+        self._next_end = dict(state["next_end"])
+        self.max_minute = state["max_minute"]
+        # checkpoints from before per-partition watermarks have none: live partitions register as they arrive
+        self.partition_max = {tuple(p) if isinstance(p, list) else p: m for p, m in state.get("partitions", [])}
+        self.watermark = state["watermark"]
+        self.late_events = state["late_events"]
+
+    def snapshot(self) -> dict:
+        return {
+            "watermark": minute_label(self.watermark) if self.watermark is not None else None,
+            "allowed_lateness_minutes": self.allowed_lateness,
+            "late_events": self.late_events,
+            "newest_per_partition": {_partition_name(p): minute_label(m)
+                                     for p, m in sorted(self.partition_max.items(), key=str)},
+            "windows": {
+                spec.name: {
+                    "size_minutes": spec.size,
+                    "slide_minutes": spec.slide,
+                    "open": {minute_label(s): c for s, c in sorted(self.open_windows(spec).items())},
+                    "closed": [{"start": minute_label(s), "count": c} for s, c in self.closed[spec.name]],
+                }
+                for spec in self.windows
+            },
+        }
@@ -1,12 +1,23 @@
-import json
 import logging
 import os
+import queue
 import random
+import signal
+import socket
+import threading
 import time
 import uuid
+import zlib
+from collections import deque
 from datetime import datetime, timezone
 
-from confluent_kafka import Consumer, Producer, KafkaError
+from confluent_kafka import OFFSET_BEGINNING, Consumer, KafkaError, KafkaException, Producer, TopicPartition
+
+from common.consumer_metrics import ConsumerMetrics, serve_metrics
+from common.idempotency import store_from_env
+from common.kafka_profiles import producer_config
+from common.serialization import decode_event, header_value, serializer_from_env
+from common.stock_ledger import StockLedger, parse_initial_stock
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("inventory_consumer")
@@ -15,23 +26,60 @@ KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
 INVENTORY_FAIL_RATE = float(os.getenv("INVENTORY_FAIL_RATE", "0.0"))
 CONSUMER_THROTTLE_MS = int(os.getenv("CONSUMER_THROTTLE_MS", "0"))
 
-INPUT_TOPIC = "orders"
-OUTPUT_TOPIC = "inventory-events"
+# Run mode: "single" polls and commits one message at a time; "batch" consumes
+# up to CONSUMER_BATCH_SIZE messages (waiting at most CONSUMER_BATCH_TIMEOUT_MS)
+# and commits offsets asynchronously at most every CONSUMER_COMMIT_INTERVAL_MS;
+# "transactional" commits each batch's output events and input offsets in one
+# Kafka transaction (exactly-once); "parallel" hands messages to
+# CONSUMER_WORKERS threads, keeping order per CONSUMER_ORDERING (key|partition)
+CONSUMER_MODE = os.getenv("CONSUMER_MODE", "single")
+CONSUMER_BATCH_SIZE = int(os.getenv("CONSUMER_BATCH_SIZE", "500"))
+CONSUMER_BATCH_TIMEOUT_MS = int(os.getenv("CONSUMER_BATCH_TIMEOUT_MS", "100"))
+CONSUMER_COMMIT_INTERVAL_MS = int(os.getenv("CONSUMER_COMMIT_INTERVAL_MS", "1000"))
+CONSUMER_WORKERS = int(os.getenv("CONSUMER_WORKERS", "8"))
+CONSUMER_ORDERING = os.getenv("CONSUMER_ORDERING", "key")
+CONSUMER_WORKER_QUEUE_SIZE = int(os.getenv("CONSUMER_WORKER_QUEUE_SIZE", "100"))
+# must be stable per consumer instance; the group generation fences zombies (KIP-447)
+KAFKA_TRANSACTIONAL_ID = os.getenv("KAFKA_TRANSACTIONAL_ID", f"inventory-consumer-{socket.gethostname()}")
+
+INPUT_TOPIC = os.getenv("INPUT_TOPIC", "orders")
+OUTPUT_TOPIC = os.getenv("OUTPUT_TOPIC", "inventory-events")
+CONSUMER_GROUP_ID = os.getenv("CONSUMER_GROUP_ID", "inventory-service-group")
+
+# Prometheus lag/throughput endpoint (0 disables): librdkafka statistics every
+# KAFKA_STATS_INTERVAL_MS, processing time of one message in CONSUMER_METRICS_SAMPLE_EVERY
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9102"))
+KAFKA_STATS_INTERVAL_MS = int(os.getenv("KAFKA_STATS_INTERVAL_MS", "5000"))
+CONSUMER_METRICS_SAMPLE_EVERY = int(os.getenv("CONSUMER_METRICS_SAMPLE_EVERY", "16"))
+
+# EVENT_FORMAT=json|struct for produced events; input events are auto-detected
+serializer = serializer_from_env()
+EVENT_HEADERS = [("content-type", serializer.content_type.encode())]
+
+# Idempotency: bounded store of processed order IDs (TTL + capacity), persisted
+# to IDEMPOTENCY_LOG_PATH when set so a restart does not re-reserve old orders
+processed_orders = store_from_env()
+
+# Stock ledger: unknown SKUs start with INVENTORY_DEFAULT_STOCK units
+ledger = StockLedger(
+    initial_stock=parse_initial_stock(os.getenv("INVENTORY_INITIAL_STOCK", "")),
+    default_available=int(os.getenv("INVENTORY_DEFAULT_STOCK", "1000000")),
+)
 
-# Idempotency: track processed order IDs
-processed_orders: set[str] = set()
+consumer_metrics = ConsumerMetrics("inventory_consumer", CONSUMER_METRICS_SAMPLE_EVERY, KAFKA_STATS_INTERVAL_MS)
 
 consumer_conf = {
     "bootstrap.servers": KAFKA_BOOTSTRAP_SERVERS,
-    "group.id": "inventory-service-group",
+    "group.id": CONSUMER_GROUP_ID,
     "auto.offset.reset": "earliest",
     "enable.auto.commit": False,
+    **consumer_metrics.config(),
 }
 
-producer_conf = {
+# KAFKA_PRODUCER_PROFILE selects compression/linger/batching/acks for inventory-events
+producer_conf = producer_config({
     "bootstrap.servers": KAFKA_BOOTSTRAP_SERVERS,
-    "linger.ms": 5,
-}
+})
 
 
 def delivery_report(err, msg):
@@ -39,14 +87,45 @@ def delivery_report(err, msg):
         logger.error("Delivery failed: %s", err)
 
 
-def process_order(event: dict, producer: Producer):
+def commit_report(err, partitions):
+    if err:
+        logger.error("Offset commit failed: %s", err)
+
+
+consumer_conf["on_commit"] = commit_report
+
+
+def decode_message(msg) -> dict | None:
+    try:
+        return decode_event(msg.value(), header_value(msg.headers()))
+    except ValueError as e:
+        logger.error("Failed to decode message: %s", e)
+        return None
+
+
+def reserve_items(order_id: str, items: list) -> dict | None:
+    """Reserve all items in the ledger; returns shortages (empty when reserved), None if items are invalid."""
+    try:
+        return ledger.reserve(order_id, items).shortages
+    except (TypeError, ValueError) as e:
+        logger.warning("Invalid items for order %s: %s", order_id, e)
+        return None
+
+
+def process_order(event: dict, producer: Producer, pending: set | None = None):
+    """Reserve stock for one order and produce its inventory event.
+
+    With `pending` (transactional mode) the order ID is collected there instead
+    of being recorded in `processed_orders`, so the caller can record it once the
+    transaction commits or release its reservation if the transaction aborts.
+    """
     order_id = event.get("orderId")
     if not order_id:
         logger.warning("Event missing orderId, skipping: %s", event)
         return
 
     # Idempotency check
-    if order_id in processed_orders:
+    if order_id in processed_orders or (pending is not None and order_id in pending):
         logger.info("Order %s already processed, skipping", order_id)
         return
 
@@ -54,8 +133,10 @@ def process_order(event: dict, producer: Producer):
     if CONSUMER_THROTTLE_MS > 0:
         time.sleep(CONSUMER_THROTTLE_MS / 1000.0)
 
-    # Failure injection
-    if INVENTORY_FAIL_RATE > 0 and random.random() < INVENTORY_FAIL_RATE:
+    # Failure injection, then the real reservation against the stock ledger
+    injected = INVENTORY_FAIL_RATE > 0 and random.random() < INVENTORY_FAIL_RATE
+    shortages = {} if injected else reserve_items(order_id, event.get("items", []))
+    if injected:
         result_event = {
             "eventId": str(uuid.uuid4()),
             "eventType": "InventoryFailed",
@@ -64,6 +145,17 @@ def process_order(event: dict, producer: Producer):
             "createdAt": datetime.now(timezone.utc).isoformat(),
         }
         logger.info("Inventory FAILED for order %s (injected)", order_id)
+    elif shortages is None or shortages:
+        result_event = {
+            "eventId": str(uuid.uuid4()),
+            "eventType": "InventoryFailed",
+            "orderId": order_id,
+            "reason": "INVALID_ITEMS" if shortages is None else "OUT_OF_STOCK",
+            "createdAt": datetime.now(timezone.utc).isoformat(),
+        }
+        if shortages:
+            result_event["shortages"] = shortages
+        logger.info("Inventory FAILED for order %s (%s)", order_id, result_event["reason"])
     else:
         result_event = {
             "eventId": str(uuid.uuid4()),
@@ -74,53 +166,335 @@ def process_order(event: dict, producer: Producer):
         }
         logger.info("Inventory RESERVED for order %s", order_id)
 
-    processed_orders.add(order_id)
+    if pending is None:
+        processed_orders.add(order_id)
+    else:
+        pending.add(order_id)
 
     producer.produce(
         OUTPUT_TOPIC,
         key=order_id,
-        value=json.dumps(result_event),
+        value=serializer.encode(result_event),
+        headers=EVENT_HEADERS,
         callback=delivery_report,
     )
     producer.poll(0)
 
 
-def main():
-    consumer = Consumer(consumer_conf)
-    producer = Producer(producer_conf)
+def handle_message(msg, producer: Producer, pending: set | None = None):
+    """Decode and process one message, timing one in CONSUMER_METRICS_SAMPLE_EVERY."""
+    sampled = consumer_metrics.sample()
+    started = time.perf_counter() if sampled else 0.0
+    event = decode_message(msg)
+    if event is not None:
+        process_order(event, producer, pending)
+    if sampled:
+        consumer_metrics.observe_processing((time.perf_counter() - started) * 1000.0)
+
+
+def run_single(consumer: Consumer, producer: Producer):
+    """One message per poll, committed synchronously right after processing."""
     consumer.subscribe([INPUT_TOPIC])
+    while True:
+        msg = consumer_metrics.poll(consumer, 1.0)
+        if msg is None:
+            continue
+        if msg.error():
+            if msg.error().code() == KafkaError._PARTITION_EOF:
+                continue
+            logger.error("Consumer error: %s", msg.error())
+            continue
 
-    logger.info(
-        "Inventory consumer started (fail_rate=%.2f, throttle_ms=%d)",
-        INVENTORY_FAIL_RATE,
-        CONSUMER_THROTTLE_MS,
-    )
+        handle_message(msg, producer)
+        consumer.commit(message=msg)
 
+
+class OffsetTracker:
+    """Next offset to commit per partition, committed in one request per interval.
+
+    At-least-once: offsets are only committed after the producer has flushed
+    the output events of every message up to them.
+    """
+
+    def __init__(self, consumer: Consumer, producer: Producer, interval_ms: int):
+        self.consumer = consumer
+        self.producer = producer
+        self.interval = interval_ms / 1000.0
+        self.pending: dict[tuple[str, int], int] = {}
+        self.last_commit = time.monotonic()
+        self.commits = 0
+
+    def mark(self, msg):
+        self.pending[(msg.topic(), msg.partition())] = msg.offset() + 1
+
+    def maybe_commit(self):
+        if time.monotonic() - self.last_commit >= self.interval:
+            self.commit(asynchronous=True)
+
+    def commit(self, asynchronous: bool = True, partitions: set | None = None):
+        """Commit pending offsets (only those of `partitions`, a set of (topic, partition), when given)."""
+        keys = [key for key in self.pending if partitions is None or key in partitions]
+        self.last_commit = time.monotonic()
+        if not keys:
+            return
+        self.producer.flush(30)
+        offsets = [TopicPartition(topic, partition, self.pending.pop((topic, partition)))
+                   for topic, partition in keys]
+        self.consumer.commit(offsets=offsets, asynchronous=asynchronous)
+        self.commits += 1
+
+
+def run_batched(consumer: Consumer, producer: Producer):
+    """consume() batches, processed in order, offsets committed asynchronously per interval."""
+    tracker = OffsetTracker(consumer, producer, CONSUMER_COMMIT_INTERVAL_MS)
+
+    def on_revoke(c, partitions):
+        # commit what was processed before another member takes the partitions over
+        tracker.commit(asynchronous=False, partitions={(p.topic, p.partition) for p in partitions})
+
+    consumer.subscribe([INPUT_TOPIC], on_revoke=on_revoke)
+    processed = 0
     try:
         while True:
-            msg = consumer.poll(1.0)
-            if msg is None:
-                continue
-            if msg.error():
-                if msg.error().code() == KafkaError._PARTITION_EOF:
+            messages = consumer_metrics.consume(consumer, CONSUMER_BATCH_SIZE, CONSUMER_BATCH_TIMEOUT_MS / 1000.0)
+            for msg in messages:
+                if msg.error():
+                    if msg.error().code() != KafkaError._PARTITION_EOF:
+                        logger.error("Consumer error: %s", msg.error())
                     continue
-                logger.error("Consumer error: %s", msg.error())
-                continue
+                handle_message(msg, producer)
+                tracker.mark(msg)
+                processed += 1
+            tracker.maybe_commit()
+    finally:
+        tracker.commit(asynchronous=False)
+        logger.info("Batched consumer processed %d messages in %d commits", processed, tracker.commits)
+
+
+class PartitionProgress:
+    """Per-partition completion tracking for out-of-order processing.
+
+    Offsets are registered in consume order and completed in any order; only
+    the contiguous completed prefix of each partition is ever committed, so an
+    unfinished message always gets redelivered after a crash or rebalance.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: dict[tuple[str, int], deque] = {}
+        self._done: dict[tuple[str, int], set] = {}
+
+    def register(self, msg):
+        key = (msg.topic(), msg.partition())
+        with self._lock:
+            self._in_flight.setdefault(key, deque()).append(msg.offset())
+            self._done.setdefault(key, set())
+
+    def complete(self, msg):
+        with self._lock:
+            self._done[(msg.topic(), msg.partition())].add(msg.offset())
+
+    def committable(self) -> dict[tuple[str, int], int]:
+        """Pop the contiguous completed prefix of every partition; {(topic, partition): next offset}."""
+        ready = {}
+        with self._lock:
+            for key, in_flight in self._in_flight.items():
+                done = self._done[key]
+                last = None
+                while in_flight and in_flight[0] in done:
+                    last = in_flight.popleft()
+                    done.discard(last)
+                if last is not None:
+                    ready[key] = last + 1
+        return ready
+
+    def forget(self, partitions: set):
+        with self._lock:
+            for key in partitions:
+                self._in_flight.pop(key, None)
+                self._done.pop(key, None)
+
+
+def run_parallel(consumer: Consumer, producer: Producer):
+    """Dispatch messages to a worker pool; per-key (or per-partition) order is kept
+    by always routing the same key to the same worker."""
+    tracker = OffsetTracker(consumer, producer, CONSUMER_COMMIT_INTERVAL_MS)
+    progress = PartitionProgress()
+    queues = [queue.Queue(maxsize=CONSUMER_WORKER_QUEUE_SIZE) for _ in range(CONSUMER_WORKERS)]
+    failure: list[BaseException] = []
 
+    def worker(q: queue.Queue):
+        while True:
+            msg = q.get()
             try:
-                event = json.loads(msg.value().decode("utf-8"))
-            except (json.JSONDecodeError, UnicodeDecodeError) as e:
-                logger.error("Failed to decode message: %s", e)
-                consumer.commit(message=msg)
-                continue
+                if msg is None:
+                    return
+                handle_message(msg, producer)
+                progress.complete(msg)
+            except Exception as e:
+                # leave the offset incomplete so it is redelivered, and stop the consumer
+                logger.exception("Worker failed on offset %d of partition %d", msg.offset(), msg.partition())
+                failure.append(e)
+            finally:
+                q.task_done()
+
+    def route(msg) -> int:
+        if CONSUMER_ORDERING == "key" and msg.key() is not None:
+            return zlib.crc32(msg.key()) % CONSUMER_WORKERS
+        return msg.partition() % CONSUMER_WORKERS
+
+    def commit_ready(asynchronous: bool, partitions: set | None = None):
+        tracker.pending.update(progress.committable())
+        tracker.commit(asynchronous=asynchronous, partitions=partitions)
+
+    def on_revoke(c, partitions):
+        # let the workers finish what they hold, then commit it before the partitions move
+        for q in queues:
+            q.join()
+        revoked = {(p.topic, p.partition) for p in partitions}
+        commit_ready(asynchronous=False, partitions=revoked)
+        progress.forget(revoked)
+
+    threads = [threading.Thread(target=worker, args=(q,), daemon=True) for q in queues]
+    for t in threads:
+        t.start()
+    consumer.subscribe([INPUT_TOPIC], on_revoke=on_revoke)
+    logger.info("Parallel consumer: %d workers, ordering by %s", CONSUMER_WORKERS, CONSUMER_ORDERING)
+    try:
+        while not failure:
+            messages = consumer_metrics.consume(consumer, CONSUMER_BATCH_SIZE, CONSUMER_BATCH_TIMEOUT_MS / 1000.0)
+            for msg in messages:
+                if msg.error():
+                    if msg.error().code() != KafkaError._PARTITION_EOF:
+                        logger.error("Consumer error: %s", msg.error())
+                    continue
+                progress.register(msg)
+                queues[route(msg)].put(msg)
+            if time.monotonic() - tracker.last_commit >= tracker.interval:
+                commit_ready(asynchronous=True)
+        raise RuntimeError("Inventory worker failed") from failure[0]
+    finally:
+        for q in queues:
+            q.put(None)
+        for t in threads:
+            t.join(timeout=30)
+        commit_ready(asynchronous=False)
+
+
+def rewind_to_committed(consumer: Consumer):
+    """Seek every assigned partition back to its committed offset (after an aborted transaction)."""
+    for tp in consumer.committed(consumer.assignment(), timeout=10):
+        offset = tp.offset if tp.offset >= 0 else OFFSET_BEGINNING
+        consumer.seek(TopicPartition(tp.topic, tp.partition, offset))
 
-            process_order(event, producer)
-            consumer.commit(message=msg)
 
+def commit_transaction(producer: Producer):
+    while True:
+        try:
+            producer.commit_transaction()
+            return
+        except KafkaException as e:
+            if not e.args[0].retriable():
+                raise
+            logger.warning("Retrying transaction commit: %s", e)
+
+
+def abort_batch(producer: Producer, pending: set):
+    """Abort the open transaction; none of its events became visible, so undo its reservations."""
+    producer.abort_transaction()
+    for order_id in pending:
+        ledger.release(order_id)
+
+
+def run_transactional(consumer: Consumer, producer: Producer):
+    """One transaction per consume() batch: output events + input offsets commit atomically."""
+    producer.init_transactions()
+    consumer.subscribe([INPUT_TOPIC])
+    transactions = 0
+    aborted = 0
+    while True:
+        messages = consumer_metrics.consume(consumer, CONSUMER_BATCH_SIZE, CONSUMER_BATCH_TIMEOUT_MS / 1000.0)
+        if not messages:
+            continue
+        pending: set[str] = set()
+        producer.begin_transaction()
+        try:
+            for msg in messages:
+                if msg.error():
+                    if msg.error().code() != KafkaError._PARTITION_EOF:
+                        logger.error("Consumer error: %s", msg.error())
+                    continue
+                handle_message(msg, producer, pending)
+            producer.send_offsets_to_transaction(
+                consumer.position(consumer.assignment()),
+                consumer.consumer_group_metadata(),
+            )
+            commit_transaction(producer)
+        except KafkaException as e:
+            if not e.args[0].txn_requires_abort():
+                raise
+            logger.warning("Aborting transaction of %d messages: %s", len(messages), e)
+            abort_batch(producer, pending)
+            rewind_to_committed(consumer)
+            aborted += 1
+            continue
+        except KeyboardInterrupt:
+            # shutting down mid-batch: the batch will be re-consumed by whoever gets the partitions
+            abort_batch(producer, pending)
+            raise
+        for order_id in pending:
+            processed_orders.add(order_id)
+        transactions += 1
+        if transactions % 100 == 0:
+            logger.info("Committed %d transactions (%d aborted)", transactions, aborted)
+
+
+RUN_MODES = {
+    "single": run_single,
+    "batch": run_batched,
+    "transactional": run_transactional,
+    "parallel": run_parallel,
+}
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main():
+    # docker stop sends SIGTERM; shut down the same way as on Ctrl+C so the
+    # idempotency log is flushed and its pre-filter snapshotted
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    if CONSUMER_MODE not in RUN_MODES:
+        raise ValueError(f"Unknown CONSUMER_MODE {CONSUMER_MODE!r}, expected one of {sorted(RUN_MODES)}")
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT, consumer_metrics.render)
+    consumer = Consumer(consumer_conf)
+    if CONSUMER_MODE == "transactional":
+        producer = Producer({
+            **producer_conf,
+            "transactional.id": KAFKA_TRANSACTIONAL_ID,
+            "enable.idempotence": True,
+            "acks": "all",
+        })
+    else:
+        producer = Producer(producer_conf)
+
+    logger.info(
+        "Inventory consumer started (mode=%s, fail_rate=%.2f, throttle_ms=%d)",
+        CONSUMER_MODE,
+        INVENTORY_FAIL_RATE,
+        CONSUMER_THROTTLE_MS,
+    )
+
+    try:
+        RUN_MODES[CONSUMER_MODE](consumer, producer)
     except KeyboardInterrupt:
         logger.info("Shutting down inventory consumer")
     finally:
         producer.flush(timeout=10)
+        processed_orders.close()
+        logger.info("Idempotency store stats: %s", processed_orders.stats())
         consumer.close()
 
 
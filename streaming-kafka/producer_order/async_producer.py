@@ -0,0 +1,178 @@
+"""
+Awaitable wrapper around confluent_kafka.Producer.
+
+produce() returns an asyncio.Future that resolves once the broker has
+acknowledged the message, or fails with KafkaException. Delivery reports are
+serviced by a background thread that keeps calling poll(), so request
+handlers never have to poll() or flush() themselves.
+
+Backpressure: at most `max_in_flight` messages may be unacknowledged. When
+that limit is reached, or librdkafka's local queue is full (BufferError),
+produce() waits up to `enqueue_timeout` for room and then raises
+ProducerSaturatedError, which the API turns into 429/503 with Retry-After.
+
+Traffic: payload bytes handed to produce() are counted locally. From
+librdkafka's statistics callback come the size of the produced batches
+(per topic `batchsize`/`batchcnt`, after compression) and the bytes sent to
+the brokers (`tx_bytes`, which also counts request framing, retries and
+metadata traffic). Payload / batch bytes is the compression achieved.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import NamedTuple
+
+from confluent_kafka import KafkaException, Producer
+
+from common.metrics import Histogram, exponential_buckets
+
+logger = logging.getLogger("producer_order")
+
+
+class DeliveryResult(NamedTuple):
+    topic: str
+    partition: int
+    offset: int
+    latency_ms: float
+
+
+class ProducerSaturatedError(Exception):
+    """No room to enqueue within the wait budget; reason is "in_flight_limit" or "queue_full"."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"producer saturated ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _resolve(future: asyncio.Future, err, msg, started: float):
+    if future.done():
+        return
+    if err is not None:
+        future.set_exception(KafkaException(err))
+    else:
+        future.set_result(DeliveryResult(msg.topic(), msg.partition(), msg.offset(),
+                                          (time.perf_counter() - started) * 1000.0))
+
+
+class AsyncProducer:
+    def __init__(self, conf: dict, poll_interval: float = 0.1, max_in_flight: int = 50000,
+                 enqueue_timeout: float = 2.0, retry_after: float = 1.0):
+        self.payload_bytes = 0
+        self.broker_stats = {"tx_bytes": 0, "txmsg_bytes": 0, "txmsgs": 0}
+        # topic batch windows cover one statistics interval each, so they are summed here
+        self.batch_stats = {"batch_bytes": 0, "batches": 0, "batch_messages": 0}
+        self._stats_seq = 0
+        self.producer = Producer({"statistics.interval.ms": 1000, **conf, "stats_cb": self._on_stats})
+        self.poll_interval = poll_interval
+        self.max_in_flight = max_in_flight
+        self.enqueue_timeout = enqueue_timeout
+        self.retry_after = retry_after
+        self.in_flight = 0          # only touched on the event loop thread
+        self.rejected = {"in_flight_limit": 0, "queue_full": 0}
+        self.queue_depth = Histogram(exponential_buckets(1, 4, 10))            # 1 .. 262144 messages
+        self.produce_wait_ms = Histogram([0.01] + exponential_buckets(0.1, 2, 16))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._poll_loop, name="kafka-poll", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _poll_loop(self):
+        while not self._stop.is_set():
+            self.producer.poll(self.poll_interval)
+
+    def _on_stats(self, stats_json: str):
+        # runs on the poll thread; a single dict swap is atomic
+        stats = json.loads(stats_json)
+        self.broker_stats = {key: stats.get(key, 0) for key in self.broker_stats}
+        totals = dict(self.batch_stats)
+        for topic in stats.get("topics", {}).values():
+            batchsize, batchcnt = topic.get("batchsize", {}), topic.get("batchcnt", {})
+            totals["batch_bytes"] += batchsize.get("sum", 0)
+            totals["batches"] += batchsize.get("cnt", 0)
+            totals["batch_messages"] += batchcnt.get("sum", 0)
+        self.batch_stats = totals
+        self._stats_seq += 1
+
+    async def wait_for_stats(self, timeout: float = 3.0):
+        """Wait for the next statistics report (so batch and broker byte counts cover everything delivered)."""
+        seq = self._stats_seq
+        deadline = time.perf_counter() + timeout
+        while self._stats_seq == seq and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+
+    def traffic(self) -> dict:
+        return {"payload_bytes": self.payload_bytes, "wire_bytes": self.broker_stats["tx_bytes"],
+                **self.batch_stats}
+
+    def _saturated(self, reason: str, started: float) -> ProducerSaturatedError:
+        # a rejected produce waited too (up to enqueue_timeout), so it counts in produce_wait_ms
+        self.produce_wait_ms.observe((time.perf_counter() - started) * 1000.0)
+        self.rejected[reason] += 1
+        return ProducerSaturatedError(reason, self.retry_after)
+
+    def _delivered(self, future: asyncio.Future, err, msg, started: float):
+        self.in_flight -= 1
+        _resolve(future, err, msg, started)
+
+    async def produce(self, topic: str, value, key=None, headers=None) -> asyncio.Future:
+        """Enqueue a message, waiting (bounded) for room; the returned future resolves to a DeliveryResult."""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        deadline = started + self.enqueue_timeout
+        self.queue_depth.observe(len(self.producer))
+
+        while self.in_flight >= self.max_in_flight:
+            if time.perf_counter() >= deadline:
+                raise self._saturated("in_flight_limit", started)
+            await asyncio.sleep(0.005)
+
+        future = loop.create_future()
+
+        def on_delivery(err, msg):
+            try:
+                loop.call_soon_threadsafe(self._delivered, future, err, msg, started)
+            except RuntimeError:
+                pass  # event loop already closed (shutdown flush)
+
+        while True:
+            try:
+                self.producer.produce(topic, key=key, value=value, headers=headers, on_delivery=on_delivery)
+                break
+            except BufferError:
+                # librdkafka's local queue is full; the poll thread drains it as the broker acks
+                if time.perf_counter() >= deadline:
+                    raise self._saturated("queue_full", started)
+                await asyncio.sleep(0.005)
+        self.in_flight += 1
+        self.payload_bytes += len(value) + (len(key) if key is not None else 0)
+        self.produce_wait_ms.observe((time.perf_counter() - started) * 1000.0)
+        return future
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_length": len(self.producer),
+            "rejected": dict(self.rejected),
+            **self.traffic(),
+            "queue_depth": self.queue_depth.snapshot(),
+            "produce_wait_ms": self.produce_wait_ms.snapshot(),
+        }
+
+    def __len__(self) -> int:
+        """Messages still waiting in the local queue or in flight to the broker."""
+        return len(self.producer)
+
+    def close(self, timeout: float = 30.0) -> int:
+        """Stop the poll thread and flush; returns the number of undelivered messages."""
+        self._stop.set()
+        self._thread.join(timeout=timeout)
+        remaining = self.producer.flush(timeout)
+        if remaining:
+            logger.warning("%d messages still undelivered at shutdown", remaining)
+        return remaining
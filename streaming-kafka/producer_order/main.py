@@ -1,89 +1,203 @@
-import json
+import asyncio
 import logging
 import os
+import time
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 
-from confluent_kafka import Producer
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from async_producer import AsyncProducer, ProducerSaturatedError
+from common.kafka_profiles import producer_config, profile_name
+from common.serialization import serializer_from_env
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("producer_order")
 
-app = FastAPI()
-
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
 TOPIC = "orders"
 
-producer_conf = {
+# EVENT_FORMAT=json|struct; consumers detect the format from the content-type header
+serializer = serializer_from_env()
+EVENT_HEADERS = [("content-type", serializer.content_type.encode())]
+
+# KAFKA_PRODUCER_PROFILE=default|latency|balanced|throughput (compression, linger, batching, acks)
+PRODUCER_PROFILE = profile_name()
+producer_conf = producer_config({
     "bootstrap.servers": KAFKA_BOOTSTRAP_SERVERS,
-    "linger.ms": 5,
     "batch.num.messages": 1000,
-}
-producer = Producer(producer_conf)
+}, PRODUCER_PROFILE)
+# delivery reports are serviced by the producer's background poll thread;
+# at most PRODUCER_MAX_IN_FLIGHT unacknowledged messages, waiting up to
+# PRODUCER_ENQUEUE_TIMEOUT_MS for room before answering 429/503
+producer = AsyncProducer(
+    producer_conf,
+    max_in_flight=int(os.getenv("PRODUCER_MAX_IN_FLIGHT", "50000")),
+    enqueue_timeout=int(os.getenv("PRODUCER_ENQUEUE_TIMEOUT_MS", "2000")) / 1000.0,
+    retry_after=float(os.getenv("PRODUCER_RETRY_AFTER_SECONDS", "1")),
+)
 
 
-def delivery_report(err, msg):
-    if err:
-        logger.error("Delivery failed for %s: %s", msg.key(), err)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    producer.start()
+    yield
+    await asyncio.to_thread(producer.close)
 
 
-def build_event(order_id: str, items: list) -> dict:
-    return {
+app = FastAPI(lifespan=lifespan)
+
+
+def build_event(order_id: str, items: list, restaurant_id: str | None = None) -> dict:
+    event = {
         "eventId": str(uuid.uuid4()),
         "eventType": "OrderPlaced",
         "orderId": order_id,
         "items": items,
         "createdAt": datetime.now(timezone.utc).isoformat(),
     }
+    if restaurant_id is not None:
+        event["restaurantId"] = restaurant_id
+    return event
+
+
+async def produce_event(order_id: str, items: list, restaurant_id: str | None = None) -> tuple[dict, asyncio.Future]:
+    event = build_event(order_id, items, restaurant_id)
+    return event, await producer.produce(TOPIC, key=order_id, value=serializer.encode(event), headers=EVENT_HEADERS)
+
+
+def saturated_response(error: ProducerSaturatedError, body: dict) -> JSONResponse:
+    """429 when our own in-flight limit is hit, 503 when librdkafka's queue is full."""
+    status = 429 if error.reason == "in_flight_limit" else 503
+    return JSONResponse(
+        status_code=status,
+        content={**body, "error": str(error), "reason": error.reason},
+        headers={"Retry-After": str(max(1, round(error.retry_after)))},
+    )
+
+
+def delivery_entry(order_id: str, outcome) -> dict:
+    """Per-message result for a delivery future's outcome (DeliveryResult or exception)."""
+    if isinstance(outcome, BaseException):
+        logger.error("Delivery failed for %s: %s", order_id, outcome)
+        return {"orderId": order_id, "status": "FAILED", "error": str(outcome)}
+    return {
+        "orderId": order_id,
+        "status": "DELIVERED",
+        "partition": outcome.partition,
+        "offset": outcome.offset,
+        "latency_ms": round(outcome.latency_ms, 2),
+    }
+
+
+async def produce_many(orders: list[tuple[str, list, str | None]]) -> tuple[list[dict], float, ProducerSaturatedError | None]:
+    """Produce every (order_id, items, restaurant_id) order and await all delivery reports.
+
+    Stops enqueueing at the first saturation; orders after it are reported as
+    REJECTED (never sent) and the error is returned for the caller to map.
+    """
+    started = time.perf_counter()
+    futures = []
+    saturated = None
+    for i, (order_id, items, restaurant_id) in enumerate(orders):
+        try:
+            futures.append((await produce_event(order_id, items, restaurant_id))[1])
+        except ProducerSaturatedError as e:
+            saturated = e
+            break
+        if (i + 1) % 1000 == 0:
+            await asyncio.sleep(0)  # let other requests run while building large batches
+    outcomes = await asyncio.gather(*futures, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    results = [delivery_entry(order_id, outcome) for (order_id, *_), outcome in zip(orders, outcomes)]
+    results += [{"orderId": order_id, "status": "REJECTED"} for order_id, *_ in orders[len(futures):]]
+    return results, elapsed, saturated
+
+
+def batch_summary(results: list[dict], elapsed: float) -> dict:
+    delivered = sum(1 for r in results if r["status"] == "DELIVERED")
+    rejected = sum(1 for r in results if r["status"] == "REJECTED")
+    return {
+        "produced": len(results) - rejected,
+        "delivered": delivered,
+        "failed": len(results) - rejected - delivered,
+        "rejected": rejected,
+        "elapsed_seconds": round(elapsed, 4),
+        "events_per_sec": round(delivered / elapsed, 1) if elapsed > 0 else 0.0,
+    }
 
 
 @app.post("/produce")
-def produce_order(payload: dict):
+async def produce_order(payload: dict):
     order_id = payload.get("orderId", f"o-{uuid.uuid4().hex[:8]}")
     items = payload.get("items", [{"sku": "burrito", "qty": 1}])
 
-    event = build_event(order_id, items)
-    producer.produce(
-        TOPIC,
-        key=order_id,
-        value=json.dumps(event),
-        callback=delivery_report,
-    )
-    producer.poll(0)
+    try:
+        event, delivery = await produce_event(order_id, items, payload.get("restaurantId"))
+    except ProducerSaturatedError as e:
+        return saturated_response(e, {"orderId": order_id, "status": "REJECTED"})
+    result = delivery_entry(order_id, (await asyncio.gather(delivery, return_exceptions=True))[0])
 
     logger.info("Produced OrderPlaced for %s", order_id)
-    return {"orderId": order_id, "status": "PRODUCED", "event": event}
+    return {**result, "status": "PRODUCED" if result["status"] == "DELIVERED" else "FAILED", "event": event}
+
+
+@app.post("/produce/batch")
+async def produce_batch(payload: dict):
+    """Produce many orders in one request: {"orders": [{"orderId"?, "items"?, "restaurantId"?}, ...]}."""
+    orders = [
+        (order.get("orderId", f"o-{uuid.uuid4().hex[:8]}"), order.get("items", [{"sku": "burrito", "qty": 1}]),
+         order.get("restaurantId"))
+        for order in payload.get("orders", [])
+    ]
+    results, elapsed, saturated = await produce_many(orders)
+    summary = batch_summary(results, elapsed)
+    logger.info("Batch: %d produced, %d delivered in %.3fs", summary["produced"], summary["delivered"], elapsed)
+    if saturated:
+        return saturated_response(saturated, {**summary, "results": results})
+    return {**summary, "results": results}
 
 
 @app.post("/load-test")
-def load_test(payload: dict | None = None):
+async def load_test(payload: dict | None = None):
     count = 10000
     if payload and "count" in payload:
         count = int(payload["count"])
 
     items = [{"sku": "burrito", "qty": 1}]
-    produced = 0
-
-    for i in range(count):
-        order_id = f"load-{i:06d}"
-        event = build_event(order_id, items)
-        producer.produce(
-            TOPIC,
-            key=order_id,
-            value=json.dumps(event),
-            callback=delivery_report,
-        )
-        # Poll periodically to trigger delivery reports and avoid buffer full
-        if (i + 1) % 500 == 0:
-            producer.poll(0)
-        produced += 1
-
-    # Flush all remaining messages
-    remaining = producer.flush(timeout=30)
-    logger.info("Load test: produced %d events, %d still in queue", produced, remaining)
-
-    return {"produced": produced, "remaining_in_queue": remaining}
+    before = producer.traffic()
+    # spread over a few restaurants so the analytics rollups have something to group by
+    orders = [(f"load-{i:06d}", items, f"r-{i % 10}") for i in range(count)]
+    results, elapsed, saturated = await produce_many(orders)
+    summary = batch_summary(results, elapsed)
+    remaining = summary["produced"] - summary["delivered"]
+
+    # batch and wire byte counts come from librdkafka statistics, reported once per interval
+    await producer.wait_for_stats()
+    after = producer.traffic()
+    traffic = {key: after[key] - before[key] for key in after}
+    batch_bytes = traffic["batch_bytes"]
+    summary.update({
+        "profile": PRODUCER_PROFILE,
+        **traffic,
+        "avg_batch_messages": round(traffic["batch_messages"] / traffic["batches"], 1) if traffic["batches"] else None,
+        "compression_ratio": round(traffic["payload_bytes"] / batch_bytes, 2) if batch_bytes > 0 else None,
+    })
+    logger.info("Load test: produced %d events, %d not delivered (%.0f events/s, profile=%s, ratio=%s)",
+                summary["produced"], remaining, summary["events_per_sec"], PRODUCER_PROFILE,
+                summary["compression_ratio"])
+
+    if saturated:
+        return saturated_response(saturated, {**summary, "remaining_in_queue": remaining})
+    return {**summary, "remaining_in_queue": remaining}
+
+
+@app.get("/metrics")
+def metrics():
+    """Producer backpressure: in-flight count, rejections, queue-depth and produce-wait histograms."""
+    return producer.stats()
 
 
 @app.get("/health")
@@ -0,0 +1,125 @@
+"""
+Benchmark: analytics consume throughput while /metrics is scraped hard.
+
+Runs analytics_consumer's process_message() on a consumer thread over
+pre-decoded events (no broker needed). At the same time, --scrapers threads
+call the /metrics handler (get_metrics) in a tight loop, or at --scrape-hz
+each. Reports consumer events/s, the consumer's worst per-event stall,
+scrapes/s and scrape latency.
+
+`--locked` reproduces the previous design for comparison: one global lock
+around every process_message() and every scrape, with the scrape rendering
+the windows itself while holding it.
+
+Usage (from the repository root, with analytics_consumer's requirements installed):
+    python streaming-kafka/tests/bench_analytics_scrape.py --events 500000 --scrapers 0 1 4
+    python streaming-kafka/tests/bench_analytics_scrape.py --events 500000 --scrapers 0 1 4 --locked
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path[:0] = [REPO_ROOT, os.path.join(REPO_ROOT, "streaming-kafka", "analytics_consumer")]
+
+import main as analytics  # noqa: E402  (analytics_consumer/main.py)
+
+
+def make_events(count: int) -> list[dict]:
+    """Orders spread over ~30 minutes of event time, each followed by its reservation outcome."""
+    start = datetime.now(timezone.utc) - timedelta(minutes=30)
+    events = []
+    for i in range(count // 2):
+        order_id = str(uuid.uuid4())
+        created_at = (start + timedelta(milliseconds=i * 3)).isoformat()
+        events.append({"eventType": "OrderPlaced", "orderId": order_id, "createdAt": created_at})
+        outcome = "InventoryFailed" if i % 10 == 0 else "InventoryReserved"
+        events.append({"eventType": outcome, "orderId": order_id, "createdAt": created_at})
+    return events
+
+
+def locked_get_metrics():
+    """The previous /metrics handler: everything rendered from live state."""
+    return {
+        **analytics.counters.snapshot(),
+        "orders_per_minute": analytics.order_windows.per_minute(),
+        "windows": analytics.order_windows.snapshot(),
+    }
+
+
+def run(events: list[dict], scrapers: int, scrape_hz: float, locked: bool) -> dict:
+    analytics.reset_metrics()
+    lock = threading.Lock() if locked else contextlib.nullcontext()
+    get_metrics = locked_get_metrics if locked else analytics.get_metrics
+    done = threading.Event()
+    latencies: list[float] = []
+
+    def scrape():
+        interval = 1.0 / scrape_hz if scrape_hz > 0 else 0.0
+        local = []
+        while not done.is_set():
+            started = time.perf_counter()
+            with lock:
+                get_metrics()
+            local.append(time.perf_counter() - started)
+            if interval:
+                time.sleep(interval)
+        latencies.extend(local)
+
+    threads = [threading.Thread(target=scrape, daemon=True) for _ in range(scrapers)]
+    for thread in threads:
+        thread.start()
+
+    process = analytics.process_message
+    clock = time.perf_counter
+    worst = 0.0
+    started = clock()
+    for event in events:
+        before = clock()
+        with lock:
+            process(event)
+        worst = max(worst, clock() - before)
+    elapsed = clock() - started
+
+    done.set()
+    for thread in threads:
+        thread.join()
+    assert analytics.counters.snapshot()["total_orders"] == len(events) // 2
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000.0 if latencies else 0.0
+    return {
+        "scrapers": scrapers,
+        "events_per_sec": len(events) / elapsed,
+        "worst_stall_ms": worst * 1000.0,
+        "scrapes_per_sec": len(latencies) / elapsed,
+        "scrape_p99_ms": p99,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analytics consume throughput under /metrics scraping.")
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--scrapers", type=int, nargs="+", default=[0, 1, 4])
+    parser.add_argument("--scrape-hz", type=float, default=0.0, help="per scraper; 0 = as fast as possible")
+    parser.add_argument("--locked", action="store_true", help="one global lock, like the previous design")
+    args = parser.parse_args()
+
+    events = make_events(args.events)
+    print(f"{'design':>8} {'scrapers':>8} {'events/s':>10} {'stall ms':>9} {'scrapes/s':>10} {'p99 ms':>8}")
+    for scrapers in args.scrapers:
+        result = run(events, scrapers, args.scrape_hz, args.locked)
+        print(f"{'locked' if args.locked else 'sharded':>8} {result['scrapers']:>8} "
+              f"{result['events_per_sec']:>10,.0f} {result['worst_stall_ms']:>9.3f} "
+              f"{result['scrapes_per_sec']:>10,.0f} "
+              f"{result['scrape_p99_ms']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark for the inventory consumer run modes (CONSUMER_MODE) against the
+local single-broker Kafka from docker-compose.
+
+For every mode a fresh pair of input/output topics is created and pre-filled
+with --orders OrderPlaced events. Then inventory_consumer/main.py is started
+as a subprocess pointed at those topics. The output topic is read with
+isolation.level=read_committed until one event per order has arrived.
+
+Reports throughput (first to last output event) and duplicate outputs.
+
+Usage (stack running, from the repository root):
+    python streaming-kafka/tests/bench_consumer_modes.py --orders 20000 --modes single batch transactional
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import uuid
+
+from confluent_kafka import Consumer, Producer
+from confluent_kafka.admin import AdminClient, NewTopic
+
+KAFKA_BOOTSTRAP = "localhost:9092"
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+CONSUMER_MAIN = os.path.join(REPO_ROOT, "streaming-kafka", "inventory_consumer", "main.py")
+
+
+def create_topics(admin: AdminClient, *names: str, partitions: int = 3):
+    futures = admin.create_topics([NewTopic(name, num_partitions=partitions, replication_factor=1) for name in names])
+    for future in futures.values():
+        future.result()
+
+
+def fill_input(topic: str, orders: int):
+    producer = Producer({"bootstrap.servers": KAFKA_BOOTSTRAP, "linger.ms": 20})
+    for i in range(orders):
+        order_id = f"bench-{uuid.uuid4().hex[:12]}"
+        event = {
+            "eventId": str(uuid.uuid4()),
+            "eventType": "OrderPlaced",
+            "orderId": order_id,
+            "items": [{"sku": "burrito", "qty": 1}],
+        }
+        producer.produce(topic, key=order_id, value=json.dumps(event))
+        if i % 10000 == 0:
+            producer.poll(0)
+    producer.flush(60)
+
+
+def run_mode(admin: AdminClient, mode: str, orders: int, extra_env: dict, timeout: float) -> dict:
+    suffix = f"{mode}-{uuid.uuid4().hex[:6]}"
+    input_topic, output_topic = f"bench-orders-{suffix}", f"bench-inventory-{suffix}"
+    create_topics(admin, input_topic, output_topic)
+    fill_input(input_topic, orders)
+
+    reader = Consumer({
+        "bootstrap.servers": KAFKA_BOOTSTRAP,
+        "group.id": f"bench-reader-{suffix}",
+        "auto.offset.reset": "earliest",
+        "isolation.level": "read_committed",
+    })
+    reader.subscribe([output_topic])
+
+    env = {
+        **os.environ,
+        "KAFKA_BOOTSTRAP_SERVERS": KAFKA_BOOTSTRAP,
+        "CONSUMER_MODE": mode,
+        "INPUT_TOPIC": input_topic,
+        "OUTPUT_TOPIC": output_topic,
+        "CONSUMER_GROUP_ID": f"bench-inventory-{suffix}",
+        "KAFKA_TRANSACTIONAL_ID": f"bench-{suffix}",
+        "IDEMPOTENCY_LOG_PATH": "",
+        "EVENT_FORMAT": "json",  # the reader below parses the output as JSON
+        "METRICS_PORT": "0",     # no Prometheus endpoint: it would clash with a running stack
+        "PYTHONPATH": REPO_ROOT,
+        **extra_env,
+    }
+    worker = subprocess.Popen([sys.executable, CONSUMER_MAIN], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    seen: set[str] = set()
+    received = 0
+    first = last = None
+    deadline = time.time() + timeout
+    try:
+        while len(seen) < orders and time.time() < deadline:
+            for msg in reader.consume(1000, 1.0):
+                if msg.error():
+                    continue
+                last = time.perf_counter()
+                first = first or last
+                received += 1
+                seen.add(json.loads(msg.value())["orderId"])
+    finally:
+        worker.send_signal(signal.SIGTERM)
+        worker.wait(30)
+        reader.close()
+        admin.delete_topics([input_topic, output_topic])
+
+    elapsed = (last - first) if first and last and last > first else float("nan")
+    return {
+        "mode": mode,
+        "orders": orders,
+        "distinct": len(seen),
+        "duplicates": received - len(seen),
+        "throughput": (received - 1) / elapsed if elapsed == elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inventory consumer run modes.")
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--modes", nargs="+", default=["single", "batch", "transactional"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds to wait per mode")
+    args = parser.parse_args()
+
+    admin = AdminClient({"bootstrap.servers": KAFKA_BOOTSTRAP})
+    extra_env = {"CONSUMER_BATCH_SIZE": str(args.batch_size)}
+    print(f"{'mode':>14} {'orders':>8} {'distinct':>9} {'dupes':>6} {'events/s':>10}")
+    for mode in args.modes:
+        result = run_mode(admin, mode, args.orders, extra_env, args.timeout)
+        print(f"{result['mode']:>14} {result['orders']:>8} {result['distinct']:>9} "
+              f"{result['duplicates']:>6} {result['throughput']:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
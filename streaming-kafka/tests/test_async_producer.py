@@ -0,0 +1,56 @@
+"""
+Tests for producer_order's bounded AsyncProducer (producer_order/async_producer.py).
+
+librdkafka's Producer is replaced by a stand-in whose local queue is always full.
+
+Usage (from the repository root; needs the producer_order requirements):
+    python -m pytest streaming-kafka/tests/test_async_producer.py
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path[:0] = [REPO_ROOT, os.path.join(REPO_ROOT, "streaming-kafka", "producer_order")]
+
+pytest.importorskip("confluent_kafka")
+
+import async_producer  # noqa: E402
+from async_producer import AsyncProducer, ProducerSaturatedError  # noqa: E402
+
+
+class FullQueueProducer:
+    def __init__(self, conf: dict):
+        self.conf = conf
+
+    def produce(self, topic, key=None, value=None, headers=None, on_delivery=None):
+        raise BufferError("Local: Queue full")
+
+    def poll(self, timeout: float = 0):
+        return 0
+
+    def __len__(self):
+        return 100_000
+
+
+@pytest.fixture
+def producer(monkeypatch):
+    monkeypatch.setattr(async_producer, "Producer", FullQueueProducer)
+    return AsyncProducer({}, enqueue_timeout=0.02)
+
+
+class TestSaturation:
+    @pytest.mark.parametrize("reason", ["in_flight_limit", "queue_full"])
+    def test_rejected_produce_records_its_wait(self, producer, reason):
+        if reason == "in_flight_limit":
+            producer.max_in_flight = 0
+        with pytest.raises(ProducerSaturatedError):
+            asyncio.run(producer.produce("orders", b"{}", key=b"o-1"))
+
+        assert producer.rejected[reason] == 1
+        wait = producer.stats()["produce_wait_ms"]
+        assert wait["count"] == 1
+        assert wait["max"] >= 20.0
@@ -0,0 +1,219 @@
+"""
+Sequential vs partition-parallel replay of analytics_consumer on a fixed log (no broker needed).
+
+The log lives in memory and is served by a stand-in for confluent_kafka's
+Consumer. The sequential path is the consumer catching up after
+`POST /replay?mode=full`: main.handle_message() for every message, with one
+partition read far ahead of the others. The parallel path is
+main.run_parallel_replay(). Both must leave identical counters, per-minute
+counts, windows and latency.
+
+Usage (from the repository root; needs the analytics_consumer requirements):
+    python -m pytest streaming-kafka/tests/test_replay.py
+"""
+
+import json
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path[:0] = [REPO_ROOT, os.path.join(REPO_ROOT, "streaming-kafka", "analytics_consumer")]
+
+pytest.importorskip("confluent_kafka")
+pytest.importorskip("fastapi")
+
+import main  # noqa: E402
+import replay  # noqa: E402
+from common.serialization import StructSerializer  # noqa: E402
+
+BASE_MS = 1_767_268_800_000          # 2026-01-01T12:00:00Z
+STRUCT = StructSerializer()
+
+
+class StandInMessage:
+    def __init__(self, topic: str, partition: int, offset: int, value: bytes, headers, timestamp_ms: int):
+        self._topic, self._partition, self._offset = topic, partition, offset
+        self._value, self._headers, self._timestamp_ms = value, headers, timestamp_ms
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def value(self):
+        return self._value
+
+    def headers(self):
+        return self._headers
+
+    def timestamp(self):
+        return 1, self._timestamp_ms
+
+    def error(self):
+        return None
+
+
+def iso(ms: int) -> str:
+    seconds, millis = divmod(ms, 1000)
+    return f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))}.{millis:03d}Z"
+
+
+def build_log(orders: int = 600, partitions: int = 3, seed: int = 7) -> dict[tuple[str, int], list]:
+    """Orders over ~30 minutes on `partitions` partitions, some out of order by more than the allowed
+    lateness, and a reservation result for most of them; every third message is struct-encoded."""
+    rng = random.Random(seed)
+    placed = {p: [] for p in range(partitions)}
+    results = {p: [] for p in range(partitions)}
+    for i in range(orders):
+        order_id = f"o-{i:05d}"
+        created = BASE_MS + i * 3000
+        if i % 50 == 7:
+            created -= 6 * 60_000                    # six minutes behind its neighbours
+        partition = rng.randrange(partitions)
+        placed[partition].append({
+            "eventType": "OrderPlaced", "orderId": order_id, "createdAt": iso(created),
+            "restaurantId": f"r-{i % 5}", "items": [{"sku": "burrito", "qty": 1 + i % 3}],
+        })
+        if i % 10 != 3:                              # some orders never get a result
+            failed = i % 4 == 0
+            results[rng.randrange(partitions)].append({
+                "eventType": "InventoryFailed" if failed else "InventoryReserved", "orderId": order_id,
+                "createdAt": iso(created + rng.randrange(5, 900)),
+                **({"reason": "OUT_OF_STOCK", "shortages": {"burrito": 1}} if failed else {}),
+            })
+
+    log = {}
+    for topic, events in ((main.ORDERS_TOPIC, placed), (main.INVENTORY_TOPIC, results)):
+        for partition, partition_events in events.items():
+            messages = []
+            for offset, event in enumerate(partition_events):
+                if offset % 3 == 0:
+                    value, headers = STRUCT.encode(event), [("content-type", STRUCT.content_type.encode())]
+                else:
+                    value, headers = json.dumps(event).encode(), None
+                messages.append(StandInMessage(topic, partition, offset, value, headers, BASE_MS + offset))
+            log[(topic, partition)] = messages
+    return log
+
+
+class StandInConsumer:
+    """The part of confluent_kafka.Consumer the replay uses, serving `LOG`."""
+
+    LOG: dict[tuple[str, int], list] = {}
+
+    def __init__(self, config: dict):
+        self.pending = []
+
+    def assign(self, partitions):
+        for tp in partitions:
+            self.pending.extend(self.LOG[(tp.topic, tp.partition)][tp.offset:])
+
+    def consume(self, num_messages: int, timeout: float):
+        batch, self.pending = self.pending[:num_messages], self.pending[num_messages:]
+        return batch
+
+    def list_topics(self, topic: str, timeout: float):
+        partitions = {p: None for t, p in self.LOG if t == topic}
+        return SimpleNamespace(topics={topic: SimpleNamespace(partitions=partitions)})
+
+    def get_watermark_offsets(self, tp, timeout: float):
+        return 0, len(self.LOG[(tp.topic, tp.partition)])
+
+    def close(self):
+        pass
+
+
+def racing_order(log: dict, batch: int = 25) -> list:
+    """Messages as a consumer might fetch them: the first orders partition entirely, then the other
+    partitions batch by batch, round robin."""
+    first = (main.ORDERS_TOPIC, 0)
+    ordered = list(log[first])
+    queues = [list(messages) for tp, messages in sorted(log.items()) if tp != first]
+    while any(queues):
+        for queue in queues:
+            ordered.extend(queue[:batch])
+            del queue[:batch]
+    return ordered
+
+
+def metrics() -> dict:
+    return {
+        "counters": main.counters.snapshot(),
+        "orders_per_minute": main.order_windows.per_minute(),
+        "windows": main.order_windows.snapshot(),
+        "latency": main.latency.snapshot(),
+        "rollups": main.rollups.to_state(),
+    }
+
+
+@pytest.fixture
+def log(monkeypatch):
+    log = build_log()
+    monkeypatch.setattr(StandInConsumer, "LOG", log)
+    monkeypatch.setattr(replay, "Consumer", StandInConsumer)
+    monkeypatch.setattr(main, "rewind_group", lambda offsets: None)
+    monkeypatch.setattr(main, "REPLAY_EXECUTOR", "thread")
+    yield log
+    main.reset_metrics()
+
+
+def sequential_replay(log: dict) -> dict:
+    main.reset_metrics()
+    main.start_catch_up({tp: len(messages) for tp, messages in log.items()})
+    for msg in racing_order(log):
+        main.handle_message(msg)
+    assert main.backfill is None, "catch-up should finish at the last offset of every partition"
+    return metrics()
+
+
+def parallel_replay() -> dict:
+    main.reset_metrics()
+    main.run_parallel_replay()
+    return metrics()
+
+
+class TestReplayEquivalence:
+    def test_sequential_and_parallel_replays_match(self, log):
+        sequential = sequential_replay(log)
+        parallel = parallel_replay()
+        assert sequential["counters"]["total_orders"] == 600
+        assert sequential["windows"]["late_events"] == 0
+        assert sequential["latency"]["matched"] == 540
+        for name in ("counters", "orders_per_minute", "windows", "latency", "rollups"):
+            assert sequential[name] == parallel[name], name
+
+    def test_parallel_replay_does_not_depend_on_worker_count(self, log, monkeypatch):
+        monkeypatch.setattr(main, "REPLAY_WORKERS", 1)
+        one = parallel_replay()
+        monkeypatch.setattr(main, "REPLAY_WORKERS", 4)
+        assert parallel_replay() == one
+
+    def test_catch_up_waits_for_partitions_ending_in_markers(self, log):
+        # a transactional partition's last offsets can be commit markers that are never delivered
+        ends = {tp: len(messages) + 1 for tp, messages in log.items()}
+        main.reset_metrics()
+        main.start_catch_up(ends)
+        for msg in racing_order(log):
+            main.handle_message(msg)
+        assert main.backfill is not None
+        for (topic, partition), end in ends.items():
+            main.caught_up(topic, partition, end)      # what the end-of-partition event reports
+        assert main.backfill is None
+        assert main.order_windows.late_events == 0
+
+    def test_live_stream_continues_from_the_replayed_watermarks(self, log):
+        parallel_replay()
+        newest = max(main.order_windows.partition_max.values())
+        event = {"eventType": "OrderPlaced", "orderId": "o-live", "createdAt": iso(newest * 60_000 + 1000)}
+        main.process_message(event, partition=(main.ORDERS_TOPIC, 1))
+        assert main.counters.snapshot()["total_orders"] == 601
+        assert main.order_windows.late_events == 0
@@ -0,0 +1,56 @@
+"""
+Unit tests for analytics_consumer's per-minute rollups (no Kafka needed).
+
+Usage (from the repository root):
+    python -m pytest streaming-kafka/tests/test_rollups.py
+"""
+
+import os
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path[:0] = [REPO_ROOT, os.path.join(REPO_ROOT, "streaming-kafka", "analytics_consumer")]
+
+from rollups import RollupStore  # noqa: E402
+
+NOW = 29_450_880                     # 2026-01-01T00:00Z in minutes
+DECADES_AGO = NOW - 30 * 525_600
+
+
+def filled(hours: int = 3) -> RollupStore:
+    """One order from restaurant r-<hour> every minute for the last `hours` hours."""
+    store = RollupStore(minute_slots=240, hour_slots=24)
+    for minute in range(NOW - hours * 60, NOW):
+        store.add(minute, "restaurant", f"r-{(minute - NOW) // 60}")
+    return store
+
+
+class TestQueries:
+    def test_hours_come_from_the_hour_ring_and_edges_from_minutes(self):
+        store = filled()
+        totals, scanned = store.totals("restaurant", NOW - 150, NOW)
+        assert totals == {"r--3": 30, "r--2": 60, "r--1": 60}
+        assert scanned == 30 + 2
+
+    def test_series_by_hour(self):
+        points, _ = filled().series("restaurant", NOW - 180, NOW, 60)
+        assert points == [(NOW - 180, 60), (NOW - 120, 60), (NOW - 60, 60)]
+
+
+class TestClamping:
+    def test_ancient_from_reads_only_retained_buckets(self):
+        store = filled()
+        totals, scanned = store.totals("restaurant", DECADES_AGO, NOW + 525_600)
+        assert totals == store.totals("restaurant", NOW - 180, NOW)[0]
+        assert scanned == store.hour_slots
+
+    def test_ancient_from_in_a_minute_series(self):
+        store = filled()
+        points, scanned = store.series("restaurant", DECADES_AGO, NOW, 1)
+        assert points == store.series("restaurant", NOW - 180, NOW, 1)[0]
+        assert scanned <= store.hour_slots * 60
+
+    def test_range_before_anything_retained_is_empty(self):
+        store = filled()
+        assert store.totals("restaurant", DECADES_AGO, DECADES_AGO + 60) == ({}, 0)
+        assert RollupStore().top("restaurant", DECADES_AGO, NOW, 5) == ([], 0)
@@ -0,0 +1,229 @@
+"""
+Transactional mode of inventory_consumer against a single-broker stand-in (no broker needed).
+
+StandInBroker keeps the input log, the group's committed offsets and the
+output topic; only transactions that commit reach the output topic and the
+committed offsets, as on a real broker with read_committed consumers.
+main.run_transactional() runs until the stand-in consumer has nothing left to
+deliver.
+
+Usage (from the repository root; needs the inventory_consumer requirements):
+    python -m pytest streaming-kafka/tests/test_transactional.py
+"""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, REPO_ROOT)
+
+pytest.importorskip("confluent_kafka")
+
+from confluent_kafka import OFFSET_BEGINNING, OFFSET_INVALID, KafkaError, KafkaException, TopicPartition  # noqa: E402
+
+from common.idempotency import IdempotencyStore  # noqa: E402
+from common.serialization import JSON, decode_event  # noqa: E402
+from common.stock_ledger import StockLedger  # noqa: E402
+
+# loaded under its own name: analytics_consumer's main is imported as `main` by test_replay
+_spec = importlib.util.spec_from_file_location(
+    "inventory_consumer_main", os.path.join(REPO_ROOT, "streaming-kafka", "inventory_consumer", "main.py"))
+main = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(main)
+
+PARTITIONS = 2
+ORDERS_PER_PARTITION = 3
+
+
+class StandInMessage:
+    def __init__(self, topic: str, partition: int, offset: int, key: bytes, value: bytes):
+        self._topic, self._partition, self._offset = topic, partition, offset
+        self._key, self._value = key, value
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def headers(self):
+        return [("content-type", JSON.content_type.encode())]
+
+    def error(self):
+        return None
+
+
+class StandInBroker:
+    def __init__(self, partitions: int, orders_per_partition: int):
+        self.log = {}
+        for partition in range(partitions):
+            self.log[(main.INPUT_TOPIC, partition)] = [
+                StandInMessage(main.INPUT_TOPIC, partition, offset, order_id.encode(), JSON.encode({
+                    "eventType": "OrderPlaced",
+                    "orderId": order_id,
+                    "items": [{"sku": "burrito", "qty": 1}],
+                }))
+                for offset, order_id in enumerate(f"o-{partition}-{n}" for n in range(orders_per_partition))
+            ]
+        self.committed: dict[tuple[str, int], int] = {}
+        self.output: list = []
+
+    def order_ids(self) -> list:
+        return [decode_event(value)["orderId"] for _, _, value in self.output]
+
+
+class StandInConsumer:
+    """Hands out up to `num_messages` per consume() in partition order; KeyboardInterrupt once drained."""
+
+    def __init__(self, broker: StandInBroker):
+        self.broker = broker
+        self.positions: dict[tuple[str, int], int] = {}      # OFFSET_INVALID until fetched from
+        self.seeks: list[tuple[str, int, int]] = []
+        self.on_seek = None
+
+    def subscribe(self, topics, **callbacks):
+        for key in self.broker.log:
+            if key[0] in topics:
+                self.positions[key] = self.broker.committed.get(key, OFFSET_INVALID)
+
+    def assignment(self):
+        return [TopicPartition(topic, partition) for topic, partition in self.positions]
+
+    def consume(self, num_messages: int, timeout: float) -> list:
+        messages = []
+        for key, position in self.positions.items():
+            position = max(position, 0)
+            batch = self.broker.log[key][position:position + num_messages - len(messages)]
+            if batch:
+                self.positions[key] = position + len(batch)
+            messages.extend(batch)
+        if not messages:
+            raise KeyboardInterrupt
+        return messages
+
+    def position(self, partitions):
+        return [TopicPartition(tp.topic, tp.partition, self.positions[(tp.topic, tp.partition)])
+                for tp in partitions]
+
+    def committed(self, partitions, timeout=None):
+        committed = self.broker.committed
+        return [TopicPartition(tp.topic, tp.partition, committed.get((tp.topic, tp.partition), OFFSET_INVALID))
+                for tp in partitions]
+
+    def seek(self, tp):
+        self.seeks.append((tp.topic, tp.partition, tp.offset))
+        if self.on_seek is not None:
+            self.on_seek()
+        self.positions[(tp.topic, tp.partition)] = 0 if tp.offset == OFFSET_BEGINNING else tp.offset
+
+    def consumer_group_metadata(self):
+        return main.CONSUMER_GROUP_ID
+
+
+class StandInTransactionalProducer:
+    """Buffers a transaction's records and offsets; commit number `fail_commit` fails with an abortable error."""
+
+    def __init__(self, broker: StandInBroker, fail_commit: int | None = None):
+        self.broker = broker
+        self.fail_commit = fail_commit
+        self.commits = 0
+        self.aborts = 0
+        self.records: list | None = None
+        self.offsets: list = []
+
+    def init_transactions(self):
+        pass
+
+    def begin_transaction(self):
+        assert self.records is None, "transaction already open"
+        self.records, self.offsets = [], []
+
+    def produce(self, topic, key=None, value=None, headers=None, callback=None):
+        self.records.append((topic, key, value))
+
+    def poll(self, timeout=0):
+        return 0
+
+    def flush(self, timeout=None):
+        return 0
+
+    def send_offsets_to_transaction(self, offsets, group_metadata):
+        # like librdkafka, partitions without a valid position are left out
+        self.offsets = [tp for tp in offsets if tp.offset >= 0]
+
+    def commit_transaction(self):
+        self.commits += 1
+        if self.commits == self.fail_commit:
+            raise KafkaException(KafkaError(KafkaError._STATE, "stand-in: transaction fenced",
+                                            txn_requires_abort=True))
+        self.broker.output.extend(self.records)
+        for tp in self.offsets:
+            self.broker.committed[(tp.topic, tp.partition)] = tp.offset
+        self.records = None
+
+    def abort_transaction(self):
+        self.aborts += 1
+        self.records = None
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    monkeypatch.setattr(main, "ledger", StockLedger({"burrito": 100}))
+    monkeypatch.setattr(main, "processed_orders", IdempotencyStore())
+    monkeypatch.setattr(main, "CONSUMER_BATCH_SIZE", ORDERS_PER_PARTITION)
+    monkeypatch.setattr(main, "INVENTORY_FAIL_RATE", 0.0)
+    return StandInBroker(PARTITIONS, ORDERS_PER_PARTITION)
+
+
+def run(consumer: StandInConsumer, producer: StandInTransactionalProducer):
+    with pytest.raises(KeyboardInterrupt):
+        main.run_transactional(consumer, producer)
+
+
+def every_order() -> list:
+    return [f"o-{p}-{n}" for p in range(PARTITIONS) for n in range(ORDERS_PER_PARTITION)]
+
+
+class TestTransactionalMode:
+    def test_committed_batches_publish_events_and_offsets_together(self, broker):
+        producer = StandInTransactionalProducer(broker)
+        consumer = StandInConsumer(broker)
+        run(consumer, producer)
+
+        assert producer.commits == PARTITIONS and producer.aborts == 0
+        assert broker.order_ids() == every_order()
+        assert broker.committed == {(main.INPUT_TOPIC, p): ORDERS_PER_PARTITION for p in range(PARTITIONS)}
+        assert consumer.seeks == []
+        assert all(order_id in main.processed_orders for order_id in every_order())
+        assert main.ledger.level("burrito") == {"available": 94, "reserved": 6}
+
+    def test_abort_releases_reservations_and_rewinds_to_committed_offsets(self, broker):
+        producer = StandInTransactionalProducer(broker, fail_commit=2)   # the second partition's batch
+        consumer = StandInConsumer(broker)
+        levels_at_rewind = []
+        consumer.on_seek = lambda: levels_at_rewind.append(main.ledger.level("burrito"))
+        run(consumer, producer)
+
+        assert producer.aborts == 1
+        # partition 0 rewinds to its committed offset, partition 1 had none yet
+        assert consumer.seeks == [(main.INPUT_TOPIC, 0, ORDERS_PER_PARTITION), (main.INPUT_TOPIC, 1, OFFSET_BEGINNING)]
+        # by then the aborted batch's reservations were back in stock
+        assert levels_at_rewind[0] == {"available": 97, "reserved": 3}
+
+        # the re-consumed batch commits: every order once, nothing from the aborted transaction
+        assert broker.order_ids() == every_order()
+        assert broker.committed == {(main.INPUT_TOPIC, p): ORDERS_PER_PARTITION for p in range(PARTITIONS)}
+        assert all(order_id in main.processed_orders for order_id in every_order())
+        assert main.ledger.level("burrito") == {"available": 94, "reserved": 6}
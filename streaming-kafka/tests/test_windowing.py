@@ -0,0 +1,127 @@
+"""
+Unit tests for analytics_consumer's event-time windows (no Kafka needed).
+
+Usage (from the repository root):
+    python -m pytest streaming-kafka/tests/test_windowing.py
+"""
+
+import os
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path[:0] = [REPO_ROOT, os.path.join(REPO_ROOT, "streaming-kafka", "analytics_consumer")]
+
+from windowing import WindowEngine, event_minute  # noqa: E402
+
+P0, P1 = ("orders", 0), ("orders", 1)
+
+
+def closed(engine: WindowEngine, name: str = "1m") -> dict[int, int]:
+    return dict(engine.closed[name])
+
+
+class TestLateEvents:
+    def test_event_within_lateness_is_counted(self):
+        engine = WindowEngine(allowed_lateness=2)
+        engine.add(100)
+        engine.add(103)                      # watermark 101
+        assert engine.add(101)
+        assert engine.late_events == 0
+
+    def test_event_behind_watermark_is_late_and_closed_windows_do_not_change(self):
+        engine = WindowEngine(allowed_lateness=2)
+        for minute in (100, 100, 101, 105):  # watermark 103: windows 100 and 101 closed
+            engine.add(minute)
+        before = closed(engine)
+        assert before == {100: 2, 101: 1}
+        assert not engine.add(100)
+        assert engine.late_events == 1
+        assert closed(engine) == before
+
+    def test_partition_racing_ahead_does_not_make_others_late(self):
+        engine = WindowEngine(allowed_lateness=2)
+        engine.expect_partitions([P0, P1])
+        for minute in range(100, 110):       # partition 0 read far ahead, as in a batch-by-batch replay
+            engine.add(minute, partition=P0)
+        for minute in range(100, 110):
+            assert engine.add(minute, partition=P1)
+        assert engine.late_events == 0
+        assert engine.watermark == 107
+        assert closed(engine) == {minute: 2 for minute in range(100, 107)}
+
+    def test_watermark_is_the_minimum_over_partitions(self):
+        engine = WindowEngine(allowed_lateness=2)
+        engine.add(100, partition=P0)
+        engine.add(100, partition=P1)
+        engine.add(120, partition=P0)
+        assert engine.watermark == 98
+        engine.add(110, partition=P1)
+        assert engine.watermark == 108
+        assert not engine.add(105, partition=P0)
+        assert engine.late_events == 1
+
+    def test_disorder_within_a_partition_is_still_late(self):
+        engine = WindowEngine(allowed_lateness=2)
+        engine.add(100, partition=P0)
+        engine.add(110, partition=P0)
+        assert not engine.add(101, partition=P0)
+        assert engine.late_events == 1
+
+    def test_expected_partition_holds_the_watermark_until_it_sends(self):
+        engine = WindowEngine(allowed_lateness=2)
+        engine.expect_partitions([P0, P1])
+        engine.add(120, partition=P0)
+        assert engine.watermark is None
+        engine.add(100, partition=P1)
+        assert engine.watermark == 98
+
+    def test_released_partition_stops_holding_the_watermark(self):
+        engine = WindowEngine(allowed_lateness=2)
+        engine.add(100, partition=P0)
+        engine.add(120, partition=P1)
+        assert engine.watermark == 98
+        engine.release_partitions([P0])
+        assert engine.watermark == 118
+
+
+class TestWindows:
+    def test_tumbling_and_sliding_windows(self):
+        engine = WindowEngine(allowed_lateness=0)
+        for minute in (60, 61, 62, 63, 64, 65):
+            engine.add(minute)
+        engine.add(130)                      # closes everything up to minute 130
+        assert closed(engine) == {m: 1 for m in range(60, 66)}
+        assert dict(engine.closed["1h"]) == {60: 6}
+        sliding = dict(engine.closed["5m"])
+        assert sliding[60] == 5 and sliding[61] == 5 and sliding[65] == 1
+
+    def test_rebuild_matches_feeding_in_time_order(self):
+        minutes = {100: 3, 101: 1, 104: 7, 130: 2, 131: 5}
+        fed = WindowEngine(allowed_lateness=2)
+        for minute in sorted(minutes):
+            fed.add(minute, minutes[minute])
+        rebuilt = WindowEngine(allowed_lateness=2)
+        rebuilt.rebuild(minutes)
+        assert rebuilt.snapshot()["windows"] == fed.snapshot()["windows"]
+        assert rebuilt.watermark == fed.watermark
+        assert rebuilt.per_minute() == fed.per_minute()
+
+    def test_rebuild_with_partitions_keeps_their_watermarks(self):
+        engine = WindowEngine(allowed_lateness=2)
+        engine.rebuild({100: 1, 110: 1, 120: 1}, {P0: 120, P1: 110})
+        assert engine.late_events == 0
+        assert engine.watermark == 108
+        assert engine.add(115, partition=P1)
+
+    def test_state_round_trip(self):
+        engine = WindowEngine(allowed_lateness=2)
+        for minute, partition in ((100, P0), (101, P1), (104, P0), (106, P1)):
+            engine.add(minute, partition=partition)
+        restored = WindowEngine(allowed_lateness=2)
+        restored.load_state(engine.to_state())
+        assert restored.snapshot() == engine.snapshot()
+        assert restored.partition_max == engine.partition_max
+
+    def test_event_minute_handles_offsets(self):
+        assert event_minute("2026-01-01T12:00:30Z") == event_minute("2026-01-01T13:00:59+01:00")
+        assert event_minute("not a time") is None
@@ -2,12 +2,16 @@
 #initial generation by gemini 3
 
 import logging
+import os
 import random
 import time
 from flask import Flask, request, jsonify
+from werkzeug.serving import WSGIRequestHandler
 import requests
 import argparse
 
+from common.stock_ledger import StockLedger, parse_initial_stock
+
 app = Flask(__name__)
 
 SERVICE_NAME = "InventoryService"
@@ -15,6 +19,12 @@ HOST = "localhost"
 PORT = 8081
 DELAY_TIME = 0#default delay time, changed by optional input argument
 FAIL_RATE = 0.0#default fail rate (0.0 = never fail, 1.0 = always fail)
+DEADLINE_HEADER = "X-Deadline-Ms"#remaining time budget of the caller, in milliseconds
+#stock ledger; SKUs not listed in INVENTORY_INITIAL_STOCK ("sku=qty,...") start at INVENTORY_DEFAULT_STOCK
+ledger = StockLedger(
+    initial_stock=parse_initial_stock(os.getenv("INVENTORY_INITIAL_STOCK", "")),
+    default_available=int(os.getenv("INVENTORY_DEFAULT_STOCK", "1000")),
+)
 logger = logging.getLogger(__name__)
 logging.basicConfig(
     level=logging.INFO,
@@ -51,11 +61,54 @@ def setFailRate():
     except Exception as e:
         return jsonify({"Error on setting fail rate": str(e)}), 500
 
+#drop work the caller has already given up on instead of sleeping through DELAY_TIME
+#returns an error response when the caller's remaining budget cannot cover the delay
+def check_deadline(endpoint, start_time):
+    budget = request.headers.get(DEADLINE_HEADER)
+    if budget is None:
+        return None
+    try:
+        remaining = int(budget) / 1000.0
+    except ValueError:
+        return None
+    if remaining <= DELAY_TIME:
+        latency = time.time() - start_time
+        logger.error(f"Service: {SERVICE_NAME}, Endpoint: {endpoint}, Status: Deadline Exceeded (budget {remaining:.3f}s, delay {DELAY_TIME}s), Latency: {latency:.4f}s")
+        return jsonify({"error": "deadline exceeded before reservation"}), 504
+    return None
+
+#reserve an order's items in the ledger; orders without items (e.g. {"order": "test"})
+#have nothing to reserve and always succeed
+#orders with items need an orderId: the ledger deduplicates on it, which is what makes a retried
+#or hedged /reserve safe, so a request without one is rejected rather than given a fresh ID.
+#malformed items (no sku, a negative or non-integer qty) are rejected with 400 as well
+#returns (status, body) so /reserve and /reserve/batch share the same rules
+def reserve_stock(reserve_data):
+    items = reserve_data.get("items") if isinstance(reserve_data, dict) else None
+    if not items:
+        return 200, {"POST /reserve": "success"}
+    order_id = reserve_data.get("orderId") or reserve_data.get("order_id")
+    if not order_id:
+        return 400, {"error": "orderId is required to reserve items"}
+    try:
+        result = ledger.reserve(order_id, items)
+    except (TypeError, ValueError) as e:
+        #a malformed item is the caller's fault: a 500 would be retried and trip the order service's breaker
+        return 400, {"error": f"invalid items: {e}", "orderId": order_id}
+    if not result.ok:
+        return 409, {"error": "insufficient stock", "orderId": order_id, "shortages": result.shortages}
+    return 200, {"POST /reserve": "success", "orderId": order_id, "reserved": result.items,
+                 "duplicate": result.duplicate}
+
 #POST /reserve from order
 @app.route('/reserve', methods=['POST'])
 def process_reserve():
     start_time = time.time()
 
+    expired = check_deadline("/reserve", start_time)
+    if expired is not None:
+        return expired
+
     logger.info(f"Simulating delay for {DELAY_TIME} seconds")
     time.sleep(DELAY_TIME)
 
@@ -70,13 +123,21 @@ def process_reserve():
             logger.error(f"Service: {SERVICE_NAME}, Endpoint: /reserve, Status: Injected Failure, Latency: {latency:.4f}s")
             return jsonify({"error": "inventory failure injected"}), 500
 
+        status, post_reserve_data = reserve_stock(reserve_data)
+
         # Calculate latency
         latency = time.time() - start_time
 
+        if status == 400:
+            logger.error(f"Service: {SERVICE_NAME}, Endpoint: /reserve, Status: Bad Request ({post_reserve_data['error']}), Latency: {latency:.4f}s")
+            return jsonify(post_reserve_data), status
+        if status != 200:
+            logger.error(f"Service: {SERVICE_NAME}, Endpoint: /reserve, Status: Insufficient Stock {post_reserve_data['shortages']}, Latency: {latency:.4f}s")
+            return jsonify(post_reserve_data), status
+
         # Log service name, endpoint, status, and latency
         logger.info(f"Service: {SERVICE_NAME}, Endpoint: /reserve, Status: Success, Latency: {latency:.4f}s")
 
-        post_reserve_data = {"POST /reserve": "success"}
         return jsonify(post_reserve_data), 200
 
     except Exception as e:
@@ -84,6 +145,68 @@ def process_reserve():
         logger.error(f"Service: {SERVICE_NAME}, Endpoint: /reserve, Status: Error, Latency: {latency:.4f}s")
         return jsonify({"error": str(e)}), 500
 
+#POST /reserve/batch from order; one delay, one parse and one log line for N orders
+@app.route('/reserve/batch', methods=['POST'])
+def process_reserve_batch():
+    start_time = time.time()
+
+    expired = check_deadline("/reserve/batch", start_time)
+    if expired is not None:
+        return expired
+
+    time.sleep(DELAY_TIME)
+
+    try:
+        batch_data = request.get_json()
+        orders = batch_data.get("orders") if isinstance(batch_data, dict) else batch_data
+        if not isinstance(orders, list):
+            return jsonify({"error": "expected a list of orders"}), 400
+
+        results = []
+        failed = 0
+        for index, reserve_data in enumerate(orders):
+            # Inject failure per order if fail rate is set
+            if FAIL_RATE > 0 and random.random() < FAIL_RATE:
+                failed += 1
+                results.append({"index": index, "status": 500, "error": "inventory failure injected"})
+            else:
+                #one bad order gets its own error result; it must not fail the rest of the batch
+                try:
+                    status, body = reserve_stock(reserve_data)
+                except (TypeError, ValueError) as e:
+                    status, body = 400, {"error": f"invalid order: {e}"}
+                except Exception as e:
+                    logger.error(f"Service: {SERVICE_NAME}, Endpoint: /reserve/batch, Order index: {index}, Error: {e}")
+                    status, body = 500, {"error": str(e)}
+                if status != 200:
+                    failed += 1
+                results.append({"index": index, "status": status, **body})
+
+        latency = time.time() - start_time
+        logger.info(f"Service: {SERVICE_NAME}, Endpoint: /reserve/batch, Status: Success ({len(orders) - failed}/{len(orders)} reserved), Latency: {latency:.4f}s")
+        return jsonify({"results": results}), 200
+
+    except Exception as e:
+        latency = time.time() - start_time
+        logger.error(f"Service: {SERVICE_NAME}, Endpoint: /reserve/batch, Status: Error, Latency: {latency:.4f}s")
+        return jsonify({"error": str(e)}), 500
+
+#POST /release from order; returns an order's reserved units to stock
+@app.route('/release', methods=['POST'])
+def process_release():
+    release_data = request.get_json(silent=True) or {}
+    order_id = release_data.get("orderId") or release_data.get("order_id")
+    if not order_id:
+        return jsonify({"error": "orderId is required"}), 400
+    released = ledger.release(order_id)
+    logger.info(f"Service: {SERVICE_NAME}, Endpoint: /release, Order: {order_id}, Released: {released}")
+    return jsonify({"orderId": order_id, "released": released}), 200 if released else 404
+
+#current stock levels per SKU
+@app.route("/stock", methods=["GET"])
+def stock():
+    return jsonify(ledger.snapshot()), 200
+
 if __name__ == '__main__':
     #set up delay for testing
     parser = argparse.ArgumentParser(description='Test network delay for synchronous systems (minimum = 0, maximum = 30, default = 0)')
@@ -100,6 +223,9 @@ if __name__ == '__main__':
     DELAY_TIME = args.delay_time#changing default delay time to input value
     logger.info(f"Delay time has been set to {DELAY_TIME} seconds")
     
+    #HTTP/1.1 so the order service can keep its pooled connections alive
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
+
     # Log when the server starts
     logger.info(f"Service: {SERVICE_NAME}, Endpoint: {HOST}:{PORT}, Status: Starting, Latency: N/A")
     app.run(host=HOST, port=PORT)
@@ -4,6 +4,7 @@
 import logging
 import time
 from flask import Flask, request, jsonify
+from werkzeug.serving import WSGIRequestHandler
 import requests
 
 app = Flask(__name__)
@@ -49,6 +50,9 @@ def process_notification():
         return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
+    #HTTP/1.1 so the order service can keep its pooled connections alive
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
+
     # Log when the server starts
     logger.info(f"Service: {SERVICE_NAME}, Endpoint: {HOST}:{PORT}, Status: Starting, Latency: N/A")
     app.run(host=HOST, port=PORT)
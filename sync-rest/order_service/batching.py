@@ -0,0 +1,138 @@
+#micro-batching coalescer for inventory reservations
+#concurrent /order requests that arrive within a few milliseconds of each other
+#are sent to inventory as one POST /reserve/batch call
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+INVENTORY_BATCH_WINDOW_MS = float(os.getenv("INVENTORY_BATCH_WINDOW_MS", "0"))#0 = batching off
+INVENTORY_BATCH_MAX_SIZE = int(os.getenv("INVENTORY_BATCH_MAX_SIZE", "64"))
+
+
+class BatchItemError(Exception):
+    """Raised by BatchItemResponse.raise_for_status for a failed item."""
+
+
+class BatchItemResponse:
+    """One order's result out of a batch response.
+
+    Mimics the parts of a requests/httpx response the order service uses, so
+    batched and unbatched reservations go through the same code path.
+    """
+
+    def __init__(self, result: dict):
+        self._result = result
+        self.status_code = int(result.get("status", 500))
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def is_success(self) -> bool:
+        return 200 <= self.status_code < 300
+
+    def json(self) -> dict:
+        return self._result
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise BatchItemError(f"{self.status_code} Error: {self._result.get('error', 'batch item failed')}")
+
+
+class MicroBatcher:
+    """Collect submitted items for up to `window_ms` and flush them together.
+
+    flush_fn(items) is called on the batcher's own thread and must return one
+    result per item, in order. If it raises, every item in the batch fails
+    with that exception. Items whose future was cancelled before the flush
+    are left out. The thread is started by the first submit(), so creating
+    a batcher (e.g. at import time) has no side effects.
+    """
+
+    def __init__(self, flush_fn, window_ms: float = INVENTORY_BATCH_WINDOW_MS,
+                 max_batch: int = INVENTORY_BATCH_MAX_SIZE, name: str = "batcher"):
+        self.flush_fn = flush_fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max(max_batch, 1)
+        self._queue: queue.Queue = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.flush_errors = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._start_lock = threading.Lock()
+
+    def submit(self, item) -> Future:
+        if not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread.ident is None:
+                    self._thread.start()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        flush_at = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = flush_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # a caller that gave up (e.g. its deadline passed) may have cancelled its future;
+            # drop it here so nothing is sent for it and its future is never touched again
+            batch = [(item, future) for item, future in self._collect() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._flush(batch)
+            except Exception as e:
+                # the thread must outlive any one batch, or every later submit() would hang
+                self.flush_errors += 1
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _flush(self, batch):
+        items = [item for item, _ in batch]
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        try:
+            results = self.flush_fn(items)
+        except Exception as e:
+            self.flush_errors += 1
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        if len(results) != len(batch):
+            self.flush_errors += 1
+            error = RuntimeError(f"batch of {len(batch)} returned {len(results)} results")
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "flush_errors": self.flush_errors,
+            "queued": self._queue.qsize(),
+        }
@@ -0,0 +1,207 @@
+#shared pooled HTTP client for the order service
+#keeps connections to downstream services alive between orders instead of
+#opening a fresh TCP connection for every requests.post call
+
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  #only needed for the async order service mode
+    httpx = None
+
+DEFAULT_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+DEFAULT_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "1.0"))
+DEFAULT_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "5.0"))
+
+
+def parse_pool_sizes(raw: str) -> dict:
+    """Parse "host:port=size,host:port=size" into {"host:port": size}."""
+    sizes = {}
+    for entry in raw.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, _, size = entry.partition("=")
+        sizes[host.strip()] = int(size)
+    return sizes
+
+
+class PooledClient:
+    """Keep-alive HTTP client with one connection pool per downstream host.
+
+    Every thread gets its own requests.Session (sessions are not thread safe),
+    but all sessions share the same HTTPAdapter objects, so the underlying
+    urllib3 connection pools are shared across the Flask worker threads.
+    """
+
+    def __init__(self, pool_sizes: dict | None = None,
+                 default_pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.default_pool_maxsize = default_pool_maxsize
+        self.pool_sizes = dict(pool_sizes or {})
+        self._adapters = {}
+        self._adapters_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _adapter_for(self, url: str):
+        parts = urlsplit(url)
+        prefix = f"{parts.scheme}://{parts.netloc}/"
+        adapter = self._adapters.get(prefix)
+        if adapter is None:
+            with self._adapters_lock:
+                adapter = self._adapters.get(prefix)
+                if adapter is None:
+                    size = self.pool_sizes.get(parts.netloc, self.default_pool_maxsize)
+                    #retries are handled by the caller, never silently by urllib3
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size,
+                                          max_retries=0, pool_block=False)
+                    self._adapters[prefix] = adapter
+        return prefix, adapter
+
+    def _session_for(self, url: str) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        prefix, adapter = self._adapter_for(url)
+        if session.adapters.get(prefix) is not adapter:
+            session.mount(prefix, adapter)
+        return session
+
+    def timeout(self, connect: float | None = None, read: float | None = None):
+        return (self.connect_timeout if connect is None else connect,
+                self.read_timeout if read is None else read)
+
+    def request(self, method: str, url: str, connect_timeout: float | None = None,
+                read_timeout: float | None = None, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout(connect_timeout, read_timeout))
+        return self._session_for(url).request(method, url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def stats(self) -> dict:
+        """Per-host pool counters.
+
+        A request served on an already-open connection counts as a pool hit,
+        one that had to open a new TCP connection counts as a miss.
+        """
+        hosts = {}
+        with self._adapters_lock:
+            adapters = list(self._adapters.items())
+        for prefix, adapter in adapters:
+            requests_sent = 0
+            connections_opened = 0
+            idle = 0
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is None:
+                    continue
+                requests_sent += pool.num_requests
+                connections_opened += pool.num_connections
+                idle += pool.pool.qsize() if pool.pool is not None else 0
+            netloc = urlsplit(prefix).netloc
+            hosts[netloc] = {
+                "pool_maxsize": self.pool_sizes.get(netloc, self.default_pool_maxsize),
+                "requests": requests_sent,
+                "pool_hits": max(requests_sent - connections_opened, 0),
+                "pool_misses": connections_opened,
+                "connection_reuse_ratio": round(
+                    (requests_sent - connections_opened) / requests_sent, 4
+                ) if requests_sent else 0.0,
+                "idle_connections": idle,
+            }
+        return hosts
+
+
+class AsyncPooledClient:
+    """Keep-alive async HTTP client used by the ASGI order service mode.
+
+    Reports the same per-host counters as PooledClient. New TCP connections
+    are detected through the httpcore trace extension.
+    """
+
+    def __init__(self, pool_sizes: dict | None = None,
+                 default_pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT):
+        if httpx is None:
+            raise RuntimeError("httpx is required for the async order service mode")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.default_pool_maxsize = default_pool_maxsize
+        self.pool_sizes = dict(pool_sizes or {})
+        self._clients = {}
+        self._counters = {}
+
+    def _client_for(self, netloc: str):
+        client = self._clients.get(netloc)
+        if client is None:
+            size = self.pool_sizes.get(netloc, self.default_pool_maxsize)
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=size, max_keepalive_connections=size),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            )
+            self._clients[netloc] = client
+            self._counters[netloc] = {"requests": 0, "connections_opened": 0}
+        return client
+
+    async def request(self, method: str, url: str, connect_timeout: float | None = None,
+                      read_timeout: float | None = None, **kwargs):
+        netloc = urlsplit(url).netloc
+        client = self._client_for(netloc)
+        counters = self._counters[netloc]
+
+        async def trace(event_name, info):
+            if event_name.endswith("connect_tcp.complete"):
+                counters["connections_opened"] += 1
+
+        if connect_timeout is not None or read_timeout is not None:
+            kwargs.setdefault("timeout", httpx.Timeout(
+                self.read_timeout if read_timeout is None else read_timeout,
+                connect=self.connect_timeout if connect_timeout is None else connect_timeout,
+            ))
+        counters["requests"] += 1
+        return await client.request(method, url, extensions={"trace": trace}, **kwargs)
+
+    async def post(self, url: str, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def get(self, url: str, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    def stats(self) -> dict:
+        hosts = {}
+        for netloc, counters in self._counters.items():
+            requests_sent = counters["requests"]
+            opened = counters["connections_opened"]
+            hosts[netloc] = {
+                "pool_maxsize": self.pool_sizes.get(netloc, self.default_pool_maxsize),
+                "requests": requests_sent,
+                "pool_hits": max(requests_sent - opened, 0),
+                "pool_misses": opened,
+                "connection_reuse_ratio": round(
+                    (requests_sent - opened) / requests_sent, 4
+                ) if requests_sent else 0.0,
+            }
+        return hosts
+
+
+#shared client used by every order request
+client = PooledClient(pool_sizes=parse_pool_sizes(os.getenv("HTTP_POOL_SIZES", "")))
@@ -2,15 +2,21 @@
 #initial generation by gemini 3
 
 import logging
+import os
 import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from flask import Flask, request, jsonify
-import requests
+from http_client import client
+from resilience import downstreams, Deadline, CircuitOpenError, BulkheadFullError, DeadlineExceededError, DEADLINE_HEADER
+from batching import MicroBatcher, BatchItemResponse, INVENTORY_BATCH_WINDOW_MS
 
 app = Flask(__name__)
 
 SERVICE_NAME = "OrderService"
 HOST = "localhost"
 PORT = 8080
+#"sync" runs the Flask app below, "async" runs the ASGI app in order_async.py
+ORDER_SERVICE_MODE = os.getenv("ORDER_SERVICE_MODE", "sync")
 logger = logging.getLogger(__name__)
 logging.basicConfig(
     level=logging.INFO,
@@ -19,6 +25,7 @@ logging.basicConfig(
 
 #setting up POST targets with inventory and notification services
 INVENTORY_URL = "http://localhost:8081/reserve"
+INVENTORY_BATCH_URL = "http://localhost:8081/reserve/batch"
 NOTIFICATION_URL = "http://localhost:8082/send"
 HEADERS = {"Content-Type": "application/json"}
 
@@ -29,10 +36,66 @@ def health():
     status = "ok"
     return jsonify({"status": status}), 200
 
+#connection pool counters and circuit breaker state for the downstream services
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    body = {
+        "http_pools": client.stats(),
+        "downstreams": {name: guard.stats() for name, guard in downstreams.items()},
+    }
+    if inventory_batcher is not None:
+        body["inventory_batching"] = inventory_batcher.stats()
+    return jsonify(body), 200
+
+#send coalesced reservations as one POST /reserve/batch; items are (order_data, deadline)
+#pairs and the batch stays useful for as long as its longest remaining budget
+def flush_inventory_batch(items):
+    budget = max(max(deadline.remaining() for _, deadline in items), 0.001)
+    headers = {**HEADERS, DEADLINE_HEADER: str(int(budget * 1000))}
+    response = client.post(INVENTORY_BATCH_URL, json={"orders": [order_data for order_data, _ in items]},
+                           headers=headers,
+                           connect_timeout=min(client.connect_timeout, budget),
+                           read_timeout=min(client.read_timeout, budget))
+    response.raise_for_status()
+    logger.info(f"Sent batch of {len(items)} orders to InventoryService")
+    return [BatchItemResponse(result) for result in response.json()["results"]]
+
+#shared coalescer for concurrent orders; None when INVENTORY_BATCH_WINDOW_MS is 0
+inventory_batcher = (MicroBatcher(flush_inventory_batch, name="inventory-batcher")
+                     if INVENTORY_BATCH_WINDOW_MS > 0 else None)
+
+#a reservation may only be sent twice (retried or hedged) when it carries an orderId,
+#which the inventory ledger deduplicates on
+def is_idempotent(name, order_data):
+    if name != "inventory":
+        return True
+    return isinstance(order_data, dict) and bool(order_data.get("orderId") or order_data.get("order_id"))
+
+#POST to a downstream through its circuit breaker and bulkhead, with retries
+#under the order's deadline; inventory calls are also hedged
+def call_downstream(name, url, order_data, deadline):
+    idempotent = is_idempotent(name, order_data)
+    if name == "inventory" and inventory_batcher is not None:
+        #batched items are retried individually but not hedged
+        def send_batched(deadline):
+            try:
+                return inventory_batcher.submit((order_data, deadline)).result(timeout=deadline.remaining())
+            except FutureTimeoutError:
+                raise DeadlineExceededError("deadline exceeded waiting for inventory batch")
+        return downstreams[name].call(send_batched, deadline, hedge=False, retry=idempotent)
+
+    def send(deadline):
+        remaining = max(deadline.remaining(), 0.001)
+        return client.post(url, json=order_data, headers={**HEADERS, **deadline.header()},
+                           connect_timeout=min(client.connect_timeout, remaining),
+                           read_timeout=min(client.read_timeout, remaining))
+    return downstreams[name].call(send, deadline, hedge=(name == "inventory" and idempotent), retry=idempotent)
+
 #when receiving POST /order
 @app.route('/order', methods=['POST'])
 def process_order():
     start_time = time.time()#start latency
+    deadline = Deadline()#end-to-end budget shared by every downstream call of this order
     
     try:
         # Receive the JSON message
@@ -41,11 +104,11 @@ def process_order():
         logger.info(f"Sending {order_data} to InventoryService")
         
         #send order data to inventory; may be affected by inventory latency or availability
-        responseInventory = requests.post(INVENTORY_URL, json=order_data, headers=HEADERS, timeout=5)
+        responseInventory = call_downstream("inventory", INVENTORY_URL, order_data, deadline)
         if (responseInventory.ok == True):#if inventory call is successful
             logger.info(f"Successfully sent {order_data} to InventoryService")
             logger.info(f"Sending {order_data} to NotificationService")
-            responseNotification = requests.post(NOTIFICATION_URL, json = order_data, headers = HEADERS, timeout=5)#send to notification
+            responseNotification = call_downstream("notification", NOTIFICATION_URL, order_data, deadline)#send to notification
             if (responseNotification.ok == True):
                 logger.info(f"Notification successfully sent")
             else:
@@ -63,6 +126,18 @@ def process_order():
         
         post_order_data = {"POST /order": "success"}
         return jsonify(post_order_data), 200
+
+    except (CircuitOpenError, BulkheadFullError) as e:#downstream is known to be unhealthy, fail fast
+        latency = time.time() - start_time
+        logger.error(f"Service: {SERVICE_NAME}, Endpoint: /order, Status: Rejected, Latency: {latency:.6f}s")
+        logger.error(f"error: {e}")
+        return jsonify({"error": str(e)}), 503
+
+    except DeadlineExceededError as e:#order ran out of time budget
+        latency = time.time() - start_time
+        logger.error(f"Service: {SERVICE_NAME}, Endpoint: /order, Status: Deadline Exceeded, Latency: {latency:.4f}s")
+        logger.error(f"error: {e}")
+        return jsonify({"error": str(e)}), 504
         
     except Exception as e:#exception if inventory or notification services are unavailable
         latency = time.time() - start_time
@@ -73,4 +148,14 @@ def process_order():
 if __name__ == '__main__':
     # Log when the server starts
     logger.info(f"Service: {SERVICE_NAME}, Endpoint: {HOST}:{PORT}, Status: Starting, Latency: N/A")
-    app.run(host=HOST, port=PORT)
+    if ORDER_SERVICE_MODE == "async":
+        import sys
+        import uvicorn
+        #order_async imports its shared pieces from "order"; point that name at this already-running
+        #module so they are not created a second time, and hand uvicorn the app object instead of an
+        #import string it would load again
+        sys.modules.setdefault("order", sys.modules[__name__])
+        import order_async
+        uvicorn.run(order_async.app, host=HOST, port=PORT)
+    else:
+        app.run(host=HOST, port=PORT)
@@ -0,0 +1,196 @@
+#async (ASGI) mode of the order service
+#awaits the downstream calls instead of holding a worker thread for the whole
+#inventory + notification latency; start with ORDER_SERVICE_MODE=async
+
+import asyncio
+import os
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from http_client import AsyncPooledClient, parse_pool_sizes
+from resilience import downstreams, Deadline, CircuitOpenError, BulkheadFullError, DeadlineExceededError
+from order import SERVICE_NAME, INVENTORY_URL, NOTIFICATION_URL, HEADERS, logger, inventory_batcher, is_idempotent
+
+#"inline" waits for the notification before answering /order,
+#"background" answers after the inventory hop and notifies from a bounded queue
+NOTIFY_MODE = os.getenv("NOTIFY_MODE", "inline")
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "4"))
+
+app = FastAPI()
+
+
+class NotificationQueue:
+    """Bounded fire-and-forget queue for notification calls.
+
+    When the queue is full the caller sends the notification inline instead,
+    so a burst slows /order down rather than silently dropping notifications.
+    """
+
+    def __init__(self, client: AsyncPooledClient, maxsize: int, workers: int):
+        self.client = client
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.workers = workers
+        self._tasks = []
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.inline_fallbacks = 0
+
+    def start(self):
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self, drain_timeout: float = 5.0):
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Service: {SERVICE_NAME}, dropping {self.queue.qsize()} queued notifications on shutdown")
+        for task in self._tasks:
+            task.cancel()
+
+    def submit(self, order_data) -> bool:
+        try:
+            self.queue.put_nowait(order_data)
+        except asyncio.QueueFull:
+            return False
+        self.enqueued += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            order_data = await self.queue.get()
+            try:
+                await send_notification(self.client, order_data)
+                self.sent += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Service: {SERVICE_NAME}, background notification failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "mode": NOTIFY_MODE,
+            "queue_depth": self.queue.qsize(),
+            "queue_maxsize": self.queue.maxsize,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "inline_fallbacks": self.inline_fallbacks,
+        }
+
+
+async def call_downstream(client: AsyncPooledClient, name: str, url: str, order_data, deadline: Deadline):
+    idempotent = is_idempotent(name, order_data)
+    if name == "inventory" and inventory_batcher is not None:
+        #the coalescer runs on its own thread with the sync pooled client
+        async def send_batched(deadline):
+            future = asyncio.wrap_future(inventory_batcher.submit((order_data, deadline)))
+            try:
+                return await asyncio.wait_for(future, timeout=deadline.remaining())
+            except asyncio.TimeoutError:
+                raise DeadlineExceededError("deadline exceeded waiting for inventory batch")
+        return await downstreams[name].acall(send_batched, deadline, hedge=False, retry=idempotent)
+
+    def send(deadline):
+        remaining = max(deadline.remaining(), 0.001)
+        return client.post(url, json=order_data, headers={**HEADERS, **deadline.header()},
+                           connect_timeout=min(client.connect_timeout, remaining),
+                           read_timeout=min(client.read_timeout, remaining))
+    return await downstreams[name].acall(send, deadline, hedge=(name == "inventory" and idempotent),
+                                         retry=idempotent)
+
+
+async def send_notification(client: AsyncPooledClient, order_data, deadline: Deadline | None = None):
+    #background notifications are not bound by the order's deadline, they get a fresh budget
+    deadline = deadline or Deadline()
+    response = await call_downstream(client, "notification", NOTIFICATION_URL, order_data, deadline)
+    if response.is_success:
+        logger.info(f"Notification successfully sent")
+    else:
+        logger.info(f"Error on sending notification")
+        response.raise_for_status()
+
+
+@app.on_event("startup")
+async def startup():
+    app.state.client = AsyncPooledClient(pool_sizes=parse_pool_sizes(os.getenv("HTTP_POOL_SIZES", "")))
+    app.state.notifier = None
+    if NOTIFY_MODE == "background":
+        app.state.notifier = NotificationQueue(app.state.client, NOTIFY_QUEUE_SIZE, NOTIFY_WORKERS)
+        app.state.notifier.start()
+    logger.info(f"Service: {SERVICE_NAME}, Mode: async, Notify: {NOTIFY_MODE}")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if app.state.notifier is not None:
+        await app.state.notifier.stop()
+    await app.state.client.aclose()
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/metrics")
+async def metrics():
+    body = {
+        "http_pools": app.state.client.stats(),
+        "downstreams": {name: guard.stats() for name, guard in downstreams.items()},
+    }
+    if inventory_batcher is not None:
+        body["inventory_batching"] = inventory_batcher.stats()
+    if app.state.notifier is not None:
+        body["notifications"] = app.state.notifier.stats()
+    return body
+
+
+@app.post("/order")
+async def process_order(request: Request):
+    start_time = time.time()#start latency
+    deadline = Deadline()
+
+    try:
+        order_data = await request.json()
+        logger.info(f"Received order {order_data}")
+        logger.info(f"Sending {order_data} to InventoryService")
+
+        responseInventory = await call_downstream(app.state.client, "inventory", INVENTORY_URL, order_data, deadline)
+        if not responseInventory.is_success:
+            logger.info(f"Error on sending inventory")
+            responseInventory.raise_for_status()
+        logger.info(f"Successfully sent {order_data} to InventoryService")
+
+        notifier = app.state.notifier
+        if notifier is None:
+            await send_notification(app.state.client, order_data, deadline)
+        elif not notifier.submit(order_data):
+            notifier.inline_fallbacks += 1
+            await send_notification(app.state.client, order_data, deadline)
+
+        latency = time.time() - start_time
+        logger.info(f"Service: {SERVICE_NAME}, Endpoint: /order, Status: Success, Latency: {latency:.4f}s")
+        return JSONResponse({"POST /order": "success"}, status_code=200)
+
+    except (CircuitOpenError, BulkheadFullError) as e:
+        latency = time.time() - start_time
+        logger.error(f"Service: {SERVICE_NAME}, Endpoint: /order, Status: Rejected, Latency: {latency:.6f}s")
+        logger.error(f"error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=503)
+
+    except DeadlineExceededError as e:
+        latency = time.time() - start_time
+        logger.error(f"Service: {SERVICE_NAME}, Endpoint: /order, Status: Deadline Exceeded, Latency: {latency:.4f}s")
+        logger.error(f"error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=504)
+
+    except Exception as e:
+        latency = time.time() - start_time
+        logger.error(f"Service: {SERVICE_NAME}, Endpoint: /order, Status: Error, Latency: {latency:.4f}s")
+        logger.error(f"error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
@@ -0,0 +1,562 @@
+#circuit breaker, bulkhead, retry, hedging and deadlines for the order
+#service's downstream calls
+#used by both the Flask (sync) and the ASGI (async) order service modes
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "10.0"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+BULKHEAD_MAX_CONCURRENT = int(os.getenv("BULKHEAD_MAX_CONCURRENT", "32"))
+
+ORDER_DEADLINE_SECONDS = float(os.getenv("ORDER_DEADLINE_SECONDS", "5.0"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_BACKOFF = float(os.getenv("RETRY_BASE_BACKOFF", "0.05"))
+RETRY_MAX_BACKOFF = float(os.getenv("RETRY_MAX_BACKOFF", "1.0"))
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.01"))
+
+#remaining time budget in milliseconds, sent on every downstream request
+DEADLINE_HEADER = "X-Deadline-Ms"
+#statuses worth another attempt; 504 means the downstream already gave up on our deadline
+RETRYABLE_STATUSES = {429, 500, 502, 503}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a downstream whose circuit is open."""
+
+
+class BulkheadFullError(Exception):
+    """Raised when a downstream already has its maximum number of calls in flight."""
+
+
+class DeadlineExceededError(Exception):
+    """Raised when the per-order time budget runs out before a downstream answered."""
+
+
+class CircuitBreaker:
+    """Per-downstream circuit breaker with half-open probing.
+
+    closed    -> calls go through; `failure_threshold` consecutive failures open it
+    open      -> calls fail immediately until `reset_timeout` seconds have passed
+    half_open -> up to `half_open_probes` calls are let through; one success
+                 closes the circuit, one failure opens it again
+
+    before_call() returns the admission (the state and the state's
+    generation the call was let through under), which is passed back to
+    record_success/record_failure, or to release() when the call was
+    cancelled before it had an outcome. Only probes admitted in the current
+    half-open period settle it; a slow call admitted while the circuit was
+    still closed cannot close a half-open circuit, re-open it, or count
+    towards a later closed period's failure threshold.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT,
+                 half_open_probes: int = BREAKER_HALF_OPEN_PROBES):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.generation = 0     # bumped on every transition
+        self.probes_in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.transitions = deque(maxlen=50)
+        self.transition_counts = {}
+        self._lock = threading.Lock()
+
+    def _transition(self, new_state: str, reason: str):
+        key = f"{self.state}->{new_state}"
+        self.transition_counts[key] = self.transition_counts.get(key, 0) + 1
+        self.transitions.append({"from": self.state, "to": new_state,
+                                 "reason": reason, "at": time.time()})
+        self.state = new_state
+        self.generation += 1
+
+    def _current(self, admission) -> bool:
+        return admission == (self.state, self.generation)
+
+    def before_call(self) -> tuple:
+        """Reserve permission to call the downstream or raise CircuitOpenError; returns the admission."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"circuit for {self.name} is open")
+                self._transition(HALF_OPEN, "reset timeout elapsed")
+                self.probes_in_flight = 0
+            if self.state == HALF_OPEN:
+                if self.probes_in_flight >= self.half_open_probes:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"circuit for {self.name} is half-open, probe in flight")
+                self.probes_in_flight += 1
+            return self.state, self.generation
+
+    def record_success(self, admission: tuple):
+        with self._lock:
+            self.successes += 1
+            if not self._current(admission):
+                return
+            self.consecutive_failures = 0
+            if self.state == HALF_OPEN:
+                self.probes_in_flight -= 1
+                self._transition(CLOSED, "probe succeeded")
+
+    def release(self, admission: tuple):
+        """Settle a call that ended without an outcome (e.g. a cancelled hedge or a client
+        disconnect): a probe gives its slot back so another probe can be let through."""
+        with self._lock:
+            if self._current(admission) and self.state == HALF_OPEN:
+                self.probes_in_flight -= 1
+
+    def record_failure(self, admission: tuple):
+        with self._lock:
+            self.failures += 1
+            if not self._current(admission):
+                return
+            if self.state == HALF_OPEN:
+                self.probes_in_flight -= 1
+                self.opened_at = time.monotonic()
+                self._transition(OPEN, "probe failed")
+                return
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._transition(OPEN, f"{self.consecutive_failures} consecutive failures")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "successes": self.successes,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "transition_counts": dict(self.transition_counts),
+                "recent_transitions": list(self.transitions),
+            }
+
+
+class Bulkhead:
+    """Non-blocking concurrency limit for one downstream.
+
+    Callers never wait for a slot: when `max_concurrent` calls are already in
+    flight the call is rejected, so a slow downstream cannot absorb every
+    worker thread (or every pending coroutine) of the order service.
+    """
+
+    def __init__(self, name: str, max_concurrent: int = BULKHEAD_MAX_CONCURRENT):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.in_flight >= self.max_concurrent:
+                self.rejected += 1
+                raise BulkheadFullError(f"bulkhead for {self.name} is full ({self.max_concurrent} in flight)")
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def stats(self) -> dict:
+        return {"max_concurrent": self.max_concurrent, "in_flight": self.in_flight,
+                "rejected": self.rejected}
+
+
+class _AttemptSlot:
+    """Bulkhead slot of one hedged attempt, taken before the attempt is submitted.
+
+    It is released exactly once: when the attempt finishes, or as soon as the
+    call has its answer and abandons the attempt. A worker thread cannot be
+    interrupted, so an abandoned attempt may still be waiting for its
+    response; it no longer counts against the bulkhead, and its response is
+    closed when it arrives (see Downstream._abandon).
+    """
+
+    def __init__(self, bulkhead: Bulkhead):
+        bulkhead.acquire()
+        self.bulkhead = bulkhead
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.bulkhead.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class Deadline:
+    """End-to-end time budget for one order."""
+
+    def __init__(self, seconds: float = ORDER_DEADLINE_SECONDS):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def header(self) -> dict:
+        return {DEADLINE_HEADER: str(int(self.remaining() * 1000))}
+
+
+class RetryPolicy:
+    """Retry with capped exponential backoff and full jitter."""
+
+    def __init__(self, max_attempts: int = RETRY_MAX_ATTEMPTS,
+                 base_backoff: float = RETRY_BASE_BACKOFF,
+                 max_backoff: float = RETRY_MAX_BACKOFF):
+        self.max_attempts = max(max_attempts, 1)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+
+
+class LatencyTracker:
+    """Rolling window of downstream latencies used to derive the hedge delay."""
+
+    def __init__(self, window: int = 500):
+        self.samples = deque(maxlen=window)
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.retries = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> float | None:
+        samples = sorted(self.samples)
+        if not samples:
+            return None
+        index = min(int(len(samples) * pct / 100.0), len(samples) - 1)
+        return samples[index]
+
+    def hedge_delay(self) -> float | None:
+        """Seconds to wait before sending a hedge, or None while there is too little data."""
+        if not HEDGE_ENABLED or len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(self.percentile(HEDGE_PERCENTILE), HEDGE_MIN_DELAY)
+
+    def stats(self) -> dict:
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        return {
+            "samples": len(self.samples),
+            "p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+            "hedge_delay_ms": round(self.hedge_delay() * 1000, 2) if self.hedge_delay() is not None else None,
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+            "retries": self.retries,
+        }
+
+
+def is_server_error(response) -> bool:
+    return response.status_code >= 500
+
+
+def guarded_call(breaker: CircuitBreaker, bulkhead: Bulkhead, fn, is_failure=is_server_error):
+    """Run fn() inside the bulkhead and record the outcome on the breaker."""
+    with bulkhead:
+        admission = breaker.before_call()
+        try:
+            result = fn()
+        except Exception:
+            breaker.record_failure(admission)
+            raise
+        except BaseException:
+            #cancelled (asyncio.CancelledError) or interrupted: no verdict on the downstream
+            breaker.release(admission)
+            raise
+        if is_failure(result):
+            breaker.record_failure(admission)
+        else:
+            breaker.record_success(admission)
+        return result
+
+
+async def async_guarded_call(breaker: CircuitBreaker, bulkhead: Bulkhead, fn, is_failure=is_server_error):
+    """Async variant of guarded_call; fn() must return an awaitable."""
+    with bulkhead:
+        admission = breaker.before_call()
+        try:
+            result = await fn()
+        except Exception:
+            breaker.record_failure(admission)
+            raise
+        except BaseException:
+            #cancelled (asyncio.CancelledError) or interrupted: no verdict on the downstream
+            breaker.release(admission)
+            raise
+        if is_failure(result):
+            breaker.record_failure(admission)
+        else:
+            breaker.record_success(admission)
+        return result
+
+
+def _should_retry(response) -> bool:
+    return response.status_code in RETRYABLE_STATUSES
+
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+#worker threads for hedged attempts in the sync (Flask) mode
+_hedge_executor = ThreadPoolExecutor(max_workers=int(os.getenv("HEDGE_MAX_WORKERS", "64")),
+                                     thread_name_prefix="hedge")
+
+
+class Downstream:
+    """Breaker, bulkhead, retry policy and latency tracker for one downstream service."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(name)
+        self.bulkhead = Bulkhead(name)
+        self.retry = RetryPolicy()
+        self.latency = LatencyTracker()
+
+    def _timed(self, send, deadline: Deadline, slot: _AttemptSlot | None = None):
+        started = time.monotonic()
+        response = guarded_call(self.breaker, slot or self.bulkhead, lambda: send(deadline))
+        if not is_server_error(response):
+            self.latency.record(time.monotonic() - started)
+        return response
+
+    def _hedged(self, send, deadline: Deadline, hedge: bool):
+        delay = self.latency.hedge_delay() if hedge else None
+        if delay is None or delay >= deadline.remaining():
+            return self._timed(send, deadline)
+
+        attempts = {}   # future -> its bulkhead slot
+        chosen = None
+        try:
+            first = self._submit(send, deadline, attempts)
+            done, _ = wait([first], timeout=delay)
+            if done:
+                chosen = first
+                return first.result()
+
+            try:
+                second = self._submit(send, deadline, attempts)
+            except BulkheadFullError:
+                second = None   # no room for a hedge, keep waiting for the first attempt
+            else:
+                self.latency.hedges_sent += 1
+            pending = set(attempts)
+            retryable, error = None, None
+            while pending:
+                done, pending = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    try:
+                        response = future.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    if not _should_retry(response):
+                        chosen = future
+                        if future is second:
+                            self.latency.hedges_won += 1
+                        return response
+                    retryable = future
+            if retryable is not None:
+                chosen = retryable
+                return retryable.result()
+            if error is not None:
+                raise error
+            raise DeadlineExceededError(f"deadline exceeded waiting for {self.name}")
+        finally:
+            for future, slot in attempts.items():
+                if future is not chosen:
+                    self._abandon(future, slot)
+
+    def _submit(self, send, deadline: Deadline, attempts: dict):
+        slot = _AttemptSlot(self.bulkhead)
+        try:
+            future = _hedge_executor.submit(self._timed, send, deadline, slot)
+        except BaseException:
+            slot.release()
+            raise
+        attempts[future] = slot
+        return future
+
+    @staticmethod
+    def _abandon(future, slot: _AttemptSlot):
+        """Free an attempt whose answer is not needed: its bulkhead slot now, its connection once it answers."""
+        slot.release()
+        future.add_done_callback(_close_response)
+
+    def call(self, send, deadline: Deadline, hedge: bool = True, retry: bool = True):
+        """Call send(deadline) with retries and optional hedging under the deadline.
+
+        send must make one HTTP attempt that gives up once the deadline passes
+        and return the response. Only pass hedge/retry for requests the
+        downstream deduplicates, since both can deliver the request twice.
+        Running out of budget between attempts raises DeadlineExceededError
+        (chained to the last attempt's error).
+        """
+        last_error = None
+        last_response = None
+        attempts = self.retry.max_attempts if retry else 1
+        for attempt in range(attempts):
+            if deadline.expired():
+                break
+            try:
+                response = self._hedged(send, deadline, hedge)
+                if not _should_retry(response) or attempt == attempts - 1:
+                    return response
+                last_error = None
+                last_response = response
+            except (CircuitOpenError, BulkheadFullError, DeadlineExceededError):
+                raise
+            except Exception as e:
+                if attempt == attempts - 1:
+                    raise
+                last_error = e
+                last_response = None
+            backoff = self.retry.backoff(attempt)
+            if backoff >= deadline.remaining():
+                break
+            self.latency.retries += 1
+            time.sleep(backoff)
+        #the budget ran out before another attempt could be made
+        if last_response is not None and not deadline.expired():
+            return last_response
+        raise DeadlineExceededError(f"deadline exceeded calling {self.name}") from last_error
+
+    async def _atimed(self, send, deadline: Deadline):
+        started = time.monotonic()
+        response = await async_guarded_call(self.breaker, self.bulkhead, lambda: send(deadline))
+        if not is_server_error(response):
+            self.latency.record(time.monotonic() - started)
+        return response
+
+    async def _ahedged(self, send, deadline: Deadline, hedge: bool):
+        delay = self.latency.hedge_delay() if hedge else None
+        if delay is None or delay >= deadline.remaining():
+            return await self._atimed(send, deadline)
+
+        first = asyncio.ensure_future(self._atimed(send, deadline))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        self.latency.hedges_sent += 1
+        second = asyncio.ensure_future(self._atimed(send, deadline))
+        pending = {first, second}
+        result, error = None, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=deadline.remaining(),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    result = response
+                    if not _should_retry(response):
+                        if task is second:
+                            self.latency.hedges_won += 1
+                        return response
+        finally:
+            #the losing attempt is no longer needed
+            for task in pending:
+                task.cancel()
+        if result is not None:
+            return result
+        if error is not None:
+            raise error
+        raise DeadlineExceededError(f"deadline exceeded waiting for {self.name}")
+
+    async def acall(self, send, deadline: Deadline, hedge: bool = True, retry: bool = True):
+        """Async variant of call(); send(deadline) must return an awaitable."""
+        last_error = None
+        last_response = None
+        attempts = self.retry.max_attempts if retry else 1
+        for attempt in range(attempts):
+            if deadline.expired():
+                break
+            try:
+                response = await self._ahedged(send, deadline, hedge)
+                if not _should_retry(response) or attempt == attempts - 1:
+                    return response
+                last_error = None
+                last_response = response
+            except (CircuitOpenError, BulkheadFullError, DeadlineExceededError):
+                raise
+            except Exception as e:
+                if attempt == attempts - 1:
+                    raise
+                last_error = e
+                last_response = None
+            backoff = self.retry.backoff(attempt)
+            if backoff >= deadline.remaining():
+                break
+            self.latency.retries += 1
+            await asyncio.sleep(backoff)
+        #the budget ran out before another attempt could be made
+        if last_response is not None and not deadline.expired():
+            return last_response
+        raise DeadlineExceededError(f"deadline exceeded calling {self.name}") from last_error
+
+    def stats(self) -> dict:
+        return {"circuit_breaker": self.breaker.stats(), "bulkhead": self.bulkhead.stats(),
+                "latency": self.latency.stats()}
+
+
+#one guard per downstream, shared by every order request
+downstreams = {
+    "inventory": Downstream("inventory"),
+    "notification": Downstream("notification"),
+}
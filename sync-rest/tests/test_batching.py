@@ -0,0 +1,61 @@
+"""
+Unit tests for the order service's inventory micro-batcher (order_service/batching.py).
+
+Usage (from the repository root):
+    python -m pytest sync-rest/tests/test_batching.py
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(REPO_ROOT, "sync-rest", "order_service"))
+
+import pytest  # noqa: E402
+
+from batching import MicroBatcher  # noqa: E402
+
+
+class TestMicroBatcher:
+    def test_items_get_their_own_results(self):
+        batcher = MicroBatcher(lambda items: [item * 2 for item in items], window_ms=5)
+        futures = [batcher.submit(i) for i in range(10)]
+        assert [f.result(timeout=1) for f in futures] == [i * 2 for i in range(10)]
+
+    def test_flush_error_fails_the_batch_only(self):
+        def flush(items):
+            if "bad" in items:
+                raise ConnectionError("inventory down")
+            return items
+
+        batcher = MicroBatcher(flush, window_ms=1)
+        with pytest.raises(ConnectionError):
+            batcher.submit("bad").result(timeout=1)
+        assert batcher.submit("good").result(timeout=1) == "good"
+
+    def test_caller_timing_out_does_not_stop_the_batcher(self):
+        release = threading.Event()
+        flushed = []
+
+        def flush(items):
+            release.wait(1)
+            flushed.extend(items)
+            return items
+
+        batcher = MicroBatcher(flush, window_ms=1)
+
+        async def run():
+            first = asyncio.wrap_future(batcher.submit("first"))       # holds the flush thread
+            await asyncio.sleep(0.02)
+            with pytest.raises(asyncio.TimeoutError):
+                # still queued when it times out, so its future is cancelled
+                await asyncio.wait_for(asyncio.wrap_future(batcher.submit("gave-up")), timeout=0.05)
+            release.set()
+            assert await first == "first"
+            return await asyncio.wait_for(asyncio.wrap_future(batcher.submit("next")), timeout=1)
+
+        assert asyncio.run(run()) == "next"
+        assert "gave-up" not in flushed
+        assert batcher._thread.is_alive()
@@ -0,0 +1,230 @@
+"""
+Unit tests for the order service's resilience layer (order_service/resilience.py).
+
+No services are needed: downstream attempts are plain functions returning
+stand-in responses.
+
+Usage (from the repository root):
+    python -m pytest sync-rest/tests/test_resilience.py
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(REPO_ROOT, "sync-rest", "order_service"))
+
+import pytest  # noqa: E402
+
+import resilience  # noqa: E402
+from resilience import (CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, Deadline,  # noqa: E402
+                        DeadlineExceededError, Downstream)
+
+
+class StandInResponse:
+    def __init__(self, status_code: int = 200):
+        self.status_code = status_code
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def warmed_up(name: str = "inventory", latency: float = 0.01) -> Downstream:
+    """A downstream with enough latency samples to hedge after `latency` seconds."""
+    downstream = Downstream(name)
+    for _ in range(resilience.HEDGE_MIN_SAMPLES):
+        downstream.latency.record(latency)
+    return downstream
+
+
+def tripped(reset_timeout: float = 0.0, probes: int = 1) -> CircuitBreaker:
+    """A breaker that has just opened after `failure_threshold` failures."""
+    breaker = CircuitBreaker("inventory", failure_threshold=2, reset_timeout=reset_timeout,
+                             half_open_probes=probes)
+    for _ in range(2):
+        breaker.record_failure(breaker.before_call())
+    assert breaker.state == OPEN
+    return breaker
+
+
+class TestCircuitBreaker:
+    def test_consecutive_failures_open_the_circuit(self):
+        breaker = CircuitBreaker("inventory", failure_threshold=3)
+        for _ in range(2):
+            breaker.record_failure(breaker.before_call())
+        breaker.record_success(breaker.before_call())
+        for _ in range(2):
+            breaker.record_failure(breaker.before_call())
+        assert breaker.state == CLOSED
+        breaker.record_failure(breaker.before_call())
+        assert breaker.state == OPEN
+
+    def test_open_circuit_rejects_until_the_reset_timeout(self):
+        breaker = tripped(reset_timeout=60)
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        assert breaker.rejected == 1
+
+    def test_probe_success_closes_and_probe_failure_reopens(self):
+        breaker = tripped()
+        probe = breaker.before_call()
+        assert breaker.state == HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()                    # one probe at a time
+        breaker.record_success(probe)
+        assert breaker.state == CLOSED
+
+        breaker = tripped()
+        breaker.record_failure(breaker.before_call())
+        assert breaker.state == OPEN
+        assert breaker.transition_counts == {"closed->open": 1, "open->half_open": 1, "half_open->open": 1}
+
+    def test_call_admitted_while_closed_does_not_settle_a_probe(self):
+        breaker = CircuitBreaker("inventory", failure_threshold=2, reset_timeout=0.0)
+        slow = breaker.before_call()                 # admitted while closed, answers much later
+        for _ in range(2):
+            breaker.record_failure(breaker.before_call())
+        probe = breaker.before_call()
+        assert breaker.state == HALF_OPEN
+
+        breaker.record_success(slow)
+        assert breaker.state == HALF_OPEN
+        breaker.record_failure(slow)
+        assert breaker.state == HALF_OPEN
+        assert breaker.probes_in_flight == 1
+        breaker.record_success(probe)
+        assert breaker.state == CLOSED
+
+    def test_probe_from_an_earlier_half_open_period_is_ignored(self):
+        breaker = tripped(probes=2)
+        first, second = breaker.before_call(), breaker.before_call()
+        breaker.record_failure(first)                # re-opens
+        breaker.before_call()                        # a new half-open period with a new probe
+        breaker.record_success(second)
+        assert breaker.state == HALF_OPEN
+        assert breaker.probes_in_flight == 1
+
+    def test_stale_failures_do_not_count_towards_a_new_closed_period(self):
+        breaker = CircuitBreaker("inventory", failure_threshold=2, reset_timeout=0.0)
+        slow = [breaker.before_call() for _ in range(2)]
+        for _ in range(2):
+            breaker.record_failure(breaker.before_call())
+        breaker.record_success(breaker.before_call())
+        assert breaker.state == CLOSED
+        for admission in slow:
+            breaker.record_failure(admission)
+        assert breaker.state == CLOSED
+        assert breaker.failures == 4
+
+    def test_cancelled_probe_lets_the_next_probe_through(self):
+        breaker = tripped()
+
+        async def run():
+            probe = asyncio.ensure_future(resilience.async_guarded_call(
+                breaker, resilience.Bulkhead("inventory"), lambda: asyncio.sleep(10)))
+            await asyncio.sleep(0.01)
+            assert breaker.probes_in_flight == 1
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+
+        asyncio.run(run())
+        assert breaker.state == HALF_OPEN
+        assert breaker.probes_in_flight == 0
+        breaker.record_success(breaker.before_call())
+        assert breaker.state == CLOSED
+
+
+class TestHedging:
+    def test_losing_attempt_gives_back_its_slot_and_connection(self):
+        downstream = warmed_up()
+        release_slow = threading.Event()
+        slow = StandInResponse()
+        calls = []
+
+        def send(deadline):
+            calls.append(1)
+            if len(calls) == 1:
+                release_slow.wait(2)
+                return slow
+            return StandInResponse()
+
+        response = downstream.call(send, Deadline(2))
+        assert response is not slow
+        assert downstream.latency.hedges_won == 1
+        assert downstream.bulkhead.in_flight == 0      # the first attempt is still running
+        release_slow.set()
+        for _ in range(100):
+            if slow.closed:
+                break
+            time.sleep(0.01)
+        assert slow.closed
+        assert downstream.bulkhead.in_flight == 0
+
+    def test_no_hedge_without_a_free_bulkhead_slot(self):
+        downstream = warmed_up()
+        downstream.bulkhead.max_concurrent = 1
+        response = downstream.call(lambda deadline: time.sleep(0.05) or StandInResponse(), Deadline(2))
+        assert response.status_code == 200
+        assert downstream.latency.hedges_sent == 0
+        assert downstream.bulkhead.in_flight == 0
+
+    def test_hedge_disabled_sends_once(self):
+        downstream = warmed_up()
+        calls = []
+        downstream.call(lambda deadline: calls.append(1) or time.sleep(0.05) or StandInResponse(),
+                        Deadline(2), hedge=False)
+        assert len(calls) == 1
+
+
+class TestRetries:
+    def test_retryable_status_is_retried(self):
+        downstream = Downstream("inventory")
+        statuses = iter([503, 200])
+        response = downstream.call(lambda deadline: StandInResponse(next(statuses)), Deadline(2), hedge=False)
+        assert response.status_code == 200
+        assert downstream.latency.retries == 1
+
+    def test_retry_disabled_returns_the_first_answer(self):
+        downstream = Downstream("inventory")
+        calls = []
+        response = downstream.call(lambda deadline: calls.append(1) or StandInResponse(503), Deadline(2),
+                                   hedge=False, retry=False)
+        assert response.status_code == 503
+        assert len(calls) == 1
+
+    def test_error_on_the_last_attempt_is_raised(self):
+        downstream = Downstream("inventory")
+        downstream.retry = resilience.RetryPolicy(max_attempts=2, base_backoff=0.001)
+
+        def send(deadline):
+            raise ConnectionError("refused")
+
+        with pytest.raises(ConnectionError):
+            downstream.call(send, Deadline(2), hedge=False)
+
+    def test_no_time_to_back_off_is_a_deadline_error(self):
+        downstream = Downstream("inventory")
+        downstream.retry.backoff = lambda attempt: 10.0
+
+        def send(deadline):
+            raise ConnectionError("refused")
+
+        with pytest.raises(DeadlineExceededError) as raised:
+            downstream.call(send, Deadline(1), hedge=False)
+        assert isinstance(raised.value.__cause__, ConnectionError)
+
+    def test_async_no_time_to_back_off_is_a_deadline_error(self):
+        downstream = Downstream("inventory")
+        downstream.retry.backoff = lambda attempt: 10.0
+
+        async def send(deadline):
+            raise ConnectionError("refused")
+
+        with pytest.raises(DeadlineExceededError) as raised:
+            asyncio.run(downstream.acall(send, Deadline(1), hedge=False))
+        assert isinstance(raised.value.__cause__, ConnectionError)
@@ -6,6 +6,7 @@ import logging
 import time
 import requests
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 # Configure logging
 logging.basicConfig(
@@ -18,6 +19,15 @@ ORDER_URL = "http://localhost:8080/order"
 HEADERS = {"Content-Type": "application/json"}
 REQUEST_AMOUNT = 1#default amount of requests to send
 
+def send_order(counter):
+    orderValue = "test #" + str(counter + 1)
+    order = {"order": orderValue}
+    localLatencyStart = time.time()#local latency per request
+    response = requests.post(ORDER_URL, json=order, headers=HEADERS)
+    localLatency = time.time() - localLatencyStart#calculate local latency
+    logger.info(f"Sent request {counter + 1} with status {response.status_code} and latency {localLatency:.4f}s")
+    return response, localLatency
+
 def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Send POST /order request to localhost:8080.')
@@ -26,33 +36,37 @@ def main():
         type=int,
         default="1",
         help='Amount of requests to send (minimum = 0, maximum = 50, default = 1)')
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default="1",
+        help='Amount of requests in flight at once (minimum = 1, maximum = 50, default = 1)')
     args = parser.parse_args()
     if (args.requests < 0):
         parser.error("Amount of requests must be at least 0")
     elif (args.requests > 50):
         parser.error("Amount of requests must be at most 50")
+    if (args.concurrency < 1):
+        parser.error("Concurrency must be at least 1")
+    elif (args.concurrency > 50):
+        parser.error("Concurrency must be at most 50")
     REQUEST_AMOUNT = args.requests
     
     logger.info(f"Sending {REQUEST_AMOUNT} requests to {ORDER_URL}")
     totalLatency = 0
     avgLatency = 0#stats for latency
 
-    counter = 0
     successfulRequests = 0
     errorRequests = 0
-    while (counter < REQUEST_AMOUNT):#repeating requests until specified amount is sent
-        orderValue = "test #" + str(counter + 1)
-        order = {"order": orderValue}
-        localLatencyStart = time.time()#local latency per request
-        response = requests.post(ORDER_URL, json=order, headers=HEADERS)
-        localLatency = time.time() - localLatencyStart#calculate local latency
-        logger.info(f"Sent request {counter + 1} with status {response.status_code} and latency {localLatency:.4f}s")
-        if (response.ok == True):
-            successfulRequests += 1
-        else:
-            errorRequests += 1
-        totalLatency += localLatency#adding to total latency
-        counter += 1
+    wallStart = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:#concurrency 1 sends requests one after another
+        for response, localLatency in pool.map(send_order, range(REQUEST_AMOUNT)):
+            if (response.ok == True):
+                successfulRequests += 1
+            else:
+                errorRequests += 1
+            totalLatency += localLatency#adding to total latency
+    wallTime = time.time() - wallStart
         
     #logging latency stats
     logger.info(f"Total latency after sending {REQUEST_AMOUNT} requests: {totalLatency:.4f}s")
@@ -61,6 +75,8 @@ def main():
     logger.info(f"Average latency after sending {REQUEST_AMOUNT} requests: {avgLatency:.4f}s")
     logger.info(f"Successful requests: {successfulRequests}")
     logger.info(f"Errored requests: {errorRequests}")
+    if (wallTime > 0):
+        logger.info(f"Throughput with concurrency {args.concurrency}: {REQUEST_AMOUNT / wallTime:.2f} requests/s")
 
 
 if __name__ == "__main__":